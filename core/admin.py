@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cliente, Empresa, Servicio, Disponibilidad, Cita    
+from .models import Cliente, Empresa, Servicio, Barbero, Disponibilidad, ExcepcionDisponibilidad, Cita, CitaArchivada, ResumenDiario, Notificacion    
 
 admin.site.register(Cliente)
 admin.site.register(Empresa)
@@ -10,6 +10,12 @@ class ServicioAdmin(admin.ModelAdmin):
     list_filter = ('activo', 'empresa')
     search_fields = ('nombre', 'empresa__nombre_negocio')
 
+@admin.register(Barbero)
+class BarberoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'empresa', 'activo', 'fecha_creacion')
+    list_filter = ('activo', 'empresa')
+    search_fields = ('nombre', 'empresa__nombre_negocio')
+
 @admin.register(Disponibilidad)
 class DisponibilidadAdmin(admin.ModelAdmin):
     list_display = (
@@ -24,8 +30,33 @@ class DisponibilidadAdmin(admin.ModelAdmin):
     list_filter = ('empresa', 'dia', 'activo')
     search_fields = ('empresa__nombre_negocio',)
 
+@admin.register(ExcepcionDisponibilidad)
+class ExcepcionDisponibilidadAdmin(admin.ModelAdmin):
+    list_display = ('empresa', 'tipo', 'fecha_inicio', 'fecha_fin', 'hora_inicio', 'hora_fin', 'motivo')
+    list_filter = ('empresa', 'tipo')
+    search_fields = ('empresa__nombre_negocio', 'motivo')
+
 @admin.register(Cita)
 class CitaAdmin(admin.ModelAdmin):
-    list_display = ('cliente', 'servicio', 'empresa', 'fecha', 'hora_inicio', 'estado')
+    list_display = ('cliente', 'servicio', 'empresa', 'barbero', 'fecha', 'hora_inicio', 'estado')
     list_filter = ('empresa', 'estado', 'fecha')
     search_fields = ('cliente__user__username', 'servicio__nombre', 'empresa__nombre_negocio')
+
+@admin.register(CitaArchivada)
+class CitaArchivadaAdmin(admin.ModelAdmin):
+    list_display = ('cliente', 'servicio', 'empresa', 'fecha', 'hora_inicio', 'estado', 'fecha_archivo')
+    list_filter = ('empresa', 'estado')
+    search_fields = ('cliente__user__username', 'servicio__nombre', 'empresa__nombre_negocio')
+
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = ('empresa', 'fecha', 'servicio', 'total', 'confirmadas', 'canceladas', 'ingresos')
+    list_filter = ('empresa',)
+    date_hierarchy = 'fecha'
+
+@admin.register(Notificacion)
+class NotificacionAdmin(admin.ModelAdmin):
+    list_display = ('evento', 'canal', 'destinatario', 'estado', 'intentos', 'proximo_intento', 'fecha_envio')
+    list_filter = ('estado', 'evento', 'canal')
+    search_fields = ('destinatario', 'asunto')
+    raw_id_fields = ('cita',)
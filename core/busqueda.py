@@ -0,0 +1,41 @@
+"""
+Búsqueda por prefijo resoluble con un índice B-tree.
+
+`campo LIKE 'texto%'` solo usa índice en algunos motores y con ciertas
+collations; un rango `texto <= campo < texto + U+10FFFF` lo usa en todos.
+
+Para no depender de mayúsculas el rango va sobre LOWER(campo), que tiene
+su índice de expresión (migración 0013). SQLite solo pasa a minúsculas
+los caracteres ASCII, así que allí una 'Ñ' no coincide con 'ñ'.
+"""
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+
+# Mayor que cualquier carácter que pueda seguir al prefijo
+_FIN_PREFIJO = '\U0010ffff'
+
+
+def rango_prefijo(campo, prefijo):
+    """Q que selecciona los valores de `campo` (nombre o expresión) que empiezan por `prefijo`."""
+    if isinstance(campo, str):
+        campo = F(campo)
+    return Q(GreaterThanOrEqual(campo, prefijo)) & Q(LessThan(campo, prefijo + _FIN_PREFIJO))
+
+
+def filtro_prefijo(campo, texto):
+    """Prefijo sin distinguir mayúsculas, como rango sobre LOWER(campo)."""
+    return rango_prefijo(Lower(campo), texto.strip().lower())
+
+
+def filtro_clientes(texto):
+    """
+    Búsqueda de clientes por un solo índice según lo escrito: teléfono si
+    son solo dígitos; si no, usuario o correo (ambos en auth_user, así el
+    motor puede combinar los dos índices con un OR).
+    """
+    texto = texto.strip()
+    if texto.isdigit():
+        return rango_prefijo('telefono', texto)
+    return filtro_prefijo('user__username', texto) | filtro_prefijo('user__email', texto)
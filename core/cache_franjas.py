@@ -0,0 +1,168 @@
+"""
+Caché de franjas libres por (empresa, servicio, fecha).
+
+Las franjas de un día solo cambian cuando se crea o cancela una cita,
+cuando se edita la Disponibilidad del día de la semana, alguna excepción
+o los barberos de la empresa, o cuando cambia la duración del servicio.
+Cada una de esas fuentes tiene su propia versión en la caché y la clave
+de la entrada las incluye, así que invalidar es subir una versión (ver
+core.signals) sin tener que enumerar las claves afectadas.
+
+Las versiones se suben al confirmar la transacción y se leen antes de
+cargar los datos (la clave se arma con `aclave_franjas` antes que el
+calendario): una lectura que cruza un commit guarda lo que leyó bajo una
+versión ya superada y nunca datos viejos bajo la nueva.
+
+La entrada guarda el día completo; el filtro de horas pasadas se aplica
+al leer, de modo que una entrada de hoy sigue siendo válida todo el día.
+
+Las vistas que la usan son async: la caché se lee con sus métodos async
+(aget, aset, aget_many) y se consulta con el ORM async, así que un
+backend de red no bloquea el bucle de eventos.
+"""
+import time as reloj
+
+from django.core.cache import cache
+
+from .calendario import DIAS_SEMANA, asillas_activas
+from .franjas import franjas_con_capacidad, ocupacion_por_silla
+from .models import Cita
+
+
+# Una entrada de más de un día ya no se pide (la fecha quedó en el pasado)
+TIMEOUT_FRANJAS = 60 * 60 * 24
+
+
+# ============================================================
+# 1. VERSIONES
+# ============================================================
+
+def _clave_version_fecha(empresa_id, fecha):
+    return f"franjas:v:fecha:{empresa_id}:{fecha.isoformat()}"
+
+
+def _clave_version_dia(empresa_id, dia):
+    return f"franjas:v:dia:{empresa_id}:{dia}"
+
+
+def _clave_version_excepciones(empresa_id):
+    return f"franjas:v:excepciones:{empresa_id}"
+
+
+def _clave_version_barberos(empresa_id):
+    return f"franjas:v:barberos:{empresa_id}"
+
+
+def _clave_version_servicio(servicio_id):
+    return f"franjas:v:servicio:{servicio_id}"
+
+
+def _subir_version(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # La versión no existía o fue desalojada: se reinicia con un valor
+        # que no puede coincidir con uno anterior
+        cache.set(clave, reloj.time_ns(), None)
+
+
+async def _aversiones(claves):
+    """Lee varias versiones de una vez, creando las que falten."""
+    versiones = await cache.aget_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            await cache.aadd(clave, reloj.time_ns(), None)
+            versiones[clave] = await cache.aget(clave)
+    return [versiones[clave] for clave in claves]
+
+
+def invalidar_fecha(empresa_id, fecha):
+    """Las citas de esa fecha cambiaron."""
+    _subir_version(_clave_version_fecha(empresa_id, fecha))
+
+
+def invalidar_dia(empresa_id, dia):
+    """La disponibilidad de ese día de la semana cambió."""
+    _subir_version(_clave_version_dia(empresa_id, dia))
+
+
+def invalidar_excepciones(empresa_id):
+    """Se creó, editó o eliminó una excepción de la empresa."""
+    _subir_version(_clave_version_excepciones(empresa_id))
+
+
+def invalidar_barberos(empresa_id):
+    """Se agregó, activó o desactivó un barbero de la empresa."""
+    _subir_version(_clave_version_barberos(empresa_id))
+
+
+def invalidar_servicio(servicio_id):
+    """La duración (o el estado) del servicio cambió."""
+    _subir_version(_clave_version_servicio(servicio_id))
+
+
+# ============================================================
+# 2. LECTURA
+# ============================================================
+
+def _claves_version(servicio, fecha):
+    empresa_id = servicio.empresa_id
+    return [
+        _clave_version_fecha(empresa_id, fecha),
+        _clave_version_dia(empresa_id, DIAS_SEMANA[fecha.weekday()]),
+        _clave_version_excepciones(empresa_id),
+        _clave_version_barberos(empresa_id),
+        _clave_version_servicio(servicio.id),
+    ]
+
+
+def _clave_entrada(servicio, fecha, paso, versiones):
+    paso = paso or servicio.duracion
+    return f"franjas:{servicio.empresa_id}:{servicio.id}:{fecha.isoformat()}:{paso}:" + ".".join(map(str, versiones))
+
+
+async def aclave_franjas(servicio, fecha, paso=None):
+    """Clave de la entrada con las versiones vigentes; leerla antes de cargar datos."""
+    return _clave_entrada(servicio, fecha, paso, await _aversiones(_claves_version(servicio, fecha)))
+
+
+def _citas_del_dia(empresa_id, fecha):
+    return Cita.objects.filter(
+        empresa_id=empresa_id,
+        fecha=fecha
+    ).exclude(estado='cancelada').values_list('barbero_id', 'hora_inicio', 'hora_fin')
+
+
+def _desde(franjas, desde):
+    if desde is not None:
+        franjas = [f for f in franjas if f[0] > desde]
+    return franjas
+
+
+async def aobtener_franjas(servicio, fecha, cargar_calendario, desde=None, paso=None, clave=None):
+    """
+    Franjas libres (inicio, fin) en minutos del servicio para la fecha,
+    según las jornadas efectivas del calendario (ver core.calendario).
+
+    `cargar_calendario` es una función async sin argumentos que devuelve el
+    calendario: solo se espera, igual que las citas se consultan, si la
+    entrada no está en caché, y un día cerrado se guarda como lista vacía.
+    `desde` oculta las franjas que empiezan en ese minuto o antes y `paso`
+    es el intervalo entre inicios (por defecto, la duración del servicio).
+    `clave` es la de aclave_franjas, tomada antes de cargar nada.
+    """
+    paso = paso or servicio.duracion
+    clave = clave or await aclave_franjas(servicio, fecha, paso)
+
+    franjas = await cache.aget(clave)
+    if franjas is None:
+        jornadas = (await cargar_calendario()).jornadas(fecha)
+        franjas = []
+        if jornadas:
+            ocupacion = ocupacion_por_silla(
+                await asillas_activas(servicio.empresa_id),
+                [cita async for cita in _citas_del_dia(servicio.empresa_id, fecha)],
+            )
+            franjas = franjas_con_capacidad(jornadas, servicio.duracion, ocupacion, paso=paso)
+        await cache.aset(clave, franjas, TIMEOUT_FRANJAS)
+    return _desde(franjas, desde)
@@ -0,0 +1,179 @@
+"""
+Disponibilidad efectiva por fecha.
+
+La semana tipo (Disponibilidad) se combina con las excepciones de la
+empresa (ExcepcionDisponibilidad) para obtener las jornadas reales de
+cada fecha:
+
+- 'cierre': el día queda cerrado (festivos, vacaciones).
+- 'extra': añade un rango horario, aunque el día esté cerrado.
+- 'descanso': quita un rango horario.
+
+Para un rango de fechas se hacen dos consultas (semana y excepciones que
+lo tocan) y las excepciones se guardan en un índice de intervalos, así
+resolver cada fecha es una búsqueda binaria y no una consulta.
+"""
+from bisect import bisect_right
+from datetime import date, timedelta
+from itertools import accumulate
+
+from .franjas import a_minutos, franjas_con_capacidad, fusionar, jornadas, ocupacion_por_silla, restar
+from .models import Barbero, Cita, Disponibilidad, ExcepcionDisponibilidad
+
+
+DIAS_SEMANA = [dia for dia, _ in Disponibilidad.DIAS_SEMANA]
+
+
+# ============================================================
+# 1. ÍNDICE DE INTERVALOS
+# ============================================================
+
+class IndiceIntervalos:
+    """
+    Intervalos cerrados [inicio, fin] ordenados por inicio, con el máximo
+    acumulado de los fines.
+
+    Los candidatos a contener un punto son los que empiezan antes o en él
+    (búsqueda binaria); se recorren hacia atrás mientras el máximo
+    acumulado siga alcanzando el punto, de modo que nunca se visitan los
+    intervalos que ya terminaron.
+    """
+
+    def __init__(self, intervalos):
+        self._intervalos = sorted(intervalos, key=lambda i: i[0])
+        self._inicios = [inicio for inicio, _, _ in self._intervalos]
+        self._max_fin = list(accumulate((fin for _, fin, _ in self._intervalos), max))
+
+    def __len__(self):
+        return len(self._intervalos)
+
+    def en(self, punto):
+        """Valores de los intervalos que contienen `punto`, en orden de inicio."""
+        encontrados = []
+        k = bisect_right(self._inicios, punto) - 1
+        while k >= 0 and self._max_fin[k] >= punto:
+            _, fin, valor = self._intervalos[k]
+            if fin >= punto:
+                encontrados.append(valor)
+            k -= 1
+        encontrados.reverse()
+        return encontrados
+
+
+# ============================================================
+# 2. CALENDARIO
+# ============================================================
+
+class Calendario:
+    """Jornadas efectivas de una empresa para cualquier fecha cargada."""
+
+    def __init__(self, disponibilidades, excepciones):
+        self._semana = {d.dia: jornadas(d) for d in disponibilidades if d.activo}
+        self._excepciones = IndiceIntervalos((e.fecha_inicio, e.fecha_fin, e) for e in excepciones)
+
+    def excepciones(self, fecha):
+        return self._excepciones.en(fecha)
+
+    def jornadas(self, fecha):
+        """Rangos (inicio, fin) en minutos abiertos en la fecha, ordenados y fusionados."""
+        rangos = self._semana.get(DIAS_SEMANA[fecha.weekday()], [])
+        excepciones = self._excepciones.en(fecha)
+        if not excepciones:
+            return rangos
+
+        extras, descansos = [], []
+        for e in excepciones:
+            if e.tipo == 'cierre':
+                rangos = []
+            elif e.hora_inicio and e.hora_fin:
+                destino = extras if e.tipo == 'extra' else descansos
+                destino.append((a_minutos(e.hora_inicio), a_minutos(e.hora_fin)))
+
+        rangos = fusionar(sorted(rangos + extras))
+        return restar(rangos, fusionar(sorted(descansos)))
+
+    def cerrado(self, fecha):
+        return not self.jornadas(fecha)
+
+    def admite(self, fecha, inicio, fin):
+        """True si [inicio, fin) en minutos cabe entero en una jornada de la fecha."""
+        return any(a <= inicio and fin <= b for a, b in self.jornadas(fecha))
+
+
+def _consultas_calendario(empresa_id, desde, hasta):
+    disponibilidades = Disponibilidad.objects.filter(empresa_id=empresa_id, activo=True)
+    excepciones = ExcepcionDisponibilidad.objects.filter(
+        empresa_id=empresa_id,
+        fecha_fin__gte=desde,
+        fecha_inicio__lte=hasta,
+    )
+    return disponibilidades, excepciones
+
+
+def cargar_calendario(empresa_id, desde, hasta):
+    """Calendario de la empresa con las excepciones que tocan [desde, hasta]."""
+    return Calendario(*_consultas_calendario(empresa_id, desde, hasta))
+
+
+async def acargar_calendario(empresa_id, desde, hasta):
+    """Versión async de cargar_calendario, para las vistas async."""
+    disponibilidades, excepciones = _consultas_calendario(empresa_id, desde, hasta)
+    return Calendario([d async for d in disponibilidades], [e async for e in excepciones])
+
+
+def _barberos_activos(empresa_id):
+    return Barbero.objects.filter(empresa_id=empresa_id, activo=True).values_list('id', flat=True)
+
+
+def sillas_activas(empresa_id):
+    """Ids de los barberos activos de la empresa (vacía: una sola silla)."""
+    return list(_barberos_activos(empresa_id))
+
+
+async def asillas_activas(empresa_id):
+    return [id async for id in _barberos_activos(empresa_id)]
+
+
+# ============================================================
+# 3. FRANJAS DE UN RANGO DE FECHAS
+# ============================================================
+
+def franjas_del_rango(servicio, desde, hasta, ahora=None, paso=None):
+    """
+    Lista de (fecha, jornadas, franjas) para cada fecha de [desde, hasta].
+
+    Hace cuatro consultas sea cual sea el largo del rango y el número de
+    barberos: semana tipo, excepciones, barberos activos y citas no
+    canceladas del rango; el resto se calcula en memoria por fecha.
+    `ahora` (minutos) oculta las franjas ya pasadas de hoy y `paso` es el
+    intervalo entre inicios (por defecto, la duración del servicio).
+    """
+    if desde > hasta:
+        return []
+
+    hoy = date.today()
+
+    calendario = cargar_calendario(servicio.empresa_id, desde, hasta)
+    sillas = sillas_activas(servicio.empresa_id)
+
+    citas_por_fecha = {}
+    citas = Cita.objects.filter(
+        empresa_id=servicio.empresa_id,
+        fecha__range=(desde, hasta)
+    ).exclude(estado='cancelada').values_list('fecha', 'barbero_id', 'hora_inicio', 'hora_fin')
+    for fecha, barbero_id, ini, fin in citas:
+        citas_por_fecha.setdefault(fecha, []).append((barbero_id, ini, fin))
+
+    resultado = []
+    fecha = desde
+    while fecha <= hasta:
+        rangos = calendario.jornadas(fecha)
+        franjas = []
+        if rangos:
+            ocupacion = ocupacion_por_silla(sillas, citas_por_fecha.get(fecha, []))
+            franjas = franjas_con_capacidad(
+                rangos, servicio.duracion, ocupacion, ahora if fecha == hoy else None, paso
+            )
+        resultado.append((fecha, rangos, franjas))
+        fecha += timedelta(days=1)
+    return resultado
@@ -0,0 +1,251 @@
+"""
+Contadores de los dashboards en caché.
+
+Cada contador se calcula desde la base la primera vez que se pide y se
+guarda bajo la versión vigente de su clave. Las señales de Cita, Servicio
+y Cliente (ver core.signals) suben esa versión al confirmar un cambio, y
+la siguiente lectura recalcula. Como en core.cache_franjas, la versión se
+lee antes de contar y el valor se escribe con cache.add: un recálculo que
+cruza un commit queda bajo una versión ya superada y nunca pisa a uno más
+nuevo. El comando `recalcular_contadores` los reconstruye todos.
+
+Las lecturas tienen variante async (prefijo `a`) para las vistas async:
+leen la caché con aget/aset y recalculan con el ORM async.
+"""
+import time as reloj
+from datetime import timedelta
+from itertools import islice
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Cita, Cliente, Empresa, Servicio
+
+
+# Estados que cuentan como cita vigente en los dashboards
+ESTADOS_VIGENTES = ('pendiente', 'confirmada')
+
+# Los contadores se reconstruyen solos al menos una vez al día
+TIMEOUT_CONTADORES = 60 * 60 * 24
+
+# Días desde hoy cuyos contadores de citas rehace recalcular_todo
+DIAS_RECALCULO = 7
+
+# Claves por llamada a set_many al poner en cero a los clientes sin citas
+LOTE_RECALCULO = 1000
+
+
+# ============================================================
+# 1. CLAVES
+# ============================================================
+
+def _clave_servicios_activos(empresa_id):
+    return f"contador:servicios_activos:{empresa_id}"
+
+
+def _clave_clientes_total():
+    return "contador:clientes_total"
+
+
+def _clave_citas_dia(empresa_id, fecha):
+    return f"contador:citas_dia:{empresa_id}:{fecha.isoformat()}"
+
+
+def _clave_proximas(cliente_id, hoy):
+    # Con la fecha en la clave, el cambio de día empieza una entrada nueva
+    return f"contador:proximas:{cliente_id}:{hoy.isoformat()}"
+
+
+def _clave_version(clave):
+    return f"{clave}:v"
+
+
+# ============================================================
+# 2. VERSIONES
+# ============================================================
+
+def _claves_vigentes(claves):
+    """Cada clave con su versión vigente, creando las versiones que falten."""
+    versiones = cache.get_many([_clave_version(clave) for clave in claves])
+    vigentes = []
+    for clave in claves:
+        version = versiones.get(_clave_version(clave))
+        if version is None:
+            cache.add(_clave_version(clave), reloj.time_ns(), TIMEOUT_CONTADORES)
+            version = cache.get(_clave_version(clave))
+        vigentes.append(f"{clave}:{version}")
+    return vigentes
+
+
+async def _aclave_vigente(clave):
+    version = await cache.aget(_clave_version(clave))
+    if version is None:
+        await cache.aadd(_clave_version(clave), reloj.time_ns(), TIMEOUT_CONTADORES)
+        version = await cache.aget(_clave_version(clave))
+    return f"{clave}:{version}"
+
+
+def _invalidar(*claves):
+    for clave in claves:
+        try:
+            cache.incr(_clave_version(clave))
+        except ValueError:
+            # Sin versión no hay valor que la use: la próxima lectura crea una
+            pass
+
+
+def _obtener(clave, calcular):
+    [vigente] = _claves_vigentes([clave])
+    valor = cache.get(vigente)
+    if valor is None:
+        valor = calcular()
+        cache.add(vigente, valor, TIMEOUT_CONTADORES)
+    return valor
+
+
+async def _aobtener(clave, calcular):
+    vigente = await _aclave_vigente(clave)
+    valor = await cache.aget(vigente)
+    if valor is None:
+        valor = await calcular()
+        await cache.aadd(vigente, valor, TIMEOUT_CONTADORES)
+    return valor
+
+
+# ============================================================
+# 3. LECTURA
+# ============================================================
+
+def _servicios_activos(empresa_id):
+    return Servicio.objects.filter(empresa_id=empresa_id, activo=True)
+
+
+def _citas_vigentes(empresa_id, fecha):
+    return Cita.objects.filter(empresa_id=empresa_id, fecha=fecha, estado__in=ESTADOS_VIGENTES)
+
+
+def servicios_activos(empresa_id):
+    return _obtener(_clave_servicios_activos(empresa_id), lambda: _servicios_activos(empresa_id).count())
+
+
+async def aservicios_activos(empresa_id):
+    return await _aobtener(_clave_servicios_activos(empresa_id), lambda: _servicios_activos(empresa_id).acount())
+
+
+def clientes_total():
+    return _obtener(_clave_clientes_total(), lambda: Cliente.objects.count())
+
+
+async def aclientes_total():
+    return await _aobtener(_clave_clientes_total(), lambda: Cliente.objects.acount())
+
+
+def citas_del_dia(empresa_id, fecha):
+    """Citas vigentes de la empresa en la fecha."""
+    return _obtener(_clave_citas_dia(empresa_id, fecha), lambda: _citas_vigentes(empresa_id, fecha).count())
+
+
+async def acitas_del_dia(empresa_id, fecha):
+    return await _aobtener(_clave_citas_dia(empresa_id, fecha), lambda: _citas_vigentes(empresa_id, fecha).acount())
+
+
+def _proximas(cliente_id, hoy):
+    return Cita.objects.filter(cliente_id=cliente_id, fecha__gte=hoy, estado__in=ESTADOS_VIGENTES)
+
+
+def proximas_citas(cliente_id, hoy):
+    """
+    Citas vigentes del cliente desde hoy.
+
+    La entrada es un entero por (cliente, día), así los cambios se aplican
+    con cache.incr como los demás contadores; al cambiar el día la primera
+    lectura recalcula.
+    """
+    return _obtener(_clave_proximas(cliente_id, hoy), lambda: _proximas(cliente_id, hoy).count())
+
+
+async def aproximas_citas(cliente_id, hoy):
+    return await _aobtener(_clave_proximas(cliente_id, hoy), lambda: _proximas(cliente_id, hoy).acount())
+
+
+# ============================================================
+# 4. INVALIDACIÓN
+# ============================================================
+
+def registrar_cambio_cita(anterior, actual, hoy):
+    """
+    Invalida los contadores de citas que cambian.
+
+    `anterior` y `actual` son (empresa_id, cliente_id, fecha) de la cita si
+    estaba / está vigente, o None si no.
+    """
+    if anterior == actual:
+        return
+    for datos in (anterior, actual):
+        if datos is not None:
+            olvidar_cita(*datos, hoy)
+
+
+def olvidar_cita(empresa_id, cliente_id, fecha, hoy):
+    """Invalida los contadores que dependen de la cita; se recalculan al leer."""
+    _invalidar(_clave_citas_dia(empresa_id, fecha))
+    if fecha >= hoy:
+        _invalidar(_clave_proximas(cliente_id, hoy))
+
+
+def registrar_cambio_servicios(empresa_id):
+    _invalidar(_clave_servicios_activos(empresa_id))
+
+
+def registrar_cambio_clientes():
+    _invalidar(_clave_clientes_total())
+
+
+# ============================================================
+# 5. RECÁLCULO COMPLETO
+# ============================================================
+
+def _lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+def _guardar(valores):
+    # set y no add: el recálculo repara lo que haya bajo la versión vigente
+    cache.set_many(dict(zip(_claves_vigentes(list(valores)), valores.values())), TIMEOUT_CONTADORES)
+
+
+def recalcular_todo(hoy):
+    """Reconstruye todos los contadores desde la base; devuelve cuántos escribió."""
+    valores = {_clave_clientes_total(): Cliente.objects.count()}
+
+    activos = dict(
+        Servicio.objects.filter(activo=True).values('empresa_id').annotate(total=Count('id')).values_list('empresa_id', 'total')
+    )
+    for empresa_id in Empresa.objects.values_list('id', flat=True):
+        valores[_clave_servicios_activos(empresa_id)] = activos.get(empresa_id, 0)
+        for i in range(DIAS_RECALCULO):
+            valores[_clave_citas_dia(empresa_id, hoy + timedelta(days=i))] = 0
+
+    vigentes = Cita.objects.filter(fecha__gte=hoy, estado__in=ESTADOS_VIGENTES)
+    futuras = (
+        vigentes
+        .values('empresa_id', 'cliente_id', 'fecha')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for fila in futuras:
+        clave_dia = _clave_citas_dia(fila['empresa_id'], fila['fecha'])
+        valores[clave_dia] = valores.get(clave_dia, 0) + fila['total']
+        clave_cliente = _clave_proximas(fila['cliente_id'], hoy)
+        valores[clave_cliente] = valores.get(clave_cliente, 0) + fila['total']
+    _guardar(valores)
+
+    # Los clientes sin citas futuras quedan en cero, en lotes de set_many
+    clientes = Cliente.objects.exclude(id__in=vigentes.values('cliente_id')).values_list('id', flat=True)
+    escritos = len(valores)
+    for lote in _lotes(clientes.iterator(chunk_size=LOTE_RECALCULO), LOTE_RECALCULO):
+        _guardar({_clave_proximas(cliente_id, hoy): 0 for cliente_id in lote})
+        escritos += len(lote)
+    return escritos
@@ -0,0 +1,14 @@
+from datetime import date
+
+
+class FechaConverter:
+    """Fecha ISO (AAAA-MM-DD) en la URL, entregada a la vista como date."""
+
+    regex = r'\d{4}-\d{2}-\d{2}'
+
+    def to_python(self, value):
+        # Un ValueError (p. ej. 2025-02-30) hace que la URL no coincida: 404
+        return date.fromisoformat(value)
+
+    def to_url(self, value):
+        return value.isoformat() if isinstance(value, date) else value
@@ -0,0 +1,101 @@
+"""
+Cambios de estado de citas desde el panel de la empresa.
+
+Las transiciones permitidas están en TRANSICIONES y las usan tanto las
+vistas de una sola cita como la acción en bloque. `cambiar_estado` aplica
+una transición a un conjunto de citas con un único UPDATE condicionado al
+estado de origen y devuelve el resultado de cada id.
+
+update() no dispara las señales de Cita, así que aquí se hace a mano lo
+que harían: al confirmar la transacción se invalida la caché de franjas de
+las fechas que quedan libres (y se avisa a las páginas de horarios
+abiertas), se publica cada cambio en el tablero de la empresa y se
+ajustan los contadores de los dashboards; los avisos se encolan en la
+misma transacción.
+"""
+from datetime import date
+
+from django.db import transaction
+
+from . import cache_franjas, contadores, eventos
+from .models import Cita
+from .notificaciones import encolar
+
+
+# acción -> (estado destino, estados desde los que se permite)
+TRANSICIONES = {
+    'confirmar': ('confirmada', ('pendiente',)),
+    'cancelar': ('cancelada', ('pendiente', 'confirmada')),
+}
+
+# Resultados por cita de `cambiar_estado`
+ACTUALIZADA = 'actualizada'
+SIN_CAMBIOS = 'sin_cambios'       # ya estaba en el estado destino
+NO_PERMITIDA = 'no_permitida'     # la transición no se permite desde su estado
+NO_ENCONTRADA = 'no_encontrada'   # no existe o es de otra empresa
+
+
+def _vigente(cita, estado):
+    if estado not in contadores.ESTADOS_VIGENTES:
+        return None
+    return (cita.empresa_id, cita.cliente_id, cita.fecha)
+
+
+def cambiar_estado(empresa_id, ids, accion):
+    """
+    Aplica `accion` ('confirmar' o 'cancelar') a las citas `ids` de la
+    empresa y devuelve {id: resultado}.
+
+    Son tres consultas sea cual sea el número de citas: la lectura (con las
+    filas bloqueadas donde el motor lo permite), el UPDATE y el INSERT de
+    los avisos.
+    """
+    destino, origenes = TRANSICIONES[accion]
+    resultados = dict.fromkeys(ids, NO_ENCONTRADA)
+
+    with transaction.atomic():
+        citas = (
+            Cita.objects.select_related('cliente__user', 'servicio', 'empresa')
+            .select_for_update(of=('self',))
+            .filter(empresa_id=empresa_id, id__in=resultados)
+        )
+        cambiar = []
+        for cita in citas:
+            if cita.estado == destino:
+                resultados[cita.id] = SIN_CAMBIOS
+            elif cita.estado in origenes:
+                cambiar.append(cita)
+            else:
+                resultados[cita.id] = NO_PERMITIDA
+        if not cambiar:
+            return resultados
+
+        Cita.objects.filter(
+            empresa_id=empresa_id, id__in=[c.id for c in cambiar], estado__in=origenes
+        ).update(estado=destino)
+
+        cambios = []
+        anteriores = []
+        for cita in cambiar:
+            cambios.append((_vigente(cita, cita.estado), _vigente(cita, destino)))
+            anteriores.append(cita.estado)
+            cita.estado = destino
+            resultados[cita.id] = ACTUALIZADA
+
+        encolar(cambiar, destino)
+
+        hoy = date.today()
+        fechas_libres = {c.fecha for c in cambiar} if destino == 'cancelada' else set()
+
+        def al_confirmar():
+            for fecha in fechas_libres:
+                cache_franjas.invalidar_fecha(empresa_id, fecha)
+            eventos.franjas_cambiaron(empresa_id, fechas_libres)
+            for cita, anterior in zip(cambiar, anteriores):
+                eventos.cita_cambio(cita, destino, anterior)
+            for anterior, actual in cambios:
+                contadores.registrar_cambio_cita(anterior, actual, hoy)
+
+        transaction.on_commit(al_confirmar)
+
+    return resultados
@@ -0,0 +1,238 @@
+"""
+Publicación de eventos en vivo (pub/sub) para las vistas con Server-Sent
+Events.
+
+Los cambios se publican en canales con nombre (las franjas de una
+empresa en una fecha, el tablero de citas de una empresa) y cada conexión
+SSE abierta se suscribe a los que le interesan. El bus se elige con
+EVENTOS_BACKEND:
+
+- BusLocal (por defecto): en memoria del proceso. Solo llega a las
+  conexiones del mismo proceso, así que sirve con un único worker ASGI.
+- Con varios workers se sustituye por un bus sobre un broker (Redis
+  pub/sub, PostgreSQL LISTEN/NOTIFY) con la misma interfaz: `publicar`
+  desde código síncrono y `suscribir`, que devuelve un context manager
+  async.
+
+Cada evento publicado recibe un id creciente y los últimos HISTORIAL de
+cada canal se guardan, así una conexión que se cae retoma desde su
+Last-Event-ID. Si lo pedido ya no está en el historial (o el id es de
+otro proceso, anterior a un reinicio) la suscripción recibe REINICIAR y
+el cliente debe recargar el estado completo. Lo mismo ocurre cuando una
+suscripción lenta llena su cola: se vacía y recibe REINICIAR, nunca se
+bloquea al que publica.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Eventos pendientes por suscripción antes de descartar
+MAX_PENDIENTES = 100
+
+# Eventos que se guardan por canal para retomar una conexión (no más de
+# los que caben en la cola de una suscripción)
+HISTORIAL = MAX_PENDIENTES
+
+# Canales sin suscriptores cuyo historial se conserva (los más recientes)
+MAX_CANALES = 1000
+
+# Evento que pide al suscriptor recargar el estado completo
+REINICIAR = 'reiniciar'
+
+
+class DemasiadasSuscripciones(Exception):
+    """El canal ya tiene el máximo de suscripciones pedido."""
+
+
+# ============================================================
+# 1. CANALES
+# ============================================================
+
+def canal_franjas(empresa_id, fecha):
+    """Cambios en las citas de la empresa en la fecha."""
+    return f"franjas:{empresa_id}:{fecha.isoformat()}"
+
+
+def canal_citas(empresa_id):
+    """Citas nuevas, confirmadas y canceladas de la empresa (tablero)."""
+    return f"citas:{empresa_id}"
+
+
+# ============================================================
+# 2. BUS EN PROCESO
+# ============================================================
+
+class Suscripcion:
+    """
+    Cola de (id, evento) de un suscriptor, ligada a su bucle de eventos.
+    Es un context manager async: se da de alta en el bus al entrar y de
+    baja al salir.
+    """
+
+    def __init__(self, bus, canal, desde=None, maximo=None):
+        self._bus = bus
+        self._canal = canal
+        self._desde = desde
+        self._maximo = maximo
+        self._loop = None
+        self._cola = asyncio.Queue(MAX_PENDIENTES)
+
+    async def __aenter__(self):
+        self._loop = asyncio.get_running_loop()
+        self._bus._alta(self, self._canal, self._desde, self._maximo)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._bus._baja(self, self._canal)
+
+    def entregar(self, item):
+        """Se puede llamar desde cualquier hilo."""
+        try:
+            self._loop.call_soon_threadsafe(self._poner, item)
+        except RuntimeError:
+            # El bucle ya se cerró: la conexión terminó
+            pass
+
+    def _poner(self, item):
+        if self._cola.full():
+            # Se perdería un evento: se descarta todo y se pide recargar
+            while not self._cola.empty():
+                self._cola.get_nowait()
+            item = (None, REINICIAR)
+        self._cola.put_nowait(item)
+
+    async def siguiente(self):
+        return await self._cola.get()
+
+
+class _Canal:
+    def __init__(self, completo_desde):
+        self.suscripciones = set()
+        self.historial = deque()
+        # Número desde el que el historial tiene todos los eventos del canal
+        self.completo_desde = completo_desde
+
+
+class BusLocal:
+    def __init__(self):
+        self._canales = OrderedDict()
+        self._numeros = itertools.count(1)
+        self._ultimo = 0
+        # Distingue los ids de este proceso de los de uno anterior
+        self._epoca = format(time.time_ns(), 'x')
+        self._lock = threading.Lock()
+
+    def _canal(self, nombre):
+        canal = self._canales.get(nombre)
+        if canal is None:
+            canal = self._canales[nombre] = _Canal(self._ultimo)
+            self._recortar()
+        self._canales.move_to_end(nombre)
+        return canal
+
+    def _recortar(self):
+        sobran = len(self._canales) - MAX_CANALES
+        for nombre in [n for n, c in self._canales.items() if not c.suscripciones][:max(sobran, 0)]:
+            del self._canales[nombre]
+
+    def _pendientes(self, canal, desde):
+        """Eventos del historial posteriores a `desde` (un id), o REINICIAR."""
+        epoca, _, numero = (desde or '').partition('-')
+        if epoca != self._epoca or not numero.isdigit() or int(numero) < canal.completo_desde:
+            return [(None, REINICIAR)]
+        numero = int(numero)
+        return [(f"{self._epoca}-{n}", evento) for n, evento in canal.historial if n > numero]
+
+    def publicar(self, canal, evento):
+        """Publica y devuelve el id del evento."""
+        with self._lock:
+            datos = self._canal(canal)
+            numero = self._ultimo = next(self._numeros)
+            datos.historial.append((numero, evento))
+            while len(datos.historial) > HISTORIAL:
+                datos.completo_desde = datos.historial.popleft()[0]
+            suscripciones = list(datos.suscripciones)
+        id = f"{self._epoca}-{numero}"
+        for suscripcion in suscripciones:
+            suscripcion.entregar((id, evento))
+        return id
+
+    def suscribir(self, canal, desde=None, maximo=None):
+        """
+        Suscripción al canal (usar con `async with`). Con `desde` (el último
+        id recibido) se entregan primero los eventos posteriores del
+        historial. Al entrar lanza DemasiadasSuscripciones si el canal ya
+        tiene `maximo`.
+        """
+        return Suscripcion(self, canal, desde, maximo)
+
+    def _alta(self, suscripcion, canal, desde, maximo):
+        with self._lock:
+            datos = self._canal(canal)
+            if maximo is not None and len(datos.suscripciones) >= maximo:
+                raise DemasiadasSuscripciones(canal)
+            pendientes = self._pendientes(datos, desde) if desde is not None else []
+            datos.suscripciones.add(suscripcion)
+        for item in pendientes:
+            suscripcion._poner(item)
+
+    def _baja(self, suscripcion, canal):
+        with self._lock:
+            datos = self._canales.get(canal)
+            if datos:
+                datos.suscripciones.discard(suscripcion)
+
+    def suscriptores(self, canal):
+        with self._lock:
+            datos = self._canales.get(canal)
+            return len(datos.suscripciones) if datos else 0
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def obtener_bus():
+    """El bus configurado; una sola instancia por proceso."""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = import_string(settings.EVENTOS_BACKEND)()
+        return _bus
+
+
+# ============================================================
+# 3. PUBLICACIÓN
+# ============================================================
+
+def franjas_cambiaron(empresa_id, fechas):
+    """Avisa que cambiaron las citas de esas fechas (llamar tras el commit)."""
+    bus = obtener_bus()
+    for fecha in fechas:
+        bus.publicar(canal_franjas(empresa_id, fecha), 'franjas')
+
+
+def cita_cambio(cita, tipo, anterior=None):
+    """
+    Publica en el tablero de la empresa una cita nueva (`tipo` 'nueva') o
+    su cambio de estado (`tipo` el estado nuevo; `anterior`, el de antes si
+    se conoce). Lleva los datos que muestra el panel para que la página se
+    actualice sin consultar.
+    """
+    obtener_bus().publicar(canal_citas(cita.empresa_id), {
+        'tipo': tipo,
+        'id': cita.id,
+        'estado': cita.estado,
+        'anterior': anterior,
+        'fecha': cita.fecha.isoformat(),
+        'hora_inicio': cita.hora_inicio.strftime('%H:%M'),
+        'hora_fin': cita.hora_fin.strftime('%H:%M'),
+        'cliente': cita.cliente.user.username,
+        'servicio': cita.servicio.nombre,
+    })
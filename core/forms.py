@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import Cliente, Empresa, Servicio
+from .models import Cliente, Empresa, Servicio, Barbero, ExcepcionDisponibilidad
 import re
 
 # Formulario de registro para Cliente
@@ -58,7 +58,7 @@ class EditarClienteForm(forms.ModelForm):
 class EmpresaForm(forms.ModelForm):
     class Meta:
         model = Empresa
-        fields = ['nombre_negocio', 'direccion', 'telefono']
+        fields = ['nombre_negocio', 'direccion', 'telefono', 'intervalo_franjas']
         widgets = {
             'nombre_negocio': forms.TextInput(attrs={
                 'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary',
@@ -72,6 +72,9 @@ class EmpresaForm(forms.ModelForm):
                 'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary',
                 'placeholder': 'Teléfono'
             }),
+            'intervalo_franjas': forms.Select(attrs={
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary'
+            }),
         }
 
     # --- VALIDACIONES ---
@@ -126,4 +129,74 @@ class ServicioForm(forms.ModelForm):
             raise forms.ValidationError(
                 "El nombre del servicio debe incluir letras; no puede ser solo números o símbolos."
             )
-        return nombre
\ No newline at end of file
+        return nombre
+
+# Formulario para agregar Barbero
+class BarberoForm(forms.ModelForm):
+    class Meta:
+        model = Barbero
+        fields = ['nombre']
+        widgets = {
+            'nombre': forms.TextInput(attrs={
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary',
+                'placeholder': 'Nombre del barbero'
+            }),
+        }
+
+    # --- VALIDACIONES ---
+    def clean_nombre(self):
+        nombre = self.cleaned_data['nombre'].strip()
+        if not any(c.isalpha() for c in nombre):
+            raise forms.ValidationError("El nombre del barbero debe incluir letras.")
+        return nombre
+
+# Formulario para registrar excepciones de disponibilidad
+class ExcepcionDisponibilidadForm(forms.ModelForm):
+    class Meta:
+        model = ExcepcionDisponibilidad
+        fields = ['tipo', 'fecha_inicio', 'fecha_fin', 'hora_inicio', 'hora_fin', 'motivo']
+        widgets = {
+            'tipo': forms.Select(attrs={
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary'
+            }),
+            'fecha_inicio': forms.DateInput(attrs={
+                'type': 'date',
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary'
+            }),
+            'fecha_fin': forms.DateInput(attrs={
+                'type': 'date',
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary'
+            }),
+            'hora_inicio': forms.TimeInput(attrs={
+                'type': 'time',
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary'
+            }),
+            'hora_fin': forms.TimeInput(attrs={
+                'type': 'time',
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary'
+            }),
+            'motivo': forms.TextInput(attrs={
+                'class': 'w-full p-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary',
+                'placeholder': 'Motivo (opcional)'
+            }),
+        }
+
+    # --- VALIDACIONES ---
+    def clean(self):
+        datos = super().clean()
+        fecha_inicio = datos.get('fecha_inicio')
+        fecha_fin = datos.get('fecha_fin')
+        if fecha_inicio and fecha_fin and fecha_fin < fecha_inicio:
+            raise forms.ValidationError("La fecha final no puede ser anterior a la inicial.")
+
+        if datos.get('tipo') == 'cierre':
+            # El cierre cubre el día completo
+            datos['hora_inicio'] = datos['hora_fin'] = None
+        else:
+            hora_inicio = datos.get('hora_inicio')
+            hora_fin = datos.get('hora_fin')
+            if not hora_inicio or not hora_fin:
+                raise forms.ValidationError("Indica el rango horario del horario extra o del descanso.")
+            if hora_fin <= hora_inicio:
+                raise forms.ValidationError("La hora final debe ser posterior a la inicial.")
+        return datos
@@ -0,0 +1,110 @@
+"""
+Fragmentos de plantilla pre-renderizados en caché.
+
+El catálogo de servicios activos (dashboard_cliente) y la semana de
+atención (detalle_servicio) son iguales para todos los clientes de una
+empresa y cambian pocas veces por semana. Se renderizan una vez, se
+guardan como HTML y las vistas los insertan tal cual: en un acierto no
+hay consultas ni render.
+
+Como en core.cache_franjas, la clave de cada fragmento lleva una versión
+por empresa que las señales de Servicio, Disponibilidad y Empresa suben
+al confirmar la transacción (ver core.signals), así que invalidar no
+necesita conocer las claves guardadas. La versión se lee antes de
+consultar: un render con datos viejos queda bajo una versión ya superada.
+"""
+import time as reloj
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .models import Disponibilidad, Servicio
+
+
+# Un fragmento sin pedir durante un día se descarta
+TIMEOUT_FRAGMENTOS = 60 * 60 * 24
+
+CATALOGO = 'catalogo'
+SEMANA = 'semana'
+
+PLANTILLAS = {
+    CATALOGO: 'cliente/fragmentos/catalogo_servicios.html',
+    SEMANA: 'cliente/fragmentos/semana_atencion.html',
+}
+
+
+# ============================================================
+# 1. VERSIONES
+# ============================================================
+
+def _clave_version(fragmento, empresa_id):
+    return f"fragmentos:v:{fragmento}:{empresa_id}"
+
+
+async def _aversion(fragmento, empresa_id):
+    clave = _clave_version(fragmento, empresa_id)
+    version = await cache.aget(clave)
+    if version is None:
+        await cache.aadd(clave, reloj.time_ns(), None)
+        version = await cache.aget(clave)
+    return version
+
+
+def _subir_version(fragmento, empresa_id):
+    clave = _clave_version(fragmento, empresa_id)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # Desalojada: un valor nuevo que no coincide con uno anterior
+        cache.set(clave, reloj.time_ns(), None)
+
+
+def invalidar_catalogo(empresa_id):
+    """Se creó, editó o eliminó un servicio de la empresa."""
+    _subir_version(CATALOGO, empresa_id)
+
+
+def invalidar_semana(empresa_id):
+    """Cambió la disponibilidad semanal de la empresa."""
+    _subir_version(SEMANA, empresa_id)
+
+
+def invalidar_empresa(empresa_id):
+    """Cambiaron los datos de la empresa: se rehacen todos sus fragmentos."""
+    for fragmento in PLANTILLAS:
+        _subir_version(fragmento, empresa_id)
+
+
+# ============================================================
+# 2. LECTURA
+# ============================================================
+
+async def _fragmento(fragmento, empresa_id, partes, contexto):
+    """HTML del fragmento; en un fallo se arma con `await contexto()`."""
+    version = await _aversion(fragmento, empresa_id)
+    clave = f"fragmentos:{fragmento}:{empresa_id}:" + ":".join(map(str, [*partes, version]))
+    html = await cache.aget(clave)
+    if html is None:
+        html = render_to_string(PLANTILLAS[fragmento], await contexto())
+        await cache.aset(clave, html, TIMEOUT_FRAGMENTOS)
+    return html
+
+
+async def acatalogo(empresa_id):
+    """Tarjetas de los servicios activos de la empresa."""
+    async def contexto():
+        servicios = Servicio.objects.filter(empresa_id=empresa_id, activo=True).order_by('nombre')
+        return {'servicios': [s async for s in servicios]}
+
+    if empresa_id is None:
+        return render_to_string(PLANTILLAS[CATALOGO], {'servicios': []})
+    return await _fragmento(CATALOGO, empresa_id, [], contexto)
+
+
+async def asemana(empresa_id, servicio_id):
+    """Días de atención de la empresa con el enlace a los horarios del servicio."""
+    async def contexto():
+        dias = Disponibilidad.objects.filter(empresa_id=empresa_id, activo=True).order_by('id')
+        return {'servicio_id': servicio_id, 'dias_disponibles': [d async for d in dias]}
+
+    return await _fragmento(SEMANA, empresa_id, [servicio_id], contexto)
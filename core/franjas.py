@@ -0,0 +1,210 @@
+"""
+Motor de franjas horarias.
+
+Trabaja con minutos desde la medianoche (enteros) en lugar de objetos
+datetime: las jornadas de una Disponibilidad se convierten una sola vez
+en rangos ordenados y fusionados.
+
+Cada barbero es una silla (sin barberos, la empresa es una sola silla) y
+una franja está libre si ninguna cita ocupa alguno de sus minutos en
+alguna silla. Los minutos ocupados de cada silla son una máscara de bits
+(el bit m es el minuto m): sumar una cita es un OR, sin ordenar ni
+fusionar, y los inicios libres de todas las franjas salen de unas pocas
+operaciones sobre esas máscaras. Las citas se leen por lotes y la
+búsqueda se corta cuando ya no queda ninguna franja libre, así que un
+día lleno no paga por todas sus citas.
+"""
+from datetime import time
+from functools import reduce
+from itertools import islice
+from operator import itemgetter, or_
+
+
+# Citas del primer lote que lee Ocupacion; cada lote dobla al anterior
+LOTE_OCUPACION = 64
+
+# Tramos distintos cuya máscara se guarda entre llamadas
+MAX_TRAMOS = 20000
+
+
+# ============================================================
+# 1. CONVERSIONES
+# ============================================================
+
+def a_minutos(hora):
+    """Convierte un objeto time en minutos desde la medianoche."""
+    return hora.hour * 60 + hora.minute
+
+
+def a_hora(minutos):
+    """Convierte minutos desde la medianoche en un objeto time."""
+    return time(minutos // 60, minutos % 60)
+
+
+def formatear_franja(inicio, fin):
+    """Devuelve la franja como texto 'HH:MM - HH:MM'."""
+    return f"{inicio // 60:02d}:{inicio % 60:02d} - {fin // 60:02d}:{fin % 60:02d}"
+
+
+# ============================================================
+# 2. RANGOS
+# ============================================================
+
+def jornadas(disponibilidad):
+    """Rangos (inicio, fin) en minutos de la mañana y la tarde configuradas."""
+    rangos = []
+    if disponibilidad.hora_inicio_m and disponibilidad.hora_fin_m:
+        rangos.append((a_minutos(disponibilidad.hora_inicio_m), a_minutos(disponibilidad.hora_fin_m)))
+    if disponibilidad.hora_inicio_t and disponibilidad.hora_fin_t:
+        rangos.append((a_minutos(disponibilidad.hora_inicio_t), a_minutos(disponibilidad.hora_fin_t)))
+    return rangos
+
+
+def fusionar(rangos):
+    """Fusiona rangos ordenados por inicio que se solapan o se tocan."""
+    fusionados = []
+    for inicio, fin in rangos:
+        if fusionados and inicio <= fusionados[-1][1]:
+            if fin > fusionados[-1][1]:
+                fusionados[-1] = (fusionados[-1][0], fin)
+        else:
+            fusionados.append((inicio, fin))
+    return fusionados
+
+
+def restar(rangos, quitar):
+    """
+    Rangos de `rangos` que no cubre ninguno de `quitar`.
+
+    Ambas listas deben venir ordenadas y fusionadas.
+    """
+    resultado = []
+    j = 0
+    for inicio, fin in rangos:
+        while j < len(quitar) and quitar[j][1] <= inicio:
+            j += 1
+        k = j
+        while k < len(quitar) and quitar[k][0] < fin:
+            if quitar[k][0] > inicio:
+                resultado.append((inicio, quitar[k][0]))
+            inicio = max(inicio, quitar[k][1])
+            k += 1
+        if inicio < fin:
+            resultado.append((inicio, fin))
+    return resultado
+
+
+# ============================================================
+# 3. FRANJAS LIBRES
+# ============================================================
+
+class _Tramos(dict):
+    """
+    Máscara de los minutos de cada tramo (hora_inicio, hora_fin). Los
+    tramos de un negocio se repiten (inicio de la rejilla más la duración
+    de un servicio), así que casi todas las citas se resuelven con una
+    búsqueda; pasado MAX_TRAMOS se calculan sin guardarse.
+    """
+
+    def __missing__(self, tramo):
+        ini, fin = tramo
+        mascara = (1 << a_minutos(fin)) - (1 << a_minutos(ini))
+        if len(self) < MAX_TRAMOS:
+            self[tramo] = mascara
+        return mascara
+
+
+_TRAMOS = _Tramos()
+_TRAMO = itemgetter(1, 2)
+
+
+class Ocupacion:
+    """
+    Minutos ocupados de cada silla, leídos de las citas a medida que
+    franjas_con_capacidad los necesita.
+
+    `sillas` son los ids de los barberos activos y `citas` trae tuplas
+    (barbero_id, hora_inicio, hora_fin). Una cita sin barbero ocupa todas
+    las sillas y las de barberos inactivos ninguna. Sin barberos la
+    empresa es una sola silla que ocupan todas las citas.
+    """
+
+    def __init__(self, sillas, citas):
+        self._citas = iter(citas)
+        self._indice = {silla: i for i, silla in enumerate(sillas)}
+        self._por_silla = [0] * len(self._indice)
+        self._comunes = 0
+        self._lote = LOTE_OCUPACION
+
+    def mascaras(self):
+        """Máscara de minutos ocupados de cada silla con lo leído hasta ahora."""
+        if not self._por_silla:
+            return [self._comunes]
+        return [ocupados | self._comunes for ocupados in self._por_silla]
+
+    def leer(self):
+        """Suma el siguiente lote de citas; False si ya no quedaban."""
+        lote = list(islice(self._citas, self._lote))
+        if not lote:
+            return False
+        self._lote *= 2
+        if not self._por_silla:
+            self._comunes = reduce(or_, map(_TRAMOS.__getitem__, map(_TRAMO, lote)), self._comunes)
+            return True
+        indice, por_silla, comunes = self._indice, self._por_silla, self._comunes
+        for barbero_id, ini, fin in lote:
+            ocupados = _TRAMOS[ini, fin]
+            if barbero_id is None:
+                comunes |= ocupados
+            elif (i := indice.get(barbero_id)) is not None:
+                por_silla[i] |= ocupados
+        self._comunes = comunes
+        return True
+
+
+def _inicios_libres(libres, duracion):
+    """Bits m de `libres` tales que los `duracion` bits desde m están puestos."""
+    cubiertos = 1
+    while cubiertos < duracion:
+        desplazamiento = min(cubiertos, duracion - cubiertos)
+        libres &= libres >> desplazamiento
+        cubiertos += desplazamiento
+    return libres
+
+
+def ocupacion_por_silla(sillas, citas):
+    """Ocupacion de las sillas con las citas (barbero_id, hora_inicio, hora_fin) del día."""
+    return Ocupacion(sillas, citas)
+
+
+def franjas_con_capacidad(rangos, duracion, ocupacion, desde=None, paso=None):
+    """
+    Franjas de las jornadas `rangos` en las que al menos una silla está
+    libre de principio a fin.
+
+    `ocupacion` es la de `ocupacion_por_silla`. Las franjas empiezan cada
+    `paso` minutos desde el inicio de cada jornada (por defecto, cada
+    `duracion`). Una franja ocupada en todas las sillas no vuelve a
+    quedar libre al leer más citas, así que la lectura termina en cuanto
+    no queda ninguna.
+    """
+    paso = paso or duracion
+    if duracion <= 0:
+        return []
+
+    cursores = [
+        cursor
+        for inicio, fin in rangos
+        for cursor in range(inicio, fin - duracion + 1, paso)
+        if desde is None or cursor > desde
+    ]
+    rejilla = reduce(or_, (1 << cursor for cursor in cursores), 0)
+
+    def libres():
+        # ~ocupados son los minutos libres de la silla
+        return rejilla & reduce(or_, (_inicios_libres(~ocupados, duracion) for ocupados in ocupacion.mascaras()))
+
+    inicios = libres()
+    while inicios and ocupacion.leer():
+        inicios = libres()
+    return [(cursor, cursor + duracion) for cursor in cursores if inicios >> cursor & 1]
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark del motor de franjas.
+
+Compara el cálculo anterior (datetime + comprobación de cada franja contra
+cada cita) con franjas_con_capacidad, el que usan las vistas, a medida que
+crece el número de citas del día. Las citas caen dentro de la jornada y
+se reparten entre --barberos sillas (0: la empresa es una sola silla,
+como en el cálculo anterior, que no distingue barberos).
+
+    python manage.py bench_franjas --citas 0 10 50 200 1000
+    python manage.py bench_franjas --barberos 3
+"""
+import random
+import timeit
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from core.franjas import a_hora, franjas_con_capacidad, jornadas, ocupacion_por_silla
+
+
+def franjas_anterior(disponibilidad, duracion, citas, fecha):
+    """Implementación previa de horarios_servicio, conservada como referencia."""
+    franjas = []
+
+    def solapada(inicio, fin):
+        for ini_occ, fin_occ in citas:
+            if inicio < fin_occ and fin > ini_occ:
+                return True
+        return False
+
+    for ini, fin in ((disponibilidad.hora_inicio_m, disponibilidad.hora_fin_m),
+                     (disponibilidad.hora_inicio_t, disponibilidad.hora_fin_t)):
+        hora_actual = datetime.combine(fecha, ini)
+        hora_fin = datetime.combine(fecha, fin)
+        while hora_actual + timedelta(minutes=duracion) <= hora_fin:
+            fin_slot = hora_actual + timedelta(minutes=duracion)
+            if not solapada(hora_actual.time(), fin_slot.time()):
+                franjas.append(f"{hora_actual.time().strftime('%H:%M')} - {fin_slot.time().strftime('%H:%M')}")
+            hora_actual = fin_slot
+    return franjas
+
+
+def citas_sinteticas(cantidad, rangos, barberos=0, semilla=7):
+    """
+    Citas (barbero_id, inicio, fin) de 5 a 60 minutos repartidas al azar
+    dentro de las jornadas `rangos` y entre los barberos 1..`barberos`.
+    """
+    rnd = random.Random(semilla)
+    citas = []
+    for _ in range(cantidad):
+        abre, cierra = rnd.choice(rangos)
+        duracion = rnd.randrange(5, 61)
+        inicio = rnd.randrange(abre, cierra - duracion + 1)
+        barbero = rnd.randint(1, barberos) if barberos else None
+        citas.append((barbero, a_hora(inicio), a_hora(inicio + duracion)))
+    return citas
+
+
+class Command(BaseCommand):
+    help = "Mide el coste del cálculo de franjas según el número de citas del día."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citas', type=int, nargs='+', default=[0, 10, 50, 100, 500, 1000])
+        parser.add_argument('--duracion', type=int, default=15)
+        parser.add_argument('--barberos', type=int, default=0)
+        parser.add_argument('--repeticiones', type=int, default=200)
+
+    def handle(self, *args, **options):
+        duracion = options['duracion']
+        repeticiones = options['repeticiones']
+        disponibilidad = SimpleNamespace(
+            hora_inicio_m=time(6, 0), hora_fin_m=time(13, 0),
+            hora_inicio_t=time(14, 0), hora_fin_t=time(22, 0),
+        )
+        fecha = date.today()
+        sillas = list(range(1, options['barberos'] + 1))
+
+        self.stdout.write(f"{'citas':>8} {'anterior (µs)':>15} {'capacidad (µs)':>15} {'x':>8}")
+        for cantidad in options['citas']:
+            citas = citas_sinteticas(cantidad, jornadas(disponibilidad), options['barberos'])
+            # El cálculo anterior no distingue barberos: cualquier cita ocupa
+            horas = [(ini, fin) for _, ini, fin in citas]
+
+            anterior = timeit.timeit(
+                lambda: franjas_anterior(disponibilidad, duracion, horas, fecha),
+                number=repeticiones,
+            ) / repeticiones
+            # Incluye la lectura de las citas de cada silla
+            capacidad = timeit.timeit(
+                lambda: franjas_con_capacidad(jornadas(disponibilidad), duracion, ocupacion_por_silla(sillas, citas)),
+                number=repeticiones,
+            ) / repeticiones
+
+            self.stdout.write(
+                f"{cantidad:>8} {anterior * 1e6:>15.1f} {capacidad * 1e6:>15.1f} {anterior / capacidad:>8.1f}"
+            )
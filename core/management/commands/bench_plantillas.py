@@ -0,0 +1,132 @@
+"""
+Benchmark del render de plantillas.
+
+Mide dos cosas:
+
+- Carga: obtener todas las plantillas de core/templates con el loader sin
+  caché (se lee y compila cada vez) y con el cached.Loader de settings.
+- Páginas: dashboard_cliente y detalle_servicio de una empresa con
+  --servicios servicios, con sus fragmentos (core/fragmentos.py) en fallo
+  (consulta + render del fragmento + página) y en acierto (solo la
+  página).
+
+Los datos se crean dentro de una transacción que se revierte al terminar.
+
+    python manage.py bench_plantillas
+    python manage.py bench_plantillas --servicios 100 --repeticiones 500
+"""
+import timeit
+from datetime import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Engine, engines
+from django.template.loader import render_to_string
+
+from core import fragmentos
+from core.models import Disponibilidad, Empresa, Servicio
+from core.views import DIAS_ORDEN
+
+
+LOADERS_SIN_CACHE = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def plantillas():
+    """Nombres de todas las plantillas de core/templates."""
+    raiz = settings.BASE_DIR / 'core' / 'templates'
+    return sorted(str(ruta.relative_to(raiz)) for ruta in raiz.rglob('*.html'))
+
+
+def cargar_todas(engine, nombres):
+    for nombre in nombres:
+        engine.get_template(nombre)
+
+
+class Command(BaseCommand):
+    help = "Mide la carga de plantillas y el render de las páginas con fragmentos en caché."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servicios', type=int, default=30)
+        parser.add_argument('--repeticiones', type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.medir_carga(options['repeticiones'])
+        with transaction.atomic():
+            empresa, servicio = self.crear_datos(options)
+            try:
+                self.medir_paginas(empresa, servicio, options['repeticiones'])
+            finally:
+                # Los ids se revierten: que sus fragmentos no se lean nunca
+                fragmentos.invalidar_empresa(empresa.id)
+            transaction.set_rollback(True)
+
+    def fila(self, nombre, sin_cache, con_cache):
+        self.stdout.write(f"{nombre:>18} {sin_cache * 1e3:>15.3f} {con_cache * 1e3:>15.3f} {sin_cache / con_cache:>8.1f}")
+
+    def medir_carga(self, repeticiones):
+        nombres = plantillas()
+        configurado = engines['django'].engine
+        sin_cache = Engine(
+            dirs=configurado.dirs, loaders=LOADERS_SIN_CACHE, libraries=configurado.libraries,
+        )
+        cargar_todas(configurado, nombres)
+
+        self.stdout.write(f"{len(nombres)} plantillas en core/templates")
+        self.stdout.write(f"{'':>18} {'sin caché (ms)':>15} {'con caché (ms)':>15} {'x':>8}")
+        self.fila(
+            'carga',
+            timeit.timeit(lambda: cargar_todas(sin_cache, nombres), number=repeticiones) / repeticiones,
+            timeit.timeit(lambda: cargar_todas(configurado, nombres), number=repeticiones) / repeticiones,
+        )
+
+    def crear_datos(self, options):
+        user = User.objects.create_user(username='bench_plantillas')
+        empresa = Empresa.objects.create(user=user, nombre_negocio='Bench plantillas', direccion='-', telefono='-')
+        Servicio.objects.bulk_create(
+            Servicio(empresa=empresa, nombre=f'Servicio {i}', descripcion='Corte y arreglo de barba', duracion=30, precio=10 + i)
+            for i in range(options['servicios'])
+        )
+        Disponibilidad.objects.bulk_create(
+            Disponibilidad(
+                empresa=empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+                hora_inicio_t=time(14, 0), hora_fin_t=time(18, 0),
+            )
+            for dia in DIAS_ORDEN
+        )
+        return empresa, Servicio.objects.filter(empresa=empresa).first()
+
+    def medir_paginas(self, empresa, servicio, repeticiones):
+        acatalogo = async_to_sync(fragmentos.acatalogo)
+        asemana = async_to_sync(fragmentos.asemana)
+
+        def dashboard():
+            return render_to_string('dashboard_cliente.html', {
+                'empresa': empresa, 'catalogo': acatalogo(empresa.id),
+                'servicios_activos': 0, 'proximas_citas': 0,
+            })
+
+        def detalle():
+            return render_to_string('cliente/detalle_servicio.html', {
+                'empresa': empresa, 'servicio': servicio, 'semana': asemana(empresa.id, servicio.id),
+            })
+
+        def en_fallo(pagina, invalidar):
+            def medir():
+                invalidar(empresa.id)
+                pagina()
+            return medir
+
+        for nombre, pagina, invalidar in (
+            ('dashboard_cliente', dashboard, fragmentos.invalidar_catalogo),
+            ('detalle_servicio', detalle, fragmentos.invalidar_semana),
+        ):
+            fallo = timeit.timeit(en_fallo(pagina, invalidar), number=repeticiones) / repeticiones
+            pagina()
+            acierto = timeit.timeit(pagina, number=repeticiones) / repeticiones
+            self.fila(nombre, fallo, acierto)
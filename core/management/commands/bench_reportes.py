@@ -0,0 +1,131 @@
+"""
+Benchmark de los reportes sobre un volumen sintético de citas.
+
+Crea una empresa con --citas citas repartidas en los --dias anteriores a
+hoy y mide el reporte completo (core/reportes.py) de todo el rango de
+tres formas:
+
+- python:    recorrer las citas y sumar en Python (lo que se evita).
+- agregado:  agregación en la base sobre Cita.
+- resumen:   agregación sobre ResumenDiario ya materializado.
+
+Todo ocurre dentro de una transacción que se revierte al terminar, así
+que se puede correr contra una copia de la base real.
+
+    python manage.py bench_reportes --citas 1000000
+    python manage.py bench_reportes --citas 100000 --sin-python
+"""
+import random
+import time as reloj
+from collections import defaultdict
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import reportes
+from core.models import Cita, Cliente, Disponibilidad, Empresa, Servicio
+from core.views import DIAS_ORDEN
+
+
+ESTADOS = ['confirmada'] * 7 + ['cancelada'] * 2 + ['vencida']
+
+
+def medir(funcion, repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = reloj.perf_counter()
+        funcion()
+        duracion = reloj.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor
+
+
+def reporte_en_python(empresa, desde, hasta):
+    """El mismo reporte recorriendo cada cita, como referencia."""
+    ingresos = defaultdict(int)
+    semanas = defaultdict(lambda: [0, 0])
+    minutos = 0
+    citas = Cita.objects.filter(empresa=empresa, fecha__range=(desde, hasta)).select_related('servicio')
+    for cita in citas.iterator(chunk_size=5000):
+        semana = semanas[cita.fecha - timedelta(days=cita.fecha.weekday())]
+        semana[0] += 1
+        if cita.estado == 'cancelada':
+            semana[1] += 1
+            continue
+        minutos += (cita.hora_fin.hour * 60 + cita.hora_fin.minute) - (cita.hora_inicio.hour * 60 + cita.hora_inicio.minute)
+        if cita.estado == 'confirmada':
+            ingresos[cita.servicio_id] += cita.servicio.precio
+    return ingresos, semanas, minutos
+
+
+class Command(BaseCommand):
+    help = "Mide los reportes con agregación en la base y con el resumen diario."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citas', type=int, default=1_000_000)
+        parser.add_argument('--dias', type=int, default=730)
+        parser.add_argument('--servicios', type=int, default=5)
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--sin-python', action='store_true', help="Omite el recorrido en Python (lento).")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.medir_todo(options)
+            transaction.set_rollback(True)
+
+    def crear_datos(self, options):
+        rnd = random.Random(7)
+        user = User.objects.create_user(username='bench_reportes')
+        empresa = Empresa.objects.create(user=user, nombre_negocio='Bench reportes', direccion='-', telefono='-')
+        cliente = Cliente.objects.create(user=User.objects.create_user(username='bench_reportes_cliente'), telefono='-')
+        servicios = [
+            Servicio.objects.create(empresa=empresa, nombre=f'Servicio {i}', duracion=15 * (i + 1), precio=10 * (i + 1))
+            for i in range(options['servicios'])
+        ]
+        Disponibilidad.objects.bulk_create(
+            Disponibilidad(empresa=empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(20, 0))
+            for dia in DIAS_ORDEN
+        )
+
+        hasta = date.today() - timedelta(days=1)
+        desde = hasta - timedelta(days=options['dias'] - 1)
+        pendientes = options['citas']
+        while pendientes:
+            lote = []
+            for _ in range(min(pendientes, 10_000)):
+                servicio = rnd.choice(servicios)
+                fecha = desde + timedelta(days=rnd.randrange(options['dias']))
+                inicio = rnd.randrange(8 * 60, 20 * 60 - servicio.duracion)
+                fin = inicio + servicio.duracion
+                lote.append(Cita(
+                    cliente=cliente, empresa=empresa, servicio=servicio, dia=DIAS_ORDEN[fecha.weekday()], fecha=fecha,
+                    hora_inicio=time(inicio // 60, inicio % 60), hora_fin=time(fin // 60, fin % 60),
+                    estado=rnd.choice(ESTADOS),
+                ))
+            Cita.objects.bulk_create(lote)
+            pendientes -= len(lote)
+        return empresa, desde, hasta
+
+    def medir_todo(self, options):
+        inicio = reloj.perf_counter()
+        empresa, desde, hasta = self.crear_datos(options)
+        self.stdout.write(f"{options['citas']} citas en {options['dias']} días creadas en {reloj.perf_counter() - inicio:.1f} s")
+
+        repeticiones = options['repeticiones']
+        tiempos = []
+        if not options['sin_python']:
+            tiempos.append(('python', medir(lambda: reporte_en_python(empresa, desde, hasta), 1)))
+        tiempos.append(('agregado', medir(lambda: reportes.reporte(empresa, desde, hasta, 'semana'), repeticiones)))
+
+        inicio = reloj.perf_counter()
+        reportes.materializar_pendientes(empresa, hasta)
+        self.stdout.write(f"Resumen diario materializado en {reloj.perf_counter() - inicio:.1f} s")
+
+        tiempos.append(('resumen', medir(lambda: reportes.reporte(empresa, desde, hasta, 'semana'), repeticiones)))
+
+        referencia = tiempos[0][1]
+        self.stdout.write(f"{'método':>10} {'segundos':>10} {'x':>8}")
+        for nombre, segundos in tiempos:
+            self.stdout.write(f"{nombre:>10} {segundos:>10.3f} {referencia / segundos:>8.1f}")
@@ -0,0 +1,166 @@
+"""
+Prueba de carga de reservas contra la base configurada.
+
+Crea --empresas empresas de prueba con --barberos barberos cada una y
+lanza --hilos hilos que reservan franjas al azar con reservar_cita (la
+misma ruta que confirmar_cita) hasta completar --reservas intentos.
+Cada intento se trata como una petición: close_old_connections antes y
+después, así que CONN_MAX_AGE, el pool y los PRAGMA de conexión cuentan
+igual que en el servidor.
+
+Informa del motor y la configuración de conexión en uso, las reservas
+por segundo y cuántos intentos terminaron en franja ocupada o en error
+de base ("database is locked"). Para comparar configuraciones se corre
+con distintas variables de entorno (ver DATABASES en settings.py); el
+modo WAL queda guardado en el archivo, así que sin PRAGMA hay que usar
+una base nueva:
+
+    python manage.py carga_reservas --hilos 16 --reservas 2000
+    MITURNO_SQLITE_PRAGMAS=0 MITURNO_DB_NAME=/tmp/sin_wal.sqlite3 python manage.py carga_reservas
+    MITURNO_DB_ENGINE=postgresql MITURNO_DB_POOL=1 python manage.py carga_reservas
+
+Los datos de prueba se borran al terminar.
+"""
+import random
+import threading
+import time as reloj
+from collections import Counter
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+
+from core.franjas import a_hora
+from core.models import Barbero, Cliente, Disponibilidad, Empresa, Servicio
+from core.reservas import HorarioNoDisponible, reservar_cita
+from core.views import DIAS_ORDEN
+
+
+PREFIJO = 'carga_reservas'
+
+# Franjas de 30 minutos entre las 08:00 y las 20:00
+DURACION = 30
+FRANJAS = [(inicio, inicio + DURACION) for inicio in range(8 * 60, 20 * 60, DURACION)]
+
+
+def configuracion():
+    """Motor y opciones de conexión en uso, para el informe."""
+    ajustes = connection.settings_dict
+    datos = {
+        'motor': connection.vendor,
+        'CONN_MAX_AGE': ajustes['CONN_MAX_AGE'],
+        'health checks': ajustes['CONN_HEALTH_CHECKS'],
+        'pool': bool(ajustes['OPTIONS'].get('pool')),
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                datos[pragma] = cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+    return datos
+
+
+class Command(BaseCommand):
+    help = "Mide las reservas por segundo con varios hilos contra la base configurada."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--reservas', type=int, default=1000, help="Intentos de reserva en total.")
+        parser.add_argument('--empresas', type=int, default=4)
+        parser.add_argument('--barberos', type=int, default=3)
+        parser.add_argument('--dias', type=int, default=14, help="Días hacia adelante entre los que se reparte.")
+        parser.add_argument('--semilla', type=int, default=7)
+
+    def handle(self, *args, **options):
+        for opcion in ('hilos', 'reservas', 'empresas', 'dias'):
+            if options[opcion] < 1:
+                raise CommandError(f"--{opcion} debe ser mayor que cero.")
+
+        for clave, valor in configuracion().items():
+            self.stdout.write(f"{clave:>14}: {valor}")
+
+        datos = self.crear_datos(options)
+        try:
+            resultados, errores, segundos = self.lanzar(datos, options)
+        finally:
+            self.borrar_datos()
+
+        reservadas = resultados['reservada']
+        self.stdout.write(
+            f"{options['reservas']} intentos con {options['hilos']} hilos en {segundos:.2f} s: "
+            f"{reservadas} reservadas ({reservadas / segundos:.1f}/s), "
+            f"{resultados['ocupada']} ocupadas, {resultados['error']} errores de base"
+        )
+        for mensaje, veces in errores.most_common(3):
+            self.stdout.write(self.style.WARNING(f"  {veces} x {mensaje}"))
+
+    def crear_datos(self, options):
+        manana = date.today() + timedelta(days=1)
+        fechas = [manana + timedelta(days=i) for i in range(options['dias'])]
+        datos = []
+        for i in range(options['empresas']):
+            user = User.objects.create_user(username=f'{PREFIJO}_empresa_{i}')
+            empresa = Empresa.objects.create(user=user, nombre_negocio=f'Carga {i}', direccion='-', telefono='-')
+            servicio = Servicio.objects.create(empresa=empresa, nombre='Corte', duracion=DURACION, precio=10)
+            Barbero.objects.bulk_create(
+                Barbero(empresa=empresa, nombre=f'Barbero {b}') for b in range(options['barberos'])
+            )
+            Disponibilidad.objects.bulk_create(
+                Disponibilidad(empresa=empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(20, 0))
+                for dia in DIAS_ORDEN
+            )
+            datos.append((empresa, servicio))
+        clientes = [
+            Cliente.objects.create(user=User.objects.create_user(username=f'{PREFIJO}_cliente_{h}'), telefono='-')
+            for h in range(options['hilos'])
+        ]
+        return datos, fechas, clientes
+
+    def borrar_datos(self):
+        # Borrar los usuarios arrastra empresas, clientes y citas en cascada
+        User.objects.filter(username__startswith=f'{PREFIJO}_').delete()
+
+    def lanzar(self, datos, options):
+        empresas, fechas, clientes = datos
+        resultados = Counter()
+        errores_db = Counter()
+        cerrojo = threading.Lock()
+        pendientes = iter(range(options['reservas']))
+
+        def trabajar(numero):
+            rnd = random.Random(options['semilla'] + numero)
+            cliente = clientes[numero]
+            locales = Counter()
+            errores = Counter()
+            try:
+                while True:
+                    with cerrojo:
+                        if next(pendientes, None) is None:
+                            break
+                    empresa, servicio = rnd.choice(empresas)
+                    fecha = rnd.choice(fechas)
+                    inicio, fin = rnd.choice(FRANJAS)
+                    close_old_connections()
+                    try:
+                        reservar_cita(cliente, empresa, servicio, DIAS_ORDEN[fecha.weekday()], fecha, a_hora(inicio), a_hora(fin))
+                        locales['reservada'] += 1
+                    except HorarioNoDisponible:
+                        locales['ocupada'] += 1
+                    except DatabaseError as e:
+                        locales['error'] += 1
+                        errores[str(e)] += 1
+                    finally:
+                        close_old_connections()
+            finally:
+                connection.close()
+                with cerrojo:
+                    resultados.update(locales)
+                    errores_db.update(errores)
+
+        hilos = [threading.Thread(target=trabajar, args=(n,)) for n in range(options['hilos'])]
+        inicio = reloj.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resultados, errores_db, reloj.perf_counter() - inicio
@@ -0,0 +1,55 @@
+"""
+Programador de recordatorios de citas.
+
+Encola por lotes los recordatorios de las citas que empiezan dentro de la
+anticipación configurada y duerme hasta que la siguiente cita entre en la
+ventana (como mucho --espera segundos, para ver las reservas nuevas). Los
+avisos los entrega procesar_notificaciones.
+
+    python manage.py enviar_recordatorios --horas 24
+    python manage.py enviar_recordatorios --una-vez
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import recordatorios
+
+
+class Command(BaseCommand):
+    help = "Encola los recordatorios de las próximas citas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=float, default=recordatorios.ANTICIPACION.total_seconds() / 3600)
+        parser.add_argument('--lote', type=int, default=200)
+        parser.add_argument('--espera', type=float, default=60, help="Máximo de segundos entre pasadas.")
+        parser.add_argument('--una-vez', action='store_true', help="Encola lo vencido y termina.")
+
+    def handle(self, *args, **options):
+        anticipacion = timedelta(hours=options['horas'])
+        total = 0
+
+        try:
+            while True:
+                close_old_connections()
+                encoladas = recordatorios.encolar_lote(anticipacion=anticipacion, tamano=options['lote'])
+                total += encoladas
+                if encoladas:
+                    self.stdout.write(f"{encoladas} recordatorios encolados.")
+                    continue
+                if options['una_vez']:
+                    break
+                time.sleep(self.espera(anticipacion, options['espera']))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Total: {total} recordatorios encolados."))
+
+    def espera(self, anticipacion, maximo):
+        ahora = datetime.now()
+        vence = recordatorios.proximo_vencimiento(ahora, anticipacion)
+        if vence is None:
+            return maximo
+        return min(maximo, max((vence - ahora).total_seconds(), 0))
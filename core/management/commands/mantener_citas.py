@@ -0,0 +1,39 @@
+"""
+Mantenimiento periódico de citas (para cron).
+
+Marca como vencidas las citas pendientes que ya pasaron y archiva las que
+superan el horizonte de CITAS_DIAS_ARCHIVO días.
+
+    python manage.py mantener_citas
+    python manage.py mantener_citas --dias 180 --lote 1000
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import mantenimiento
+
+
+class Command(BaseCommand):
+    help = "Vence las citas pendientes pasadas y archiva las antiguas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.CITAS_DIAS_ARCHIVO,
+                            help="Antigüedad en días a partir de la cual se archiva.")
+        parser.add_argument('--lote', type=int, default=mantenimiento.LOTE)
+        parser.add_argument('--sin-archivar', action='store_true', help="Solo marca las vencidas.")
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("--lote debe ser mayor que cero.")
+
+        vencidas = mantenimiento.vencer_citas(lote=options['lote'])
+        self.stdout.write(f"{vencidas} citas vencidas.")
+
+        if not options['sin_archivar']:
+            try:
+                archivadas = mantenimiento.archivar_citas(options['dias'], lote=options['lote'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"{archivadas} citas archivadas.")
+
+        self.stdout.write(self.style.SUCCESS("Mantenimiento terminado."))
@@ -0,0 +1,31 @@
+"""
+Pone al día ResumenDiario, la tabla de la que leen los reportes los días
+cerrados (ver core/reportes.py). Conviene correrlo cada noche, después de
+mantener_citas para que las citas vencidas ya cuenten como tales.
+
+    python manage.py materializar_resumenes
+    python manage.py materializar_resumenes --rehacer
+"""
+from django.core.management.base import BaseCommand
+
+from core import reportes
+from core.models import Empresa
+
+
+class Command(BaseCommand):
+    help = "Materializa el resumen diario de citas de cada empresa hasta ayer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rehacer', action='store_true', help="Recalcula desde la primera cita de cada empresa.")
+
+    def handle(self, *args, **options):
+        total = 0
+        for empresa in Empresa.objects.order_by('id'):
+            if options['rehacer']:
+                empresa.resumen_hasta = None
+            dias = reportes.materializar_pendientes(empresa)
+            total += dias
+            if dias:
+                self.stdout.write(f"{empresa.nombre_negocio}: {dias} días resumidos.")
+
+        self.stdout.write(self.style.SUCCESS(f"Total: {total} días resumidos."))
@@ -0,0 +1,47 @@
+"""
+Worker de la bandeja de salida de notificaciones.
+
+Reclama lotes de notificaciones pendientes, los entrega con el backend de
+NOTIFICACIONES_BACKEND usando un pool de hilos y reprograma los fallos.
+Sin --una-vez se queda esperando nuevas notificaciones.
+
+    python manage.py procesar_notificaciones --hilos 8 --lote 200
+    python manage.py procesar_notificaciones --una-vez
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import notificaciones
+
+
+class Command(BaseCommand):
+    help = "Envía las notificaciones pendientes de la bandeja de salida."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4)
+        parser.add_argument('--lote', type=int, default=100)
+        parser.add_argument('--espera', type=float, default=5, help="Segundos entre consultas con la cola vacía.")
+        parser.add_argument('--una-vez', action='store_true', help="Vacía la cola y termina.")
+
+    def handle(self, *args, **options):
+        backend = notificaciones.obtener_backend()
+        total_enviadas = total_fallidas = 0
+
+        try:
+            while True:
+                close_old_connections()
+                enviadas, fallidas = notificaciones.procesar_lote(backend, options['lote'], options['hilos'])
+                total_enviadas += enviadas
+                total_fallidas += fallidas
+                if enviadas or fallidas:
+                    self.stdout.write(f"{enviadas} enviadas, {fallidas} con error.")
+                    continue
+                if options['una_vez']:
+                    break
+                time.sleep(options['espera'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Total: {total_enviadas} enviadas, {total_fallidas} con error."))
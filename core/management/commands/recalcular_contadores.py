@@ -0,0 +1,24 @@
+"""
+Reconstruye desde la base los contadores de los dashboards.
+
+Los contadores se mantienen con incrementos desde las señales; este comando
+los recalcula por completo para reparar cualquier desvío (por ejemplo tras
+actualizaciones masivas hechas fuera del ORM). Con la caché locmem por
+defecto cada proceso tiene la suya; el comando sirve con una caché
+compartida (Redis, Memcached, base de datos).
+
+    python manage.py recalcular_contadores
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core import contadores
+
+
+class Command(BaseCommand):
+    help = "Recalcula los contadores de los dashboards guardados en caché."
+
+    def handle(self, *args, **options):
+        total = contadores.recalcular_todo(date.today())
+        self.stdout.write(self.style.SUCCESS(f"{total} contadores recalculados."))
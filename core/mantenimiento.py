@@ -0,0 +1,144 @@
+"""
+Mantenimiento de la tabla de citas.
+
+- `vencer_citas`: las citas 'pendiente' cuya hora de fin ya pasó pasan a
+  'vencida' (nadie las confirmó ni canceló).
+- `archivar_citas`: las citas anteriores al horizonte (CITAS_DIAS_ARCHIVO)
+  se copian a CitaArchivada y se borran de Cita, para que la tabla que
+  consultan las franjas, las reservas y los dashboards no crezca sin
+  límite.
+
+Ambas recorren empresa por empresa, así cada lote sale del índice
+cita_empresa_fecha_idx, y trabajan por lotes de `lote` citas, cada uno en
+su propia transacción: un lote interrumpido no deja nada a medias y los
+bloqueos duran poco.
+
+Ninguna de las dos pasa por save() ni delete() de Cita, así que las
+señales no se disparan: los contadores se ajustan aquí al confirmar cada
+lote. Las franjas no cambian: una cita vencida sigue ocupando su hora
+(ya pasada) y las archivadas son de fechas anteriores a hoy.
+"""
+from datetime import date, datetime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import contadores
+from .models import Cita, CitaArchivada, Empresa, Notificacion
+
+
+# Citas por transacción
+LOTE = 500
+
+# Campos de Cita que se copian a CitaArchivada
+CAMPOS_ARCHIVO = [
+    'id', 'cliente_id', 'empresa_id', 'servicio_id', 'barbero_id',
+    'dia', 'fecha', 'hora_inicio', 'hora_fin', 'estado', 'fecha_creacion',
+]
+
+
+def _por_lotes(procesar_lote, lote):
+    """`procesar_lote` devuelve (citas leídas, citas procesadas) del lote."""
+    total = 0
+    for empresa_id in Empresa.objects.order_by('id').values_list('id', flat=True):
+        while True:
+            leidas, procesadas = procesar_lote(empresa_id)
+            total += procesadas
+            if leidas < lote:
+                break
+    return total
+
+
+# ============================================================
+# 1. CITAS VENCIDAS
+# ============================================================
+
+def citas_por_vencer(empresa_id, ahora):
+    """Citas pendientes de la empresa que terminaron antes de `ahora`."""
+    hoy = ahora.date()
+    return Cita.objects.filter(
+        Q(fecha__lt=hoy) | Q(hora_fin__lte=ahora.time()),
+        empresa_id=empresa_id,
+        fecha__lte=hoy,
+        estado='pendiente',
+    )
+
+
+def _vencer_lote(empresa_id, ahora, lote):
+    with transaction.atomic():
+        # Filas bloqueadas donde el motor lo permite; las que otra
+        # transacción tiene tomadas quedan para el siguiente lote
+        filas = list(
+            citas_por_vencer(empresa_id, ahora)
+            .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .order_by('fecha', 'hora_inicio')
+            .values_list('id', 'cliente_id', 'fecha')[:lote]
+        )
+        if not filas:
+            return 0, 0
+        leidas = len(filas)
+        ids = [id for id, _, _ in filas]
+        vencidas = Cita.objects.filter(id__in=ids, estado='pendiente').update(estado='vencida')
+        if vencidas != leidas:
+            # Sin bloqueo, una confirmación o cancelación se coló entre la
+            # lectura y el UPDATE: solo cuentan las que sí vencieron
+            cambiadas = set(Cita.objects.filter(id__in=ids, estado='vencida').values_list('id', flat=True))
+            filas = [fila for fila in filas if fila[0] in cambiadas]
+
+        def descontar():
+            hoy = date.today()
+            for _, cliente_id, fecha in filas:
+                contadores.registrar_cambio_cita((empresa_id, cliente_id, fecha), None, hoy)
+
+        transaction.on_commit(descontar)
+    return leidas, len(filas)
+
+
+def vencer_citas(ahora=None, lote=LOTE):
+    """Marca como 'vencida' las citas pendientes ya pasadas; devuelve cuántas."""
+    ahora = ahora or datetime.now()
+    return _por_lotes(lambda empresa_id: _vencer_lote(empresa_id, ahora, lote), lote)
+
+
+# ============================================================
+# 2. ARCHIVO
+# ============================================================
+
+def _archivar_lote(empresa_id, limite, lote):
+    with transaction.atomic():
+        citas = list(
+            Cita.objects.filter(empresa_id=empresa_id, fecha__lt=limite)
+            .order_by('fecha', 'hora_inicio')
+            .values(*CAMPOS_ARCHIVO)[:lote]
+        )
+        if not citas:
+            return 0, 0
+        ids = [cita.pop('id') for cita in citas]
+        CitaArchivada.objects.bulk_create(
+            CitaArchivada(id_original=id, **cita) for id, cita in zip(ids, citas)
+        )
+        # Los avisos enviados se conservan sin la cita
+        Notificacion.objects.filter(cita_id__in=ids).update(cita=None)
+        _borrar_citas(ids)
+    return len(citas), len(citas)
+
+
+def _borrar_citas(ids):
+    """
+    DELETE directo por id. delete() cargaría cada cita para enviar
+    post_delete y hacer el SET_NULL de Notificacion; lo segundo ya está
+    hecho y las señales no aplican a citas pasadas (ver arriba).
+    """
+    tabla = connection.ops.quote_name(Cita._meta.db_table)
+    columna = connection.ops.quote_name(Cita._meta.pk.column)
+    marcas = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {tabla} WHERE {columna} IN ({marcas})', ids)
+
+
+def archivar_citas(dias, hoy=None, lote=LOTE):
+    """Mueve a CitaArchivada las citas de hace más de `dias` días; devuelve cuántas."""
+    if dias < 1:
+        raise ValueError("El horizonte de archivo debe ser de al menos un día.")
+    limite = (hoy or date.today()) - timedelta(days=dias)
+    return _por_lotes(lambda empresa_id: _archivar_lote(empresa_id, limite, lote), lote)
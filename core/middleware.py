@@ -0,0 +1,190 @@
+"""
+Resolución de la empresa (tenant) de cada petición.
+
+EmpresaActualMiddleware deja en `request.empresa` la barbería que se está
+visitando, resuelta en este orden:
+
+1. `?empresa=<slug>` en la URL (se recuerda en la sesión).
+2. El slug guardado en la sesión.
+3. El subdominio del host: `<slug>.midominio.com`.
+4. La empresa por defecto (la primera registrada), para instalaciones
+   de una sola barbería.
+
+Las empresas encontradas se guardan en una caché LRU en memoria del
+proceso, con TTL (EMPRESA_CACHE_TTL) y como mucho EMPRESA_CACHE_MAX
+entradas, que se vacía al guardar o eliminar una Empresa. Los slugs que
+no existen no se guardan: vienen del cliente y llenarían la caché.
+
+El middleware funciona en modo síncrono y async: bajo ASGI no obliga a
+pasar las vistas async por un hilo.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .models import Empresa
+
+
+# ============================================================
+# 1. CACHÉ EN PROCESO
+# ============================================================
+
+_POR_DEFECTO = object()
+
+
+class _CacheEmpresas:
+    def __init__(self):
+        # Del uso menos reciente al más reciente
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vigente(self, clave, ahora):
+        """La entrada (empresa, vence) si no ha vencido, o None."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[1] <= ahora:
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return entrada
+
+    def _guardar(self, clave, empresa, ahora):
+        if empresa is None:
+            return None
+        ttl = getattr(settings, 'EMPRESA_CACHE_TTL', 60)
+        maximo = getattr(settings, 'EMPRESA_CACHE_MAX', 1000)
+        with self._lock:
+            self._datos[clave] = (empresa, ahora + ttl)
+            self._datos.move_to_end(clave)
+            # Vencidas y, si sobra, las de uso menos reciente
+            while self._datos:
+                vence = next(iter(self._datos.values()))[1]
+                if vence > ahora and len(self._datos) <= maximo:
+                    break
+                self._datos.popitem(last=False)
+        return empresa
+
+    def obtener(self, clave, cargar):
+        ahora = time.monotonic()
+        entrada = self._vigente(clave, ahora)
+        if entrada:
+            return entrada[0]
+        return self._guardar(clave, cargar(), ahora)
+
+    async def aobtener(self, clave, cargar):
+        ahora = time.monotonic()
+        entrada = self._vigente(clave, ahora)
+        if entrada:
+            return entrada[0]
+        return self._guardar(clave, await cargar(), ahora)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_cache = _CacheEmpresas()
+
+
+def invalidar_empresas():
+    """Vacía la caché; se llama desde las señales de Empresa."""
+    _cache.limpiar()
+
+
+def empresa_por_slug(slug):
+    return _cache.obtener(slug, lambda: Empresa.objects.filter(slug=slug).first())
+
+
+def empresa_por_defecto():
+    return _cache.obtener(_POR_DEFECTO, lambda: Empresa.objects.order_by('id').first())
+
+
+async def aempresa_por_slug(slug):
+    return await _cache.aobtener(slug, lambda: Empresa.objects.filter(slug=slug).afirst())
+
+
+async def aempresa_por_defecto():
+    return await _cache.aobtener(_POR_DEFECTO, lambda: Empresa.objects.order_by('id').afirst())
+
+
+def _slug_del_host(request):
+    host = request.get_host().split(':')[0]
+    if '.' not in host or host.replace('.', '').isdigit():
+        return None
+    subdominio = host.split('.')[0]
+    return None if subdominio == 'www' else subdominio
+
+
+def resolver_empresa(request):
+    slug = request.GET.get('empresa')
+    if slug:
+        empresa = empresa_por_slug(slug)
+        if empresa:
+            request.session['empresa_slug'] = slug
+            return empresa
+
+    slug = request.session.get('empresa_slug')
+    if slug:
+        empresa = empresa_por_slug(slug)
+        if empresa:
+            return empresa
+
+    slug = _slug_del_host(request)
+    if slug:
+        empresa = empresa_por_slug(slug)
+        if empresa:
+            return empresa
+
+    return empresa_por_defecto()
+
+
+async def aresolver_empresa(request):
+    """Versión async de resolver_empresa (mismo orden)."""
+    slug = request.GET.get('empresa')
+    if slug:
+        empresa = await aempresa_por_slug(slug)
+        if empresa:
+            await request.session.aset('empresa_slug', slug)
+            return empresa
+
+    for slug in (await request.session.aget('empresa_slug'), _slug_del_host(request)):
+        if slug:
+            empresa = await aempresa_por_slug(slug)
+            if empresa:
+                return empresa
+
+    return await aempresa_por_defecto()
+
+
+# ============================================================
+# 2. MIDDLEWARE
+# ============================================================
+
+class EmpresaActualMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        empresa = resolver_empresa(request)
+        # Copia por petición: la instancia en caché se comparte entre hilos
+        request.empresa = copy.copy(empresa) if empresa else None
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        empresa = await aresolver_empresa(request)
+        request.empresa = copy.copy(empresa) if empresa else None
+        return await self.get_response(request)
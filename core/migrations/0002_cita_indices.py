@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(condition=models.Q(('estado', 'cancelada'), _negated=True), fields=['empresa', 'fecha', 'hora_inicio'], name='cita_agenda_activa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['empresa', 'fecha', 'hora_inicio'], name='cita_empresa_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['cliente', 'fecha', 'hora_inicio'], name='cita_cliente_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0002_cita_indices'),
+    ]
+
+    operations = [
+        # auth_user.email no tiene índice; la búsqueda de clientes lo usa
+        migrations.RunSQL(
+            'CREATE INDEX core_auth_user_email_idx ON auth_user (email)',
+            reverse_sql='DROP INDEX core_auth_user_email_idx',
+        ),
+        migrations.AlterField(
+            model_name='cliente',
+            name='telefono',
+            field=models.CharField(db_index=True, max_length=15),
+        ),
+    ]
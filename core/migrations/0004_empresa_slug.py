@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:59
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def asignar_slugs(apps, schema_editor):
+    Empresa = apps.get_model('core', 'Empresa')
+    usados = set()
+    for empresa in Empresa.objects.order_by('id'):
+        base = slugify(empresa.nombre_negocio) or 'empresa'
+        slug, n = base, 2
+        while slug in usados:
+            slug, n = f"{base}-{n}", n + 1
+        usados.add(slug)
+        empresa.slug = slug
+        empresa.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_busqueda_clientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=110, null=True),
+        ),
+        migrations.RunPython(asignar_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='empresa',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=110, unique=True),
+        ),
+    ]
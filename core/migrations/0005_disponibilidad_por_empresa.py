@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_empresa_slug'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='disponibilidad',
+            name='dia',
+            field=models.CharField(choices=[('lunes', 'Lunes'), ('martes', 'Martes'), ('miercoles', 'Miércoles'), ('jueves', 'Jueves'), ('viernes', 'Viernes'), ('sabado', 'Sábado'), ('domingo', 'Domingo')], max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='disponibilidad',
+            constraint=models.UniqueConstraint(fields=('empresa', 'dia'), name='disponibilidad_empresa_dia_unica'),
+        ),
+    ]
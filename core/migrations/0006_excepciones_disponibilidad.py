@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_disponibilidad_por_empresa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcepcionDisponibilidad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cierre', 'Cierre'), ('extra', 'Horario extra'), ('descanso', 'Descanso')], max_length=10)),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, null=True)),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=100)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excepciones', to='core.empresa')),
+            ],
+            options={
+                'ordering': ['fecha_inicio', 'hora_inicio'],
+                'indexes': [models.Index(fields=['empresa', 'fecha_fin', 'fecha_inicio'], name='excepcion_empresa_fechas_idx')],
+            },
+        ),
+    ]
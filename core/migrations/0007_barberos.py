@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def asignar_barbero_principal(apps, schema_editor):
+    """Un barbero por empresa con todas sus citas: la capacidad sigue siendo una silla."""
+    Empresa = apps.get_model('core', 'Empresa')
+    Barbero = apps.get_model('core', 'Barbero')
+    Cita = apps.get_model('core', 'Cita')
+    for empresa in Empresa.objects.all():
+        barbero = Barbero.objects.create(empresa=empresa, nombre='Principal')
+        Cita.objects.filter(empresa=empresa).update(barbero=barbero)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_excepciones_disponibilidad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Barbero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('activo', models.BooleanField(default=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='barberos', to='core.empresa')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cita',
+            name='barbero',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='citas', to='core.barbero'),
+        ),
+        migrations.RunPython(asignar_barbero_principal, migrations.RunPython.noop),
+    ]
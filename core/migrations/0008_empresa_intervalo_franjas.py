@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_barberos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='intervalo_franjas',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(5, 'Cada 5 minutos'), (10, 'Cada 10 minutos'), (15, 'Cada 15 minutos'), (20, 'Cada 20 minutos'), (30, 'Cada 30 minutos'), (60, 'Cada hora')], null=True),
+        ),
+    ]
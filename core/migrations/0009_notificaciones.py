@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_empresa_intervalo_franjas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evento', models.CharField(choices=[('reservada', 'Cita reservada'), ('confirmada', 'Cita confirmada'), ('cancelada', 'Cita cancelada')], max_length=10)),
+                ('canal', models.CharField(choices=[('email', 'Correo'), ('sms', 'SMS')], max_length=5)),
+                ('destinatario', models.CharField(max_length=254)),
+                ('asunto', models.CharField(max_length=150)),
+                ('mensaje', models.TextField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviada', 'Enviada'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField()),
+                ('lote', models.CharField(blank=True, max_length=32)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+                ('cita', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notificaciones', to='core.cita')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('estado__in', ['pendiente', 'enviando'])), fields=['proximo_intento'], name='notificacion_cola_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_notificaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='recordatorio_enviado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='notificacion',
+            name='evento',
+            field=models.CharField(choices=[('reservada', 'Cita reservada'), ('confirmada', 'Cita confirmada'), ('cancelada', 'Cita cancelada'), ('recordatorio', 'Recordatorio')], max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(condition=models.Q(('recordatorio_enviado', False), models.Q(('estado', 'cancelada'), _negated=True)), fields=['fecha', 'hora_inicio'], name='cita_recordatorio_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('evento', 'recordatorio')), fields=('cita', 'evento'), name='notificacion_recordatorio_unico'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_citas_vencidas_y_archivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='resumen_hasta',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('confirmadas', models.PositiveIntegerField(default=0)),
+                ('canceladas', models.PositiveIntegerField(default=0)),
+                ('vencidas', models.PositiveIntegerField(default=0)),
+                ('minutos', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='core.empresa')),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='core.servicio')),
+            ],
+            options={
+                'ordering': ['fecha'],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'fecha', 'servicio'), name='resumen_empresa_fecha_servicio_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0012_resumen_diario'),
+    ]
+
+    operations = [
+        # La búsqueda de clientes compara LOWER(username) y LOWER(email)
+        # (ver core/busqueda.py); el índice de email sin LOWER ya no se usa
+        migrations.RunSQL(
+            'CREATE INDEX core_auth_user_username_lower_idx ON auth_user (LOWER(username))',
+            reverse_sql='DROP INDEX core_auth_user_username_lower_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_auth_user_email_lower_idx ON auth_user (LOWER(email))',
+            reverse_sql='DROP INDEX core_auth_user_email_lower_idx',
+        ),
+        migrations.RunSQL(
+            'DROP INDEX core_auth_user_email_idx',
+            reverse_sql='CREATE INDEX core_auth_user_email_idx ON auth_user (email)',
+        ),
+    ]
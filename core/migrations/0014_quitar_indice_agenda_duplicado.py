@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_busqueda_sin_mayusculas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cita',
+            name='cita_agenda_activa_idx',
+        ),
+    ]
@@ -1,10 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils.text import slugify
 
 # Cliente (usuario final)
 class Cliente(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    telefono = models.CharField(max_length=15)
+    telefono = models.CharField(max_length=15, db_index=True)
     fecha_registro = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -13,15 +14,44 @@ class Cliente(models.Model):
 
 # Empresa / Barbería
 class Empresa(models.Model):
+    INTERVALOS_FRANJAS = [
+        (5, 'Cada 5 minutos'),
+        (10, 'Cada 10 minutos'),
+        (15, 'Cada 15 minutos'),
+        (20, 'Cada 20 minutos'),
+        (30, 'Cada 30 minutos'),
+        (60, 'Cada hora'),
+    ]
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     nombre_negocio = models.CharField(max_length=100)
+    # Identifica a la empresa en la URL o el subdominio (ver core/middleware.py)
+    slug = models.SlugField(max_length=110, unique=True, blank=True)
     direccion = models.CharField(max_length=150)
     telefono = models.CharField(max_length=15)
+    # Minutos entre inicios de franja; vacío: cada franja empieza donde acaba la anterior
+    intervalo_franjas = models.PositiveSmallIntegerField(choices=INTERVALOS_FRANJAS, blank=True, null=True)
+    # Último día con ResumenDiario completo (ver core/reportes.py)
+    resumen_hasta = models.DateField(blank=True, null=True, editable=False)
     fecha_registro = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slug_disponible(self.nombre_negocio, excluir_id=self.pk)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.nombre_negocio
 
+
+def slug_disponible(nombre, excluir_id=None):
+    """Slug del nombre del negocio, con sufijo numérico si ya está en uso."""
+    base = slugify(nombre) or 'empresa'
+    slug, n = base, 2
+    while Empresa.objects.filter(slug=slug).exclude(pk=excluir_id).exists():
+        slug, n = f"{base}-{n}", n + 1
+    return slug
+
 # Servicio ofrecido por la empresa
 class Servicio(models.Model):
     empresa = models.ForeignKey('Empresa', on_delete=models.CASCADE, related_name='servicios')
@@ -39,6 +69,20 @@ class Servicio(models.Model):
         return f"{self.nombre} ({self.empresa.nombre_negocio})"
     
 
+# Barbero / silla: cada cita ocupa a uno
+class Barbero(models.Model):
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='barberos')
+    nombre = models.CharField(max_length=100)
+    activo = models.BooleanField(default=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.nombre} ({self.empresa.nombre_negocio})"
+
+
 # Disponibilidad semanal por día 
 class Disponibilidad(models.Model):
     DIAS_SEMANA = [
@@ -52,7 +96,7 @@ class Disponibilidad(models.Model):
     ]
 
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='disponibilidades')
-    dia = models.CharField(max_length=10, choices=DIAS_SEMANA, unique=True)
+    dia = models.CharField(max_length=10, choices=DIAS_SEMANA)
 
     # Jornada de la mañana
     hora_inicio_m = models.TimeField(blank=True, null=True)
@@ -65,22 +109,61 @@ class Disponibilidad(models.Model):
 
     class Meta:
         ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'dia'], name='disponibilidad_empresa_dia_unica'),
+        ]
 
     def __str__(self):
         return f"{self.get_dia_display()} (M: {self.hora_inicio_m}-{self.hora_fin_m} / T: {self.hora_inicio_t}-{self.hora_fin_t})"
 
 
+# Excepción a la semana tipo en un rango de fechas (festivos, horario extendido, descansos)
+class ExcepcionDisponibilidad(models.Model):
+    TIPOS = [
+        ('cierre', 'Cierre'),
+        ('extra', 'Horario extra'),
+        ('descanso', 'Descanso'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='excepciones')
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+
+    # Rango de fechas, ambos extremos incluidos
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+
+    # Rango horario de 'extra' y 'descanso'; un 'cierre' cubre el día completo
+    hora_inicio = models.TimeField(blank=True, null=True)
+    hora_fin = models.TimeField(blank=True, null=True)
+
+    motivo = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['fecha_inicio', 'hora_inicio']
+        indexes = [
+            # Excepciones que tocan un rango de fechas (ver core/calendario.py)
+            models.Index(fields=['empresa', 'fecha_fin', 'fecha_inicio'], name='excepcion_empresa_fechas_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.fecha_inicio} - {self.fecha_fin} ({self.empresa})"
+
+
 # Cita / Reserva
 class Cita(models.Model):
     ESTADOS = [
         ('pendiente', 'Pendiente'),
         ('confirmada', 'Confirmada'),
         ('cancelada', 'Cancelada'),
+        # Pendiente cuya hora ya pasó (ver core/mantenimiento.py)
+        ('vencida', 'Vencida'),
     ]
 
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='citas')
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='citas')
     servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='citas')
+    # Sin barbero asignado la cita ocupa todas las sillas (ver core/franjas.py)
+    barbero = models.ForeignKey(Barbero, on_delete=models.SET_NULL, null=True, blank=True, related_name='citas')
 
     # Guardamos el día “lógico” (lunes, martes, etc.) y la fecha real
     dia = models.CharField(max_length=10, choices=Disponibilidad.DIAS_SEMANA)
@@ -89,10 +172,139 @@ class Cita(models.Model):
     hora_fin = models.TimeField()
 
     estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    # Ya se encoló el recordatorio (ver core/recordatorios.py)
+    recordatorio_enviado = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['fecha', 'hora_inicio']
+        indexes = [
+            # Agenda del día (franjas libres, reserva) y panel de la empresa:
+            # listado, filtros por fecha y dashboard
+            models.Index(fields=['empresa', 'fecha', 'hora_inicio'], name='cita_empresa_fecha_idx'),
+            # Citas del cliente: mis citas y dashboard del cliente
+            models.Index(fields=['cliente', 'fecha', 'hora_inicio'], name='cita_cliente_fecha_idx'),
+            # Recordatorios: solo las citas activas que aún no se recordaron
+            models.Index(
+                fields=['fecha', 'hora_inicio'],
+                condition=models.Q(recordatorio_enviado=False) & ~models.Q(estado='cancelada'),
+                name='cita_recordatorio_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Cita de {self.cliente} para {self.servicio} el {self.fecha} a las {self.hora_inicio}"
+
+
+# Cita antigua sacada de la tabla de citas (ver core/mantenimiento.py)
+class CitaArchivada(models.Model):
+    # id que tenía en Cita
+    id_original = models.BigIntegerField()
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='citas_archivadas')
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='citas_archivadas')
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='citas_archivadas')
+    barbero = models.ForeignKey(Barbero, on_delete=models.SET_NULL, null=True, blank=True, related_name='citas_archivadas')
+
+    dia = models.CharField(max_length=10, choices=Disponibilidad.DIAS_SEMANA)
+    fecha = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+
+    estado = models.CharField(max_length=10, choices=Cita.ESTADOS)
+    fecha_creacion = models.DateTimeField()
+    fecha_archivo = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['fecha', 'hora_inicio']
+        indexes = [
+            models.Index(fields=['empresa', 'fecha', 'hora_inicio'], name='cita_archivada_empresa_idx'),
+        ]
+
+    def __str__(self):
+        return f"Cita archivada de {self.cliente} el {self.fecha} a las {self.hora_inicio}"
+
+
+# Totales de un servicio en un día, precalculados para los reportes (ver core/reportes.py)
+class ResumenDiario(models.Model):
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='resumenes')
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='resumenes')
+    fecha = models.DateField()
+
+    total = models.PositiveIntegerField(default=0)
+    confirmadas = models.PositiveIntegerField(default=0)
+    canceladas = models.PositiveIntegerField(default=0)
+    vencidas = models.PositiveIntegerField(default=0)
+    # Minutos de las citas no canceladas
+    minutos = models.PositiveIntegerField(default=0)
+    # Precio de las citas confirmadas
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'fecha', 'servicio'], name='resumen_empresa_fecha_servicio_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.servicio} el {self.fecha}: {self.total} citas"
+
+
+# Notificación pendiente de envío (outbox): se escribe en la misma transacción
+# que el cambio de la cita y la envía el comando procesar_notificaciones
+class Notificacion(models.Model):
+    EVENTOS = [
+        ('reservada', 'Cita reservada'),
+        ('confirmada', 'Cita confirmada'),
+        ('cancelada', 'Cita cancelada'),
+        ('recordatorio', 'Recordatorio'),
+    ]
+    CANALES = [
+        ('email', 'Correo'),
+        ('sms', 'SMS'),
+    ]
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviada', 'Enviada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    cita = models.ForeignKey(Cita, on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones')
+    evento = models.CharField(max_length=15, choices=EVENTOS)
+    canal = models.CharField(max_length=5, choices=CANALES)
+    destinatario = models.CharField(max_length=254)
+    asunto = models.CharField(max_length=150)
+    mensaje = models.TextField()
+
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    # Cuándo puede tomarla el worker (reintentos y reclamos vencidos)
+    proximo_intento = models.DateTimeField()
+    # Identifica el lote del worker que la reclamó
+    lote = models.CharField(max_length=32, blank=True)
+    ultimo_error = models.TextField(blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Cola del worker: solo las que falta enviar
+            models.Index(
+                fields=['proximo_intento'],
+                condition=models.Q(estado__in=['pendiente', 'enviando']),
+                name='notificacion_cola_idx',
+            ),
+        ]
+        constraints = [
+            # Un solo recordatorio por cita aunque corran dos programadores
+            models.UniqueConstraint(
+                fields=['cita', 'evento'],
+                condition=models.Q(evento='recordatorio'),
+                name='notificacion_recordatorio_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_evento_display()} → {self.destinatario} ({self.estado})"
@@ -0,0 +1,259 @@
+"""
+Notificaciones de citas con bandeja de salida (outbox).
+
+Las vistas que reservan, confirman o cancelan una cita llaman a `encolar`
+dentro de la misma transacción que el cambio de estado: si la transacción
+se revierte no queda ningún aviso y si se confirma el aviso ya está en la
+tabla, sin haber hablado con ningún proveedor durante la petición.
+
+El comando `procesar_notificaciones` vacía la cola: reclama un lote,
+lo reparte entre varios hilos que lo entregan al backend configurado
+(NOTIFICACIONES_BACKEND) y reprograma los fallos con espera exponencial
+hasta MAX_INTENTOS. Un lote cuyo worker murió cuenta como un intento al
+volver a reclamarse, así un aviso que tumba al worker siempre termina
+como fallido.
+"""
+import json
+import sys
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notificacion
+
+
+# Intentos antes de dar una notificación por fallida
+MAX_INTENTOS = 5
+
+# Espera antes del primer reintento; se duplica en cada fallo
+ESPERA_REINTENTO = timedelta(minutes=1)
+
+# Un lote reclamado por un worker que murió vuelve a la cola tras este tiempo
+BLOQUEO_LOTE = timedelta(minutes=5)
+
+ERROR_BLOQUEO = "El worker no registró el resultado (bloqueo vencido)."
+
+ASUNTOS = {
+    'reservada': "Tu cita fue reservada",
+    'confirmada': "Tu cita fue confirmada",
+    'cancelada': "Tu cita fue cancelada",
+    'recordatorio': "Recordatorio de tu cita",
+}
+
+
+# ============================================================
+# 1. ENCOLAR
+# ============================================================
+
+def _mensaje(cita, evento):
+    detalle = (
+        f"tu cita de {cita.servicio.nombre} en {cita.empresa.nombre_negocio} "
+        f"el {cita.fecha:%d/%m/%Y} a las {cita.hora_inicio:%H:%M}"
+    )
+    if evento == 'recordatorio':
+        return f"Hola {cita.cliente.user.username}: te recordamos {detalle}."
+    return f"Hola {cita.cliente.user.username}: {detalle} fue {evento}."
+
+
+def _para_cliente(cita, evento, ahora):
+    email = cita.cliente.user.email
+    return Notificacion(
+        cita=cita,
+        evento=evento,
+        canal='email' if email else 'sms',
+        destinatario=email or cita.cliente.telefono,
+        asunto=ASUNTOS[evento],
+        mensaje=_mensaje(cita, evento),
+        proximo_intento=ahora,
+    )
+
+
+def encolar(citas, evento, ignorar_duplicados=False):
+    """
+    Guarda un aviso al cliente de cada cita para `evento`.
+
+    Debe llamarse dentro de la transacción que cambia las citas; las citas
+    deberían traer cliente__user, servicio y empresa (select_related) para
+    no consultar por cada una. Con `ignorar_duplicados` los avisos que ya
+    existen (recordatorios, ver la restricción en el modelo) se omiten.
+    """
+    ahora = timezone.now()
+    return Notificacion.objects.bulk_create(
+        [_para_cliente(cita, evento, ahora) for cita in citas],
+        ignore_conflicts=ignorar_duplicados,
+    )
+
+
+# ============================================================
+# 2. BACKENDS
+# ============================================================
+
+class BackendBase(ABC):
+    """Entrega un lote; devuelve {id: error} con los que fallaron."""
+
+    @abstractmethod
+    def enviar(self, notificacion):
+        """Entrega un aviso; cualquier excepción lo marca como fallido."""
+
+    def enviar_lote(self, notificaciones):
+        """Por defecto, `enviar` uno a uno; un backend con envío masivo la redefine."""
+        errores = {}
+        for notificacion in notificaciones:
+            try:
+                self.enviar(notificacion)
+            except Exception as e:
+                errores[notificacion.id] = str(e) or e.__class__.__name__
+        return errores
+
+
+class BackendConsola(BackendBase):
+    """Escribe cada aviso en la salida estándar (desarrollo)."""
+
+    def __init__(self, salida=None):
+        self.salida = salida or sys.stdout
+        self._lock = threading.Lock()
+
+    def enviar(self, notificacion):
+        with self._lock:
+            self.salida.write(
+                f"[{notificacion.canal}] {notificacion.destinatario} | {notificacion.asunto}\n"
+                f"{notificacion.mensaje}\n\n"
+            )
+
+
+class BackendArchivo(BackendBase):
+    """Agrega cada aviso como una línea JSON a NOTIFICACIONES_ARCHIVO."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or settings.NOTIFICACIONES_ARCHIVO
+
+    def enviar(self, notificacion):
+        self._escribir([notificacion])
+
+    def enviar_lote(self, notificaciones):
+        self._escribir(notificaciones)
+        return {}
+
+    def _escribir(self, notificaciones):
+        lineas = [
+            json.dumps({
+                'id': n.id,
+                'evento': n.evento,
+                'canal': n.canal,
+                'destinatario': n.destinatario,
+                'asunto': n.asunto,
+                'mensaje': n.mensaje,
+            }, ensure_ascii=False) + "\n"
+            for n in notificaciones
+        ]
+        # Una sola escritura por lote
+        with self._lock, open(self.ruta, 'a', encoding='utf-8') as archivo:
+            archivo.writelines(lineas)
+
+
+def obtener_backend():
+    return import_string(settings.NOTIFICACIONES_BACKEND)()
+
+
+# ============================================================
+# 3. WORKER
+# ============================================================
+
+def reclamar_lote(tamano):
+    """
+    Marca como 'enviando' hasta `tamano` notificaciones listas y las
+    devuelve. Los UPDATE condicionales evitan que dos workers tomen la
+    misma.
+
+    Una 'enviando' con el bloqueo vencido es un intento que no terminó:
+    suma uno a `intentos` y, si llega a MAX_INTENTOS, pasa a 'fallida' en
+    lugar de volver a reclamarse.
+    """
+    ahora = timezone.now()
+    ids = list(
+        Notificacion.objects.filter(estado__in=['pendiente', 'enviando'], proximo_intento__lte=ahora)
+        .order_by('proximo_intento')
+        .values_list('id', flat=True)[:tamano]
+    )
+    if not ids:
+        return []
+
+    lote = uuid.uuid4().hex
+    listas = Notificacion.objects.filter(id__in=ids)
+    vencidas = listas.filter(estado='enviando', proximo_intento__lte=ahora)
+    vencidas.filter(intentos__gte=MAX_INTENTOS - 1).update(
+        estado='fallida', intentos=F('intentos') + 1, ultimo_error=ERROR_BLOQUEO,
+    )
+    vencidas.update(
+        estado='enviando', lote=lote, proximo_intento=ahora + BLOQUEO_LOTE,
+        intentos=F('intentos') + 1, ultimo_error=ERROR_BLOQUEO,
+    )
+    listas.filter(estado='pendiente').update(estado='enviando', lote=lote, proximo_intento=ahora + BLOQUEO_LOTE)
+    return list(Notificacion.objects.filter(lote=lote, estado='enviando'))
+
+
+def _partir(lista, partes):
+    tamano = -(-len(lista) // partes)
+    return [lista[i:i + tamano] for i in range(0, len(lista), tamano)]
+
+
+def _enviar_parte(backend, notificaciones):
+    try:
+        return backend.enviar_lote(notificaciones)
+    except Exception as e:
+        # El backend falló con toda la parte: se reintentan todas
+        return {n.id: str(e) or e.__class__.__name__ for n in notificaciones}
+
+
+def entregar(backend, notificaciones, hilos=4):
+    """Reparte el lote entre `hilos` y devuelve {id: error} de los fallidos."""
+    if hilos <= 1 or len(notificaciones) <= 1:
+        return _enviar_parte(backend, notificaciones)
+
+    errores = {}
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        partes = _partir(notificaciones, hilos)
+        for resultado in pool.map(_enviar_parte, [backend] * len(partes), partes):
+            errores.update(resultado)
+    return errores
+
+
+def registrar_resultado(notificaciones, errores):
+    """Marca las enviadas con un UPDATE y reprograma las fallidas."""
+    ahora = timezone.now()
+    enviadas = [n.id for n in notificaciones if n.id not in errores]
+    if enviadas:
+        Notificacion.objects.filter(id__in=enviadas).update(estado='enviada', fecha_envio=ahora, ultimo_error='')
+
+    fallidas = [n for n in notificaciones if n.id in errores]
+    for n in fallidas:
+        n.intentos += 1
+        n.ultimo_error = errores[n.id]
+        if n.intentos >= MAX_INTENTOS:
+            n.estado = 'fallida'
+        else:
+            n.estado = 'pendiente'
+            n.proximo_intento = ahora + ESPERA_REINTENTO * 2 ** (n.intentos - 1)
+    if fallidas:
+        Notificacion.objects.bulk_update(fallidas, ['estado', 'intentos', 'ultimo_error', 'proximo_intento'])
+
+    return len(enviadas), len(fallidas)
+
+
+def procesar_lote(backend, tamano=100, hilos=4):
+    """Un ciclo del worker; devuelve (enviadas, fallidas)."""
+    notificaciones = reclamar_lote(tamano)
+    if not notificaciones:
+        return 0, 0
+    # Los hilos solo hablan con el backend; la base la toca este hilo
+    errores = entregar(backend, notificaciones, hilos)
+    return registrar_resultado(notificaciones, errores)
@@ -0,0 +1,103 @@
+"""
+Paginación por clave (keyset / cursor).
+
+En lugar de OFFSET, cada página pide las filas posteriores (o anteriores)
+a la última clave vista, así el coste de una página no depende de cuántas
+filas hay antes. La clave debe ser única: el último campo suele ser 'id'.
+
+El cursor viaja en la URL, así que sus valores se convierten al tipo de
+cada campo antes de filtrar: uno manipulado cuenta como inválido y se
+vuelve a la primera página.
+"""
+import base64
+import json
+from functools import reduce
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def codificar_cursor(valores):
+    texto = json.dumps([str(v) for v in valores])
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _campo(modelo, ruta):
+    """Campo del modelo al que apunta una ruta 'a__b__c'."""
+    *relaciones, nombre = ruta.split('__')
+    for relacion in relaciones:
+        modelo = modelo._meta.get_field(relacion).related_model
+    return modelo._meta.get_field(nombre)
+
+
+def decodificar_cursor(cursor, num_campos):
+    """Valores de la clave (sin convertir) o None si el cursor no es válido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != num_campos:
+        return None
+    return valores
+
+
+def _valores_cursor(cursor, modelo, campos):
+    """Valores de la clave convertidos al tipo de cada campo, o None."""
+    valores = decodificar_cursor(cursor, len(campos)) if cursor else None
+    if valores is None:
+        return None
+    try:
+        return [_campo(modelo, campo).to_python(valor) for campo, valor in zip(campos, valores)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+
+
+def _clave(objeto, campos):
+    return [attrgetter(campo.replace('__', '.'))(objeto) for campo in campos]
+
+
+def _filtro_clave(campos, valores, operador):
+    """
+    (c1, c2, ..., cn) > (v1, v2, ..., vn) expandido en Q.
+
+    El primer campo va además como c1 >= v1 (o <=) para que el motor pueda
+    posicionarse en el índice antes de evaluar el OR.
+    """
+    alternativas = []
+    for i, campo in enumerate(campos):
+        iguales = {c: v for c, v in zip(campos[:i], valores[:i])}
+        alternativas.append(Q(**iguales, **{f'{campo}__{operador}': valores[i]}))
+    return Q(**{f'{campos[0]}__{operador}e': valores[0]}) & reduce(lambda a, b: a | b, alternativas)
+
+
+def paginar_por_clave(queryset, campos, despues=None, antes=None, tamano=50):
+    """
+    Devuelve (objetos, cursor_anterior, cursor_siguiente) de una página.
+
+    `campos` son los campos de la clave en orden ascendente; los cursores
+    son None cuando no hay página en esa dirección.
+    """
+    campos = list(campos)
+    valores_antes = _valores_cursor(antes, queryset.model, campos)
+    valores_despues = _valores_cursor(despues, queryset.model, campos)
+
+    if valores_antes:
+        qs = queryset.filter(_filtro_clave(campos, valores_antes, 'lt'))
+        objetos = list(qs.order_by(*[f'-{c}' for c in campos])[:tamano + 1])
+        hay_anterior = len(objetos) > tamano
+        objetos = objetos[:tamano][::-1]
+        hay_siguiente = True
+    else:
+        qs = queryset
+        if valores_despues:
+            qs = qs.filter(_filtro_clave(campos, valores_despues, 'gt'))
+        objetos = list(qs.order_by(*campos)[:tamano + 1])
+        hay_siguiente = len(objetos) > tamano
+        objetos = objetos[:tamano]
+        hay_anterior = bool(valores_despues)
+
+    cursor_anterior = codificar_cursor(_clave(objetos[0], campos)) if objetos and hay_anterior else None
+    cursor_siguiente = codificar_cursor(_clave(objetos[-1], campos)) if objetos and hay_siguiente else None
+    return objetos, cursor_anterior, cursor_siguiente
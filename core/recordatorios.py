@@ -0,0 +1,74 @@
+"""
+Recordatorios de citas.
+
+Una cita se recuerda cuando empieza dentro de las próximas ANTICIPACION
+horas. El programador no recorre la tabla de citas: las que faltan por
+recordar están en el índice parcial cita_recordatorio_idx (citas activas
+sin recordatorio) y cada pasada lee solo el tramo (fecha, hora_inicio)
+entre ahora y ahora + ANTICIPACION, por lotes y para todas las empresas.
+
+Cada lote encola los avisos en la bandeja de salida (core/notificaciones.py)
+y marca las citas en la misma transacción. La restricción única de
+recordatorios en Notificacion hace que repetir un lote, o correr dos
+programadores a la vez, no duplique avisos.
+"""
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Cita
+from .notificaciones import encolar
+
+
+# Cuánto antes de la cita se envía el recordatorio
+ANTICIPACION = timedelta(hours=24)
+
+
+def _sin_recordar():
+    return Cita.objects.filter(Q(recordatorio_enviado=False) & ~Q(estado='cancelada'))
+
+
+def por_recordar(ahora, anticipacion=ANTICIPACION):
+    """Citas sin recordar que empiezan en (ahora, ahora + anticipacion]."""
+    hasta = ahora + anticipacion
+    return _sin_recordar().filter(
+        Q(fecha__gt=ahora.date()) | Q(hora_inicio__gt=ahora.time()),
+        Q(fecha__lt=hasta.date()) | Q(hora_inicio__lte=hasta.time()),
+        fecha__range=(ahora.date(), hasta.date()),
+    )
+
+
+def proximo_vencimiento(ahora, anticipacion=ANTICIPACION):
+    """
+    Momento en que la siguiente cita fuera de la ventana necesitará su
+    recordatorio, o None si no hay ninguna. Lee una sola fila del índice.
+    """
+    hasta = ahora + anticipacion
+    siguiente = (
+        _sin_recordar()
+        .filter(Q(fecha__gt=hasta.date()) | Q(hora_inicio__gt=hasta.time()), fecha__gte=hasta.date())
+        .order_by('fecha', 'hora_inicio')
+        .values_list('fecha', 'hora_inicio')
+        .first()
+    )
+    if siguiente is None:
+        return None
+    return datetime.combine(*siguiente) - anticipacion
+
+
+def encolar_lote(ahora=None, anticipacion=ANTICIPACION, tamano=200):
+    """Encola los recordatorios de hasta `tamano` citas; devuelve cuántas."""
+    ahora = ahora or datetime.now()
+    with transaction.atomic():
+        citas = list(
+            por_recordar(ahora, anticipacion)
+            .select_related('cliente__user', 'servicio', 'empresa')
+            .order_by('fecha', 'hora_inicio')[:tamano]
+        )
+        if not citas:
+            return 0
+        encolar(citas, 'recordatorio', ignorar_duplicados=True)
+        # update() no dispara señales: el flag no afecta franjas ni contadores
+        Cita.objects.filter(id__in=[c.id for c in citas]).update(recordatorio_enviado=True)
+    return len(citas)
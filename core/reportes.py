@@ -0,0 +1,246 @@
+"""
+Reportes de la empresa: ingresos por servicio, ocupación y cancelaciones.
+
+Todo se agrega en la base (Count, Sum con filtro y TruncWeek): a Python
+solo llega una fila por grupo (servicio, día o semana), nunca una por cita.
+
+Para rangos largos los días cerrados salen de ResumenDiario, una fila por
+empresa, día y servicio que `materializar_pendientes` pone al día (comando
+materializar_resumenes, cada noche y después de mantener_citas).
+Empresa.resumen_hasta marca hasta qué día está completo: hasta esa fecha
+se lee el resumen y después las citas, vivas y archivadas.
+
+Los ingresos son el precio de las citas confirmadas. Las citas no guardan
+el precio, así que se usa el del servicio: el actual en lo que se lee de
+las citas y el del momento de materializar en el resumen. La ocupación
+compara los minutos reservados con los de las jornadas efectivas de cada
+fecha (semana tipo y excepciones) por el número de barberos activos.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Min, Q, Sum
+from django.db.models.functions import TruncWeek
+
+from .calendario import cargar_calendario, sillas_activas
+from .models import Cita, CitaArchivada, Empresa, ResumenDiario, Servicio
+
+
+METRICAS = ['total', 'confirmadas', 'canceladas', 'vencidas', 'minutos', 'ingresos']
+
+# Días ya resumidos que se recalculan en cada pasada (cambios tardíos)
+DIAS_REVISION = 7
+
+# Días que se materializan por transacción
+DIAS_POR_LOTE = 31
+
+
+# ============================================================
+# 1. AGREGACIÓN
+# ============================================================
+
+def _metricas_citas():
+    duracion = ExpressionWrapper(F('hora_fin') - F('hora_inicio'), output_field=DurationField())
+    return {
+        'total': Count('id'),
+        'confirmadas': Count('id', filter=Q(estado='confirmada')),
+        'canceladas': Count('id', filter=Q(estado='cancelada')),
+        'vencidas': Count('id', filter=Q(estado='vencida')),
+        'minutos': Sum(duracion, filter=~Q(estado='cancelada')),
+        'ingresos': Sum('servicio__precio', filter=Q(estado='confirmada')),
+    }
+
+
+def _metricas_resumen():
+    return {metrica: Sum(metrica) for metrica in METRICAS}
+
+
+def _sumar_metricas(acumulado, fila):
+    for metrica in METRICAS:
+        valor = fila[metrica] or 0
+        if isinstance(valor, timedelta):
+            valor = int(valor.total_seconds()) // 60
+        acumulado[metrica] += valor
+
+
+def _acumular(resultado, filas, grupo):
+    """Suma las filas agregadas en `resultado` ({clave del grupo: métricas})."""
+    for fila in filas:
+        _sumar_metricas(resultado.setdefault(tuple(fila[campo] for campo in grupo), dict.fromkeys(METRICAS, 0)), fila)
+    return resultado
+
+
+def _reagrupar(grupos, clave):
+    """Junta grupos ya agregados según `clave(grupo)` (sin volver a la base)."""
+    resultado = {}
+    for grupo, metricas in grupos.items():
+        _sumar_metricas(resultado.setdefault(clave(grupo), dict.fromkeys(METRICAS, 0)), metricas)
+    return resultado
+
+
+def _fuentes(empresa, desde, hasta):
+    """(queryset, métricas) que cubren [desde, hasta] sin solaparse."""
+    fuentes = []
+    corte = empresa.resumen_hasta
+    if corte and desde <= corte:
+        resumen = ResumenDiario.objects.filter(empresa_id=empresa.id, fecha__range=(desde, min(hasta, corte)))
+        fuentes.append((resumen, _metricas_resumen()))
+        desde = corte + timedelta(days=1)
+    if desde <= hasta:
+        for modelo in (Cita, CitaArchivada):
+            fuentes.append((modelo.objects.filter(empresa_id=empresa.id, fecha__range=(desde, hasta)), _metricas_citas()))
+    return fuentes
+
+
+def sumar(empresa, desde, hasta, *campos, **expresiones):
+    """
+    Métricas de [desde, hasta] agrupadas por `campos` y `expresiones` (como
+    en values()). Devuelve {clave: métricas}; sin grupo, la clave es ().
+    """
+    grupo = list(campos) + list(expresiones)
+    resultado = {}
+    for queryset, metricas in _fuentes(empresa, desde, hasta):
+        if grupo:
+            filas = queryset.values(*campos, **expresiones).annotate(**metricas).order_by()
+        else:
+            filas = [queryset.aggregate(**metricas)]
+        _acumular(resultado, filas, grupo)
+    return resultado
+
+
+def _tasa(parte, total):
+    return parte / total if total else 0.0
+
+
+# ============================================================
+# 2. REPORTES
+# ============================================================
+
+def _filas_servicios(por_servicio):
+    nombres = dict(Servicio.objects.filter(id__in=[id for id, in por_servicio]).values_list('id', 'nombre'))
+    filas = [
+        {'servicio_id': id, 'nombre': nombres.get(id, ''), 'citas': m['confirmadas'], 'ingresos': m['ingresos']}
+        for (id,), m in por_servicio.items()
+    ]
+    return sorted(filas, key=lambda f: (-f['ingresos'], f['nombre']))
+
+
+def _filas_cancelaciones(por_periodo):
+    return [
+        {'periodo': clave, 'total': m['total'], 'canceladas': m['canceladas'], 'tasa': _tasa(m['canceladas'], m['total'])}
+        for (clave,), m in sorted(por_periodo.items())
+    ]
+
+
+def _minutos_disponibles(empresa, desde, hasta):
+    calendario = cargar_calendario(empresa.id, desde, hasta)
+    sillas = max(len(sillas_activas(empresa.id)), 1)
+
+    disponibles = 0
+    fecha = desde
+    while fecha <= hasta:
+        disponibles += sum(fin - inicio for inicio, fin in calendario.jornadas(fecha))
+        fecha += timedelta(days=1)
+    return disponibles * sillas
+
+
+def _ocupacion(disponibles, totales):
+    return {
+        'minutos_disponibles': disponibles,
+        'minutos_reservados': totales['minutos'],
+        'tasa': _tasa(totales['minutos'], disponibles),
+        'totales': totales,
+    }
+
+
+def ingresos_por_servicio(empresa, desde, hasta):
+    """Citas confirmadas e ingresos de cada servicio, de mayor a menor."""
+    return _filas_servicios(sumar(empresa, desde, hasta, 'servicio_id'))
+
+
+def cancelaciones(empresa, desde, hasta, periodo='dia'):
+    """Citas, canceladas y tasa de cancelación por día o por semana (lunes)."""
+    if periodo == 'semana':
+        return _filas_cancelaciones(sumar(empresa, desde, hasta, inicio=TruncWeek('fecha')))
+    return _filas_cancelaciones(sumar(empresa, desde, hasta, 'fecha'))
+
+
+def ocupacion(empresa, desde, hasta):
+    """Minutos reservados frente a los minutos de atención del rango."""
+    return _ocupacion(_minutos_disponibles(empresa, desde, hasta), sumar(empresa, desde, hasta)[()])
+
+
+def reporte(empresa, desde, hasta, periodo='dia'):
+    """
+    Los tres reportes con una sola agregación por fuente, agrupada por día
+    y servicio; el resto se junta sobre esas filas.
+    """
+    grupos = sumar(empresa, desde, hasta, 'fecha', 'servicio_id')
+    if periodo == 'semana':
+        por_periodo = _reagrupar(grupos, lambda g: (g[0] - timedelta(days=g[0].weekday()),))
+    else:
+        por_periodo = _reagrupar(grupos, lambda g: (g[0],))
+    totales = _reagrupar(grupos, lambda g: ()).get((), dict.fromkeys(METRICAS, 0))
+
+    return {
+        'servicios': _filas_servicios(_reagrupar(grupos, lambda g: (g[1],))),
+        'ocupacion': _ocupacion(_minutos_disponibles(empresa, desde, hasta), totales),
+        'cancelaciones': _filas_cancelaciones(por_periodo),
+    }
+
+
+# ============================================================
+# 3. RESUMEN DIARIO
+# ============================================================
+
+def materializar(empresa_id, desde, hasta):
+    """Rehace las filas de ResumenDiario de [desde, hasta]."""
+    grupo = ['fecha', 'servicio_id']
+    filas = {}
+    for modelo in (Cita, CitaArchivada):
+        citas = modelo.objects.filter(empresa_id=empresa_id, fecha__range=(desde, hasta))
+        _acumular(filas, citas.values(*grupo).annotate(**_metricas_citas()).order_by(), grupo)
+
+    with transaction.atomic():
+        ResumenDiario.objects.filter(empresa_id=empresa_id, fecha__range=(desde, hasta)).delete()
+        ResumenDiario.objects.bulk_create(
+            [
+                ResumenDiario(empresa_id=empresa_id, fecha=fecha, servicio_id=servicio_id, **metricas)
+                for (fecha, servicio_id), metricas in filas.items()
+            ],
+            batch_size=500,
+        )
+    return len(filas)
+
+
+def _primera_fecha(empresa_id):
+    fechas = [
+        modelo.objects.filter(empresa_id=empresa_id).aggregate(primera=Min('fecha'))['primera']
+        for modelo in (Cita, CitaArchivada)
+    ]
+    fechas = [f for f in fechas if f]
+    return min(fechas) if fechas else None
+
+
+def materializar_pendientes(empresa, hasta=None):
+    """
+    Pone al día el resumen de la empresa hasta `hasta` (por defecto, ayer)
+    en tramos de DIAS_POR_LOTE días, cada uno en su transacción junto con
+    Empresa.resumen_hasta. Devuelve los días recalculados.
+    """
+    hasta = hasta or date.today() - timedelta(days=1)
+    if empresa.resumen_hasta:
+        desde = empresa.resumen_hasta - timedelta(days=DIAS_REVISION - 1)
+    else:
+        desde = _primera_fecha(empresa.id) or hasta
+
+    dias = 0
+    while desde <= hasta:
+        fin = min(desde + timedelta(days=DIAS_POR_LOTE - 1), hasta)
+        with transaction.atomic():
+            materializar(empresa.id, desde, fin)
+            Empresa.objects.filter(id=empresa.id).update(resumen_hasta=fin)
+        empresa.resumen_hasta = fin
+        dias += (fin - desde).days + 1
+        desde = fin + timedelta(days=1)
+    return dias
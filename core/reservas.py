@@ -0,0 +1,94 @@
+"""
+Reserva atómica de citas.
+
+La comprobación de solapamiento y el INSERT se hacen dentro de la misma
+transacción y con la agenda de la empresa bloqueada para esa fecha, así
+dos clientes que piden la misma franja a la vez no pueden pasar ambos la
+comprobación:
+
+- PostgreSQL: pg_advisory_xact_lock por (empresa, fecha).
+- Otros motores con SELECT ... FOR UPDATE: bloqueo de la fila de Empresa.
+- SQLite: la transacción se abre con BEGIN IMMEDIATE (ver
+  DATABASES['default']['OPTIONS']['transaction_mode']), que ya toma el
+  bloqueo de escritura de toda la base.
+
+Antes de insertar también se comprueba que la franja caiga dentro de las
+jornadas efectivas de la fecha (semana tipo más excepciones) y se asigna
+el primer barbero activo que la tenga libre.
+"""
+from django.db import connection, transaction
+
+from .calendario import cargar_calendario, sillas_activas
+from .franjas import a_minutos
+from .models import Cita, Empresa
+
+
+class HorarioNoDisponible(Exception):
+    """La franja pedida está fuera de horario o no queda ningún barbero libre."""
+
+
+def _bloquear_agenda(empresa_id, fecha):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [empresa_id, fecha.toordinal()])
+    elif connection.features.has_select_for_update:
+        Empresa.objects.select_for_update().filter(pk=empresa_id).exists()
+
+
+def barbero_libre(empresa_id, fecha, hora_inicio, hora_fin):
+    """
+    Id del primer barbero activo sin citas que se crucen con la franja, o
+    None si la empresa no tiene barberos (una sola silla) y está libre.
+
+    Lanza HorarioNoDisponible si no queda ninguna silla libre. Son dos
+    consultas sea cual sea el número de barberos.
+    """
+    ocupados = set(
+        Cita.objects.filter(
+            empresa_id=empresa_id,
+            fecha=fecha,
+            hora_inicio__lt=hora_fin,
+            hora_fin__gt=hora_inicio,
+        ).exclude(estado='cancelada').values_list('barbero_id', flat=True)
+    )
+    sillas = sillas_activas(empresa_id)
+
+    # Una cita sin barbero ocupa todas las sillas
+    if not sillas or None in ocupados:
+        if ocupados:
+            raise HorarioNoDisponible()
+        return None
+
+    for barbero_id in sillas:
+        if barbero_id not in ocupados:
+            return barbero_id
+    raise HorarioNoDisponible()
+
+
+def reservar_cita(cliente, empresa, servicio, dia, fecha, hora_inicio, hora_fin):
+    """
+    Crea la cita si la franja sigue libre.
+
+    Lanza HorarioNoDisponible si la empresa no atiende a esa hora o si
+    todos los barberos tienen otra cita no cancelada que se cruza.
+    """
+    with transaction.atomic():
+        _bloquear_agenda(empresa.id, fecha)
+
+        calendario = cargar_calendario(empresa.id, fecha, fecha)
+        if not calendario.admite(fecha, a_minutos(hora_inicio), a_minutos(hora_fin)):
+            raise HorarioNoDisponible()
+
+        barbero_id = barbero_libre(empresa.id, fecha, hora_inicio, hora_fin)
+
+        return Cita.objects.create(
+            cliente=cliente,
+            empresa=empresa,
+            servicio=servicio,
+            barbero_id=barbero_id,
+            dia=dia,
+            fecha=fecha,
+            hora_inicio=hora_inicio,
+            hora_fin=hora_fin,
+            estado='pendiente',
+        )
@@ -0,0 +1,216 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import cache_franjas, contadores, eventos, fragmentos
+from .middleware import invalidar_empresas
+from .models import Barbero, Cita, Cliente, Disponibilidad, Empresa, ExcepcionDisponibilidad, Servicio
+
+
+# ============================================================
+# 1. ESTADO ORIGINAL
+# ============================================================
+# Se usa __dict__ para no disparar una consulta si el campo fue diferido
+
+# Cita cargada sin alguno de los campos que cuentan en los dashboards
+DESCONOCIDO = object()
+
+
+@receiver(post_init, sender=Cita)
+def recordar_cita(sender, instance, **kwargs):
+    datos = instance.__dict__
+    instance._fecha_original = datos.get('fecha')
+    instance._estado_original = datos.get('estado', DESCONOCIDO) if instance.pk else None
+    if instance.pk is None:
+        instance._vigente_original = None
+    elif all(campo in datos for campo in ('estado', 'empresa_id', 'cliente_id', 'fecha')):
+        instance._vigente_original = _cita_vigente(instance)
+    else:
+        instance._vigente_original = DESCONOCIDO
+
+
+@receiver(post_init, sender=Servicio)
+def recordar_servicio(sender, instance, **kwargs):
+    instance._duracion_original = instance.__dict__.get('duracion')
+    instance._activo_original = instance.__dict__.get('activo')
+
+
+def _cita_vigente(cita):
+    """(empresa_id, cliente_id, fecha) si la cita cuenta en los dashboards."""
+    if cita.estado not in contadores.ESTADOS_VIGENTES:
+        return None
+    return (cita.empresa_id, cita.cliente_id, cita.fecha)
+
+
+# ============================================================
+# 2. CACHÉ DE FRANJAS
+# ============================================================
+# Las versiones se suben al confirmar la transacción: antes, una lectura
+# simultánea podría guardar los datos viejos bajo la versión nueva (ver
+# core/cache_franjas.py)
+
+@receiver(post_save, sender=Cita)
+@receiver(post_delete, sender=Cita)
+def invalidar_franjas_cita(sender, instance, **kwargs):
+    fechas = {instance.fecha}
+    fecha_original = getattr(instance, '_fecha_original', None)
+    if fecha_original:
+        fechas.add(fecha_original)
+    instance._fecha_original = instance.fecha
+    empresa_id = instance.empresa_id
+
+    def al_confirmar():
+        for fecha in fechas:
+            cache_franjas.invalidar_fecha(empresa_id, fecha)
+        # Las páginas de horarios abiertas recalculan sus franjas (ver core/eventos.py)
+        eventos.franjas_cambiaron(empresa_id, fechas)
+
+    transaction.on_commit(al_confirmar)
+
+
+@receiver(post_save, sender=Disponibilidad)
+@receiver(post_delete, sender=Disponibilidad)
+def invalidar_franjas_disponibilidad(sender, instance, **kwargs):
+    empresa_id, dia = instance.empresa_id, instance.dia
+    transaction.on_commit(lambda: cache_franjas.invalidar_dia(empresa_id, dia))
+
+
+@receiver(post_save, sender=ExcepcionDisponibilidad)
+@receiver(post_delete, sender=ExcepcionDisponibilidad)
+def invalidar_franjas_excepcion(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: cache_franjas.invalidar_excepciones(empresa_id))
+
+
+@receiver(post_save, sender=Barbero)
+@receiver(post_delete, sender=Barbero)
+def invalidar_franjas_barbero(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: cache_franjas.invalidar_barberos(empresa_id))
+
+
+@receiver(post_save, sender=Servicio)
+def invalidar_franjas_servicio(sender, instance, created, **kwargs):
+    if not created and instance._duracion_original is not None and instance.duracion != instance._duracion_original:
+        servicio_id = instance.id
+        transaction.on_commit(lambda: cache_franjas.invalidar_servicio(servicio_id))
+    instance._duracion_original = instance.duracion
+
+
+@receiver(post_delete, sender=Servicio)
+def invalidar_franjas_servicio_eliminado(sender, instance, **kwargs):
+    # Tras el delete instance.id ya es None
+    servicio_id = instance.id
+    transaction.on_commit(lambda: cache_franjas.invalidar_servicio(servicio_id))
+
+
+# ============================================================
+# 3. CONTADORES DE LOS DASHBOARDS
+# ============================================================
+# Se invalidan al confirmar la transacción: antes, una lectura concurrente
+# volvería a guardar el valor anterior bajo la misma versión
+
+@receiver(post_save, sender=Cita)
+def contar_cita(sender, instance, created, **kwargs):
+    anterior = None if created else instance._vigente_original
+    actual = _cita_vigente(instance)
+    instance._vigente_original = actual
+    if anterior is DESCONOCIDO:
+        # Sin el estado anterior no hay delta posible: se fuerza el recálculo
+        transaction.on_commit(lambda: contadores.olvidar_cita(instance.empresa_id, instance.cliente_id, instance.fecha, date.today()))
+    else:
+        transaction.on_commit(lambda: contadores.registrar_cambio_cita(anterior, actual, date.today()))
+
+
+@receiver(post_delete, sender=Cita)
+def descontar_cita(sender, instance, **kwargs):
+    anterior = instance._vigente_original
+    if anterior is DESCONOCIDO:
+        transaction.on_commit(lambda: contadores.olvidar_cita(instance.empresa_id, instance.cliente_id, instance.fecha, date.today()))
+    else:
+        transaction.on_commit(lambda: contadores.registrar_cambio_cita(anterior, None, date.today()))
+
+
+@receiver(post_save, sender=Servicio)
+def contar_servicio(sender, instance, created, **kwargs):
+    # Cargado sin 'activo' el original es None y también cuenta como cambio
+    if instance.activo != (not created and instance._activo_original):
+        transaction.on_commit(lambda: contadores.registrar_cambio_servicios(instance.empresa_id))
+
+    instance._activo_original = instance.activo
+
+
+@receiver(post_delete, sender=Servicio)
+def descontar_servicio(sender, instance, **kwargs):
+    if instance._activo_original:
+        transaction.on_commit(lambda: contadores.registrar_cambio_servicios(instance.empresa_id))
+
+
+@receiver(post_save, sender=Cliente)
+def contar_cliente(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(contadores.registrar_cambio_clientes)
+
+
+@receiver(post_delete, sender=Cliente)
+def descontar_cliente(sender, instance, **kwargs):
+    transaction.on_commit(contadores.registrar_cambio_clientes)
+
+
+# ============================================================
+# 4. TABLERO DE CITAS EN VIVO
+# ============================================================
+# Se publica al confirmar la transacción (ver core/eventos.py)
+
+# Cambios de estado que se muestran en el tablero de la empresa
+ESTADOS_PUBLICADOS = ('confirmada', 'cancelada')
+
+
+@receiver(post_save, sender=Cita)
+def publicar_cita(sender, instance, created, **kwargs):
+    anterior = instance._estado_original
+    instance._estado_original = instance.estado
+    if created:
+        transaction.on_commit(lambda: eventos.cita_cambio(instance, 'nueva'))
+    elif instance.estado != anterior and instance.estado in ESTADOS_PUBLICADOS:
+        anterior = None if anterior is DESCONOCIDO else anterior
+        transaction.on_commit(lambda: eventos.cita_cambio(instance, instance.estado, anterior))
+
+
+# ============================================================
+# 5. FRAGMENTOS PRE-RENDERIZADOS
+# ============================================================
+# La versión se sube al confirmar: antes, una lectura podría guardar los
+# datos viejos bajo la versión nueva (ver core/fragmentos.py)
+
+@receiver(post_save, sender=Servicio)
+@receiver(post_delete, sender=Servicio)
+def invalidar_catalogo(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: fragmentos.invalidar_catalogo(empresa_id))
+
+
+@receiver(post_save, sender=Disponibilidad)
+@receiver(post_delete, sender=Disponibilidad)
+def invalidar_semana(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: fragmentos.invalidar_semana(empresa_id))
+
+
+@receiver(post_save, sender=Empresa)
+def invalidar_fragmentos_empresa(sender, instance, created, **kwargs):
+    if not created:
+        empresa_id = instance.id
+        transaction.on_commit(lambda: fragmentos.invalidar_empresa(empresa_id))
+
+
+# ============================================================
+# 6. EMPRESA ACTUAL
+# ============================================================
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def invalidar_cache_empresas(sender, instance, **kwargs):
+    invalidar_empresas()
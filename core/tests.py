@@ -1,3 +1,2145 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.template import engines
+from django.template.loaders import cached
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache_franjas, contadores, estados, eventos, fragmentos, mantenimiento, middleware, notificaciones, recordatorios, reportes
+from .middleware import invalidar_empresas
+from .calendario import Calendario, IndiceIntervalos, acargar_calendario, cargar_calendario
+from .franjas import a_hora, a_minutos, franjas_con_capacidad, ocupacion_por_silla
+from .models import Cliente, Empresa, Servicio, Barbero, Disponibilidad, ExcepcionDisponibilidad, Cita, CitaArchivada, Notificacion, ResumenDiario
+from .busqueda import filtro_clientes
+from .paginacion import codificar_cursor, paginar_por_clave
+from .reservas import HorarioNoDisponible, reservar_cita
+from . import views
+from .views import DIAS_ORDEN, MAX_DIAS_DISPONIBILIDAD
+
+
+# ============================================================
+# 1. RESERVA ATÓMICA
+# ============================================================
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    """Varias reservas simultáneas a la misma franja: solo una gana."""
+
+    HILOS = 8
+
+    def setUp(self):
+        user = User.objects.create_user(username='barberia')
+        self.empresa = Empresa.objects.create(user=user, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        self.servicio = Servicio.objects.create(empresa=self.empresa, nombre='Corte', duracion=30, precio=10)
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=self.empresa, dia=dia,
+                hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+                hora_inicio_t=time(14, 0), hora_fin_t=time(18, 0),
+            )
+        self.clientes = [
+            Cliente.objects.create(user=User.objects.create_user(username=f'cliente{i}'), telefono='1')
+            for i in range(self.HILOS)
+        ]
+        self.fecha = date.today() + timedelta(days=1)
+
+    def test_una_sola_reserva_gana(self):
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def reservar(cliente):
+            try:
+                barrera.wait()
+                reservar_cita(cliente, self.empresa, self.servicio, 'lunes', self.fecha, time(9, 0), time(9, 30))
+                resultados.append('ok')
+            except HorarioNoDisponible:
+                resultados.append('ocupado')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar, args=(c,)) for c in self.clientes]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(resultados.count('ok'), 1)
+        self.assertEqual(resultados.count('ocupado'), self.HILOS - 1)
+        self.assertEqual(Cita.objects.filter(empresa=self.empresa, fecha=self.fecha).count(), 1)
+
+    def test_franja_contigua_no_se_solapa(self):
+        reservar_cita(self.clientes[0], self.empresa, self.servicio, 'lunes', self.fecha, time(9, 0), time(9, 30))
+        reservar_cita(self.clientes[1], self.empresa, self.servicio, 'lunes', self.fecha, time(9, 30), time(10, 0))
+
+        with self.assertRaises(HorarioNoDisponible):
+            reservar_cita(self.clientes[2], self.empresa, self.servicio, 'lunes', self.fecha, time(9, 15), time(9, 45))
+
+    def test_cita_cancelada_libera_la_franja(self):
+        cita = reservar_cita(self.clientes[0], self.empresa, self.servicio, 'lunes', self.fecha, time(9, 0), time(9, 30))
+        cita.estado = 'cancelada'
+        cita.save()
+
+        reservar_cita(self.clientes[1], self.empresa, self.servicio, 'lunes', self.fecha, time(9, 0), time(9, 30))
+
+
+# ============================================================
+# 2. ÍNDICES
+# ============================================================
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN es propio de SQLite")
+class PlanConsultasCitaTests(TestCase):
+    """
+    Ninguna consulta sobre core_cita de las vistas debe recorrer la tabla:
+    sin SCAN, sin ordenar en un B-tree temporal y siempre por uno de los
+    índices compuestos de Cita (los de FK solo filtran por empresa o cliente).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.user_cliente = User.objects.create_user(username='cliente')
+        cls.cliente = Cliente.objects.create(user=cls.user_cliente, telefono='1')
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=cls.empresa, dia=dia,
+                hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+                hora_inicio_t=time(14, 0), hora_fin_t=time(18, 0),
+            )
+        hoy = date.today()
+        for i in range(20):
+            Cita.objects.create(
+                cliente=cls.cliente, empresa=cls.empresa, servicio=cls.servicio,
+                dia=DIAS_ORDEN[(hoy + timedelta(days=i)).weekday()], fecha=hoy + timedelta(days=i),
+                hora_inicio=time(9, 0), hora_fin=time(9, 30),
+                estado='cancelada' if i % 5 == 0 else 'pendiente',
+            )
+
+    INDICES = {indice.name for indice in Cita._meta.indexes}
+
+    def setUp(self):
+        cache.clear()
+
+    def assertSinRecorridoCompleto(self, peticion):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = peticion()
+        self.assertLess(respuesta.status_code, 400)
+        self.assertPlanesSinRecorrido(consultas)
+
+    def assertPlanesSinRecorrido(self, consultas):
+        revisadas = 0
+        with connection.cursor() as cursor:
+            for consulta in consultas.captured_queries:
+                sql = consulta['sql']
+                if not sql.startswith('SELECT') or '"core_cita"' not in sql:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [fila[3] for fila in cursor.fetchall()]
+                revisadas += 1
+                mensaje = f"Recorrido completo de core_cita:\n{sql}\n{plan}"
+                for paso in plan:
+                    self.assertIsNone(re.match(r'SCAN core_cita\b', paso), mensaje)
+                    self.assertNotIn('USE TEMP B-TREE', paso, mensaje)
+                    if paso.startswith('SEARCH core_cita '):
+                        indice = re.search(r'USING (?:COVERING )?INDEX (\w+)', paso)
+                        self.assertIn(indice and indice.group(1), self.INDICES, mensaje)
+        self.assertGreater(revisadas, 0)
+
+    def test_vistas_cliente(self):
+        self.client.force_login(self.user_cliente)
+        manana = date.today() + timedelta(days=1)
+
+        self.assertSinRecorridoCompleto(lambda: self.client.get(reverse('dashboard_cliente')))
+        self.assertSinRecorridoCompleto(lambda: self.client.get(reverse('mis_citas')))
+        self.assertSinRecorridoCompleto(
+            lambda: self.client.get(reverse('horarios_servicio', args=[self.servicio.id, 'lunes']))
+        )
+        self.assertSinRecorridoCompleto(
+            lambda: self.client.get(reverse('disponibilidad_semana', args=[self.servicio.id]))
+        )
+        self.assertSinRecorridoCompleto(
+            lambda: self.client.get(reverse('disponibilidad_mes', args=[self.servicio.id, manana.year, manana.month]))
+        )
+        self.assertSinRecorridoCompleto(lambda: self.client.post(reverse('confirmar_cita'), {
+            'servicio_id': self.servicio.id,
+            'fecha': manana.isoformat(),
+            'dia': DIAS_ORDEN[manana.weekday()],
+            'hora_inicio': '10:00',
+            'hora_fin': '10:30',
+        }))
+
+    def test_vistas_empresa(self):
+        self.client.force_login(self.user_empresa)
+
+        self.assertSinRecorridoCompleto(lambda: self.client.get(reverse('dashboard_empresa')))
+        cursor = codificar_cursor([date.today(), time(9, 0), 1])
+        for filtros in [{}, {'fecha': 'hoy'}, {'fecha': 'semana', 'estado': 'pendiente'},
+                        {'fecha': 'mes'}, {'cliente': self.cliente.id},
+                        {'despues': cursor}, {'antes': cursor, 'estado': 'pendiente'}]:
+            self.assertSinRecorridoCompleto(lambda: self.client.get(reverse('listar_citas'), filtros))
+
+    def test_programador_de_recordatorios(self):
+        ahora = datetime.combine(date.today(), time(10, 0))
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertGreater(recordatorios.encolar_lote(ahora), 0)
+            self.assertIsNotNone(recordatorios.proximo_vencimiento(ahora))
+        self.assertPlanesSinRecorrido(consultas)
+
+    def test_mantenimiento(self):
+        hace_un_ano = date.today() - timedelta(days=400)
+        Cita.objects.create(
+            cliente=self.cliente, empresa=self.empresa, servicio=self.servicio, dia=DIAS_ORDEN[hace_un_ano.weekday()],
+            fecha=hace_un_ano, hora_inicio=time(9, 0), hora_fin=time(9, 30),
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(mantenimiento.vencer_citas(), 1)
+            self.assertEqual(mantenimiento.archivar_citas(365), 1)
+        self.assertPlanesSinRecorrido(consultas)
+
+
+# ============================================================
+# 3. NÚMERO DE CONSULTAS
+# ============================================================
+
+class NumeroConsultasTests(TestCase):
+    """Las vistas de listados cuestan lo mismo con 1 cita que con 30."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicios = [
+            Servicio.objects.create(empresa=cls.empresa, nombre=f'Servicio {i}', duracion=30, precio=10)
+            for i in range(3)
+        ]
+        cls.clientes = [
+            Cliente.objects.create(user=User.objects.create_user(username=f'cliente{i}'), telefono='1')
+            for i in range(3)
+        ]
+        cls.user_cliente = cls.clientes[0].user
+
+    def crear_citas(self, cantidad):
+        hoy = date.today()
+        for i in range(cantidad):
+            fecha = hoy + timedelta(days=i % 7)
+            Cita.objects.create(
+                cliente=self.clientes[0] if i % 2 == 0 else self.clientes[i % 3],
+                empresa=self.empresa,
+                servicio=self.servicios[i % 3],
+                dia=DIAS_ORDEN[fecha.weekday()],
+                fecha=fecha,
+                hora_inicio=time(8 + i // 7, 0),
+                hora_fin=time(8 + i // 7, 30),
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertConsultasFijas(self, num, user, url, params=None):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_citas(1)
+        # Primera visita: llena los contadores en caché
+        self.client.get(url, params)
+        with self.assertNumQueries(num):
+            self.client.get(url, params)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_citas(29)
+        # Las citas nuevas invalidan los contadores: se vuelven a contar una vez
+        self.client.get(url, params)
+        with self.assertNumQueries(num):
+            respuesta = self.client.get(url, params)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_listar_citas_empresa(self):
+        self.assertConsultasFijas(4, self.user_empresa, reverse('listar_citas'))
+
+    def test_listar_citas_empresa_filtrado(self):
+        self.assertConsultasFijas(4, self.user_empresa, reverse('listar_citas'), {'fecha': 'semana', 'estado': 'pendiente'})
+
+    def test_listar_citas_empresa_por_cliente(self):
+        self.assertConsultasFijas(5, self.user_empresa, reverse('listar_citas'), {'cliente': self.clientes[0].id})
+
+    def test_mis_citas(self):
+        self.assertConsultasFijas(4, self.user_cliente, reverse('mis_citas'))
+
+    def test_dashboard_empresa(self):
+        self.assertConsultasFijas(4, self.user_empresa, reverse('dashboard_empresa'))
+
+
+class DisponibilidadSemanaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            user=User.objects.create_user(username='barberia'), nombre_negocio='Barbería', direccion='Calle 1', telefono='1'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=cls.empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(10, 0), activo=dia != 'domingo'
+            )
+        cls.manana = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cliente.user)
+        self.url = reverse('disponibilidad_semana', args=[self.servicio.id])
+
+    def dias(self, **params):
+        return self.client.get(self.url, params).json()['dias']
+
+    def reservar(self, fecha, hora):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cita.objects.create(
+                cliente=self.cliente, empresa=self.empresa, servicio=self.servicio, dia=DIAS_ORDEN[fecha.weekday()],
+                fecha=fecha, hora_inicio=hora, hora_fin=time(hora.hour, hora.minute + 30),
+            )
+
+    def test_limites_de_dias(self):
+        casos = {None: 7, '0': 1, '-5': 1, '1': 1, '31': 31, '400': MAX_DIAS_DISPONIBILIDAD, 'abc': 7}
+        for dias, esperados in casos.items():
+            respuesta = self.dias(**({'dias': dias} if dias is not None else {}))
+            self.assertEqual(len(respuesta), esperados, dias)
+            self.assertEqual(respuesta[0]['fecha'], date.today().isoformat())
+
+    def test_dias_cerrados_y_reservados(self):
+        self.reservar(self.manana, time(8, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            ExcepcionDisponibilidad.objects.create(
+                empresa=self.empresa, tipo='cierre', fecha_inicio=self.manana + timedelta(days=1),
+                fecha_fin=self.manana + timedelta(days=1),
+            )
+
+        for dia in self.dias(dias=14)[1:]:
+            fecha = date.fromisoformat(dia['fecha'])
+            cerrado = fecha.weekday() == 6 or fecha == self.manana + timedelta(days=1)
+            self.assertEqual(dia['dia'], DIAS_ORDEN[fecha.weekday()])
+            self.assertEqual(dia['cerrado'], cerrado, dia)
+            if cerrado:
+                self.assertEqual(dia['franjas'], [])
+            elif fecha == self.manana:
+                self.assertEqual(dia['franjas'], ['08:30 - 09:00', '09:00 - 09:30', '09:30 - 10:00'])
+            else:
+                self.assertEqual(len(dia['franjas']), 4)
+
+    def test_consultas_no_dependen_de_los_dias_ni_las_citas(self):
+        self.client.get(self.url, {'dias': 1})
+        with CaptureQueriesContext(connection) as un_dia:
+            self.client.get(self.url, {'dias': 1})
+        for i in range(10):
+            self.reservar(self.manana + timedelta(days=i), time(9, 0))
+        with self.assertNumQueries(len(un_dia)):
+            self.client.get(self.url, {'dias': MAX_DIAS_DISPONIBILIDAD})
+
+
+# ============================================================
+# 4. PAGINACIÓN POR CLAVE
+# ============================================================
+
+class PaginacionPorClaveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user = User.objects.create_user(username='barberia')
+        empresa = Empresa.objects.create(user=user, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        servicio = Servicio.objects.create(empresa=empresa, nombre='Corte', duracion=30, precio=10)
+        cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+        hoy = date.today()
+        # Varias citas con la misma fecha y hora: el id desempata
+        for i in range(23):
+            Cita.objects.create(
+                cliente=cliente, empresa=empresa, servicio=servicio, dia='lunes',
+                fecha=hoy + timedelta(days=i % 3), hora_inicio=time(8 + i % 4, 0), hora_fin=time(9 + i % 4, 0),
+            )
+        cls.campos = ('fecha', 'hora_inicio', 'id')
+        cls.esperado = list(Cita.objects.order_by(*cls.campos).values_list('id', flat=True))
+
+    def test_recorre_todo_hacia_adelante_y_atras(self):
+        vistos, cursor = [], None
+        paginas = []
+        while True:
+            objetos, anterior, cursor = paginar_por_clave(Cita.objects.all(), self.campos, despues=cursor, tamano=5)
+            paginas.append((objetos, anterior))
+            vistos += [c.id for c in objetos]
+            if not cursor:
+                break
+        self.assertEqual(vistos, self.esperado)
+        self.assertEqual(len(paginas), 5)
+
+        # Desde la última página hacia atrás se obtienen las mismas páginas
+        objetos, anterior = paginas[-1]
+        for esperados, _ in reversed(paginas[:-1]):
+            objetos, anterior, _ = paginar_por_clave(Cita.objects.all(), self.campos, antes=anterior, tamano=5)
+            self.assertEqual([c.id for c in objetos], [c.id for c in esperados])
+        self.assertIsNone(anterior)
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        objetos, anterior, _ = paginar_por_clave(Cita.objects.all(), self.campos, despues='no-es-un-cursor', tamano=5)
+        self.assertEqual([c.id for c in objetos], self.esperado[:5])
+        self.assertIsNone(anterior)
+
+    def test_cursor_con_valores_de_otro_tipo(self):
+        # Se decodifica bien pero sus valores no son fecha, hora e id
+        for valores in (['x', 'y', 'z'], ['2025-01-01', '08:00:00', 'zz'], [None, [], {}]):
+            cursor = codificar_cursor(valores)
+            for direccion in ('despues', 'antes'):
+                objetos, anterior, _ = paginar_por_clave(Cita.objects.all(), self.campos, tamano=5, **{direccion: cursor})
+                self.assertEqual([c.id for c in objetos], self.esperado[:5])
+                self.assertIsNone(anterior)
+
+        self.client.force_login(self.user)
+        respuesta = self.client.get(reverse('listar_citas'), {'despues': codificar_cursor(['x', 'y', 'z'])})
+        self.assertEqual(respuesta.status_code, 200)
+
+
+# ============================================================
+# 5. DIRECTORIO DE CLIENTES
+# ============================================================
+
+class DirectorioClientesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        for i in range(60):
+            user = User.objects.create_user(username=f'Cliente {i:02d}', email=f'cliente{i:02d}@correo.com')
+            Cliente.objects.create(user=user, telefono=f'300{i:04d}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user_empresa)
+
+    def test_una_pagina_por_consulta(self):
+        self.client.get(reverse('listar_clientes'))
+        with self.assertNumQueries(4):
+            respuesta = self.client.get(reverse('listar_clientes'))
+        self.assertEqual(len(respuesta.context['clientes']), 50)
+        self.assertIsNotNone(respuesta.context['cursor_siguiente'])
+
+        respuesta = self.client.get(reverse('listar_clientes'), {'despues': respuesta.context['cursor_siguiente']})
+        self.assertEqual(len(respuesta.context['clientes']), 10)
+        self.assertIsNone(respuesta.context['cursor_siguiente'])
+
+    def test_busqueda_por_prefijo(self):
+        casos = {'cliente 1': 10, 'cliente05@': 1, '3000042': 1, 'nadie': 0}
+        for texto, esperados in casos.items():
+            respuesta = self.client.get(reverse('buscar_clientes'), {'q': texto})
+            self.assertEqual(len(respuesta.json()['resultados']), esperados, texto)
+
+        respuesta = self.client.get(reverse('listar_clientes'), {'q': 'cliente 1'})
+        self.assertEqual(
+            [c.user.username for c in respuesta.context['clientes']],
+            [f'Cliente {i}' for i in range(10, 20)],
+        )
+
+    def test_busqueda_sin_distinguir_mayusculas(self):
+        Cliente.objects.create(user=User.objects.create_user(username='MariaJose', email='MJ@Correo.com'), telefono='1')
+        for texto in ('mariajose', 'MARIAJ', 'mAriaJ', 'mj@correo'):
+            respuesta = self.client.get(reverse('buscar_clientes'), {'q': texto})
+            self.assertEqual([r['username'] for r in respuesta.json()['resultados']], ['MariaJose'], texto)
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN es propio de SQLite")
+    def test_busqueda_usa_los_indices_de_lower(self):
+        sql, params = Cliente.objects.filter(filtro_clientes('Maria')).query.sql_with_params()
+        with connection.cursor() as cursor:
+            plan = ' '.join(fila[-1] for fila in cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall())
+        self.assertIn('core_auth_user_username_lower_idx', plan)
+        self.assertIn('core_auth_user_email_lower_idx', plan)
+
+    def test_cursor_con_valores_de_otro_tipo(self):
+        for direccion in ('despues', 'antes'):
+            respuesta = self.client.get(reverse('listar_clientes'), {direccion: codificar_cursor(['x', 'zz'])})
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta.context['clientes'][0].user.username, 'Cliente 00')
+
+
+# ============================================================
+# 6. CONTADORES DE LOS DASHBOARDS
+# ============================================================
+
+class ContadoresTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+
+    def setUp(self):
+        cache.clear()
+        self.hoy = date.today()
+
+    def nueva_cita(self, dias=0, hora=9):
+        fecha = self.hoy + timedelta(days=dias)
+        return Cita.objects.create(
+            cliente=self.cliente, empresa=self.empresa, servicio=self.servicio, dia=DIAS_ORDEN[fecha.weekday()],
+            fecha=fecha, hora_inicio=time(hora, 0), hora_fin=time(hora, 30),
+        )
+
+    def leer(self):
+        return (
+            contadores.servicios_activos(self.empresa.id),
+            contadores.clientes_total(),
+            contadores.citas_del_dia(self.empresa.id, self.hoy),
+            contadores.proximas_citas(self.cliente.id, self.hoy),
+        )
+
+    def test_incrementos_coinciden_con_la_base(self):
+        self.assertEqual(self.leer(), (1, 1, 0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hoy_9 = self.nueva_cita(0, 9)
+            self.nueva_cita(0, 10)
+            manana = self.nueva_cita(1, 9)
+            self.nueva_cita(-1, 9)
+            Servicio.objects.create(empresa=self.empresa, nombre='Barba', duracion=15, precio=5)
+            Cliente.objects.create(user=User.objects.create_user(username='otro'), telefono='2')
+        self.assertEqual(self.leer(), (2, 2, 2, 3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hoy_9.estado = 'cancelada'
+            hoy_9.save()
+            manana.fecha = self.hoy
+            manana.save()
+            self.servicio.activo = False
+            self.servicio.save()
+        self.assertEqual(self.leer(), (1, 2, 2, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            manana.delete()
+            Cliente.objects.get(user__username='otro').user.delete()
+        self.assertEqual(self.leer(), (1, 1, 1, 1))
+
+        # El recálculo completo llega a los mismos valores
+        cache.clear()
+        contadores.recalcular_todo(self.hoy)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.leer(), (1, 1, 1, 1))
+
+    def test_recalculo_que_cruza_un_commit(self):
+        # La cita se confirma después de contar y antes de guardar el valor
+        def contar_y_reservar():
+            total = contadores._proximas(self.cliente.id, self.hoy).count()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.nueva_cita(0, 9)
+                self.nueva_cita(2, 9)
+            return total
+
+        clave = contadores._clave_proximas(self.cliente.id, self.hoy)
+        self.assertEqual(contadores._obtener(clave, contar_y_reservar), 0)
+        self.assertEqual(contadores.proximas_citas(self.cliente.id, self.hoy), 2)
+
+        # Al cambiar el día la entrada es otra y se recalcula
+        manana = self.hoy + timedelta(days=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(contadores.proximas_citas(self.cliente.id, manana), 1)
+
+    @mock.patch.object(contadores, 'LOTE_RECALCULO', 2)
+    def test_recalculo_pone_en_cero_a_los_clientes_sin_citas(self):
+        otros = [
+            Cliente.objects.create(user=User.objects.create_user(username=f'otro{i}'), telefono=str(i))
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nueva_cita(1, 9)
+        claves = [contadores._clave_proximas(cliente.id, self.hoy) for cliente in otros]
+        cache.set_many(dict.fromkeys(contadores._claves_vigentes(claves), 5))
+
+        with mock.patch.object(contadores.cache, 'set_many', wraps=contadores.cache.set_many) as escribir:
+            contadores.recalcular_todo(self.hoy)
+        self.assertEqual(escribir.call_count, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(contadores.proximas_citas(self.cliente.id, self.hoy), 1)
+            self.assertEqual([contadores.proximas_citas(c.id, self.hoy) for c in otros], [0, 0, 0])
+
+    def test_dashboards_sin_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nueva_cita(0, 9)
+        contadores.recalcular_todo(self.hoy)
+
+        for user, url in ((self.user_empresa, 'dashboard_empresa'), (self.cliente.user, 'dashboard_cliente')):
+            self.client.force_login(user)
+            with CaptureQueriesContext(connection) as consultas:
+                self.client.get(reverse(url))
+            self.assertFalse([c['sql'] for c in consultas.captured_queries if 'COUNT(' in c['sql']], url)
+
+
+# ============================================================
+# 7. EMPRESA ACTUAL (TENANT)
+# ============================================================
+
+@override_settings(ALLOWED_HOSTS=['testserver', '.example.com'])
+class EmpresaActualTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.primera = Empresa.objects.create(
+            user=User.objects.create_user(username='primera'), nombre_negocio='Barbería Centro', direccion='Calle 1', telefono='1'
+        )
+        cls.segunda = Empresa.objects.create(
+            user=User.objects.create_user(username='segunda'), nombre_negocio='Barbería Norte', direccion='Calle 2', telefono='2'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.segunda, nombre='Corte', duracion=30, precio=10)
+        cls.user_cliente = User.objects.create_user(username='cliente')
+        Cliente.objects.create(user=cls.user_cliente, telefono='1')
+
+    def setUp(self):
+        cache.clear()
+        invalidar_empresas()
+        self.client.force_login(self.user_cliente)
+
+    def empresa_de(self, respuesta):
+        return respuesta.wsgi_request.empresa
+
+    def test_slugs_unicos(self):
+        otra = Empresa.objects.create(
+            user=User.objects.create_user(username='tercera'), nombre_negocio='Barbería Norte', direccion='Calle 3', telefono='3'
+        )
+        self.assertEqual(self.segunda.slug, 'barberia-norte')
+        self.assertEqual(otra.slug, 'barberia-norte-2')
+
+    def test_resolucion(self):
+        url = reverse('dashboard_cliente')
+        self.assertEqual(self.empresa_de(self.client.get(url)), self.primera)
+        self.assertEqual(self.empresa_de(self.client.get(url, HTTP_HOST='barberia-norte.example.com')), self.segunda)
+
+        # El slug de la URL se recuerda en la sesión
+        self.assertEqual(self.empresa_de(self.client.get(url, {'empresa': 'barberia-norte'})), self.segunda)
+        self.assertEqual(self.empresa_de(self.client.get(url)), self.segunda)
+
+    def test_vistas_no_consultan_empresa(self):
+        self.client.get(reverse('dashboard_cliente'), {'empresa': 'barberia-norte'})
+        for url in (reverse('dashboard_cliente'), reverse('detalle_servicio', args=[self.servicio.id])):
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertFalse([c['sql'] for c in consultas.captured_queries if 'FROM "core_empresa"' in c['sql']])
+
+    def test_guardar_empresa_invalida_la_cache(self):
+        url = reverse('dashboard_cliente')
+        self.client.get(url, HTTP_HOST='barberia-norte.example.com')
+        self.segunda.slug = 'norte'
+        self.segunda.save()
+        self.assertEqual(self.empresa_de(self.client.get(url, HTTP_HOST='norte.example.com')), self.segunda)
+
+    def test_slugs_inexistentes_no_se_guardan(self):
+        url = reverse('dashboard_cliente')
+        for i in range(5):
+            self.assertEqual(self.empresa_de(self.client.get(url, {'empresa': f'no-existe-{i}'})), self.primera)
+        self.assertEqual(list(middleware._cache._datos), [middleware._POR_DEFECTO])
+
+    @override_settings(EMPRESA_CACHE_MAX=2)
+    def test_cache_acotada(self):
+        tercera = Empresa.objects.create(
+            user=User.objects.create_user(username='tercera'), nombre_negocio='Barbería Sur', direccion='Calle 3', telefono='3'
+        )
+        url = reverse('dashboard_cliente')
+        for slug in ('barberia-norte', 'barberia-centro', 'barberia-norte', tercera.slug):
+            self.client.get(url, {'empresa': slug})
+        # Sale la de uso menos reciente
+        self.assertEqual(list(middleware._cache._datos), ['barberia-norte', tercera.slug])
+
+    @override_settings(EMPRESA_CACHE_TTL=0)
+    def test_vencidas_se_eliminan_al_guardar(self):
+        url = reverse('dashboard_cliente')
+        for slug in ('barberia-norte', 'barberia-centro'):
+            self.assertEqual(self.empresa_de(self.client.get(url, {'empresa': slug})).slug, slug)
+        self.assertFalse(middleware._cache._datos)
+
+
+# ============================================================
+# 8. DISPONIBILIDAD POR EMPRESA
+# ============================================================
+
+class ConfigurarDisponibilidadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresas = [
+            Empresa.objects.create(
+                user=User.objects.create_user(username=f'barberia{i}'), nombre_negocio=f'Barbería {i}', direccion='Calle', telefono='1'
+            )
+            for i in range(2)
+        ]
+
+    def formulario(self, dias, **cambios):
+        datos = {}
+        for d in dias:
+            datos.update({
+                f'inicio_m_{d.id}': d.hora_inicio_m.strftime('%H:%M'),
+                f'fin_m_{d.id}': d.hora_fin_m.strftime('%H:%M'),
+                f'inicio_t_{d.id}': d.hora_inicio_t.strftime('%H:%M'),
+                f'fin_t_{d.id}': d.hora_fin_t.strftime('%H:%M'),
+            })
+            if d.activo:
+                datos[f'activo_{d.id}'] = 'on'
+        datos.update(cambios)
+        return datos
+
+    def test_cada_empresa_tiene_su_semana(self):
+        for empresa in self.empresas:
+            self.client.force_login(empresa.user)
+            respuesta = self.client.get(reverse('configurar_disponibilidad'))
+            self.assertEqual([d.dia for d in respuesta.context['dias']], DIAS_ORDEN)
+        self.assertEqual(Disponibilidad.objects.count(), 14)
+
+    def test_guardar_solo_actualiza_lo_que_cambia(self):
+        empresa = self.empresas[0]
+        self.client.force_login(empresa.user)
+        self.client.get(reverse('configurar_disponibilidad'))
+        dias = list(Disponibilidad.objects.filter(empresa=empresa).order_by('id'))
+        martes = dias[1]
+
+        # Sin cambios: ningún UPDATE
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(reverse('configurar_disponibilidad'), self.formulario(dias))
+        self.assertFalse([c for c in consultas.captured_queries if c['sql'].startswith('UPDATE "core_disponibilidad"')])
+
+        # Un cambio: un UPDATE, número de consultas fijo
+        with self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(
+                reverse('configurar_disponibilidad'),
+                self.formulario(dias, **{f'inicio_m_{martes.id}': '09:00', f'fin_t_{dias[4].id}': '19:30'}),
+            )
+        # Uno por día cambiado y uno para el fragmento de la semana
+        self.assertEqual(len(callbacks), 3)
+        martes.refresh_from_db()
+        self.assertEqual(martes.hora_inicio_m, time(9, 0))
+
+    def test_hora_invalida(self):
+        empresa = self.empresas[0]
+        self.client.force_login(empresa.user)
+        self.client.get(reverse('configurar_disponibilidad'))
+        dias = list(Disponibilidad.objects.filter(empresa=empresa).order_by('id'))
+
+        self.client.post(reverse('configurar_disponibilidad'), self.formulario(dias, **{f'inicio_m_{dias[0].id}': '25:00'}))
+        dias[0].refresh_from_db()
+        self.assertEqual(dias[0].hora_inicio_m, time(8, 0))
+
+
+# ============================================================
+# 9. EXCEPCIONES DE DISPONIBILIDAD
+# ============================================================
+
+class CalendarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            user=User.objects.create_user(username='barberia'), nombre_negocio='Barbería', direccion='Calle 1', telefono='1'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=60, precio=10)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=cls.empresa, dia=dia,
+                hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+                hora_inicio_t=time(14, 0), hora_fin_t=time(18, 0),
+                activo=dia != 'domingo',
+            )
+        # Próximo lunes, al menos a una semana para no depender de la hora actual
+        hoy = date.today()
+        cls.lunes = hoy + timedelta(days=7 + (-hoy.weekday()) % 7)
+
+    def setUp(self):
+        cache.clear()
+
+    def excepcion(self, tipo, inicio, fin=None, horas=(None, None)):
+        return ExcepcionDisponibilidad.objects.create(
+            empresa=self.empresa, tipo=tipo, fecha_inicio=inicio, fecha_fin=fin or inicio,
+            hora_inicio=horas[0], hora_fin=horas[1],
+        )
+
+    def calendario(self):
+        return Calendario(
+            Disponibilidad.objects.filter(empresa=self.empresa),
+            ExcepcionDisponibilidad.objects.filter(empresa=self.empresa),
+        )
+
+    def test_indice_de_intervalos(self):
+        intervalos = [(1, 10, 'a'), (2, 3, 'b'), (4, 6, 'c'), (5, 5, 'd'), (12, 20, 'e')]
+        indice = IndiceIntervalos(intervalos)
+        for punto in range(0, 22):
+            esperados = [v for ini, fin, v in intervalos if ini <= punto <= fin]
+            self.assertEqual(indice.en(punto), esperados, punto)
+
+    def test_cierre_extra_y_descanso(self):
+        martes, miercoles, domingo = (self.lunes + timedelta(days=d) for d in (1, 2, 6))
+        self.excepcion('cierre', self.lunes, martes)
+        self.excepcion('extra', martes, horas=(time(10, 0), time(13, 0)))
+        self.excepcion('descanso', miercoles, horas=(time(11, 0), time(15, 0)))
+        self.excepcion('extra', domingo, horas=(time(9, 0), time(11, 0)))
+
+        calendario = self.calendario()
+        self.assertTrue(calendario.cerrado(self.lunes))
+        self.assertEqual(calendario.jornadas(martes), [(600, 780)])
+        self.assertEqual(calendario.jornadas(miercoles), [(480, 660), (900, 1080)])
+        self.assertEqual(calendario.jornadas(domingo), [(540, 660)])
+        self.assertEqual(calendario.jornadas(self.lunes + timedelta(days=3)), [(480, 720), (840, 1080)])
+
+    def test_horarios_y_semana_usan_las_excepciones(self):
+        self.client.force_login(self.cliente.user)
+        martes, miercoles = self.lunes + timedelta(days=1), self.lunes + timedelta(days=2)
+        self.excepcion('cierre', self.lunes, martes)
+
+        # Un mes entero con las mismas consultas que un solo día
+        url = reverse('disponibilidad_semana', args=[self.servicio.id])
+        self.client.get(url, {'dias': 1})
+        with CaptureQueriesContext(connection) as un_dia:
+            self.client.get(url, {'dias': 1})
+        with self.assertNumQueries(len(un_dia)):
+            respuesta = self.client.get(url, {'dias': 31})
+        dias = {d['fecha']: d for d in respuesta.json()['dias']}
+        self.assertTrue(dias[self.lunes.isoformat()]['cerrado'])
+        self.assertEqual(dias[martes.isoformat()]['franjas'], [])
+        self.assertTrue(dias[miercoles.isoformat()]['franjas'])
+
+        # La caché de franjas se invalida al crear la excepción
+        url = reverse('horarios_servicio', args=[self.servicio.id, 'miercoles'])
+        with mock.patch('core.views.get_next_date_for_day', return_value=miercoles):
+            self.assertEqual(len(self.client.get(url).context['franjas']), 8)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.excepcion('descanso', miercoles, horas=(time(8, 0), time(10, 0)))
+            self.assertEqual(len(self.client.get(url).context['franjas']), 6)
+
+    def test_reserva_fuera_de_jornada(self):
+        self.excepcion('cierre', self.lunes)
+        with self.assertRaises(HorarioNoDisponible):
+            reservar_cita(self.cliente, self.empresa, self.servicio, 'lunes', self.lunes, time(9, 0), time(10, 0))
+        martes = self.lunes + timedelta(days=1)
+        with self.assertRaises(HorarioNoDisponible):
+            reservar_cita(self.cliente, self.empresa, self.servicio, 'martes', martes, time(11, 30), time(12, 30))
+        reservar_cita(self.cliente, self.empresa, self.servicio, 'martes', martes, time(11, 0), time(12, 0))
+
+
+# ============================================================
+# 10. CALENDARIO DE RESERVAS
+# ============================================================
+
+class CalendarioMensualTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            user=User.objects.create_user(username='barberia'), nombre_negocio='Barbería', direccion='Calle 1', telefono='1'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=60, precio=10)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=cls.empresa, dia=dia,
+                hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+                hora_inicio_t=time(14, 0), hora_fin_t=time(18, 0),
+                activo=dia != 'domingo',
+            )
+        # Un mes que empieza en el futuro, para no depender de la hora actual
+        hoy = date.today()
+        cls.primero = date(hoy.year + (hoy.month == 12), hoy.month % 12 + 1, 1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cliente.user)
+        # Calienta la sesión y la empresa actual del middleware
+        self.mes(date(2000, 1, 1))
+
+    def mes(self, primero):
+        url = reverse('disponibilidad_mes', args=[self.servicio.id, primero.year, primero.month])
+        return {d['fecha']: d for d in self.client.get(url).json()['dias']}
+
+    def test_mes_con_citas_y_cierres(self):
+        segundo = self.primero + timedelta(days=1)
+        for hora in range(8, 12):
+            Cita.objects.create(
+                cliente=self.cliente, empresa=self.empresa, servicio=self.servicio,
+                dia=DIAS_ORDEN[self.primero.weekday()], fecha=self.primero,
+                hora_inicio=time(hora, 0), hora_fin=time(hora + 1, 0),
+            )
+        ExcepcionDisponibilidad.objects.create(empresa=self.empresa, tipo='cierre', fecha_inicio=segundo, fecha_fin=segundo)
+
+        # Sesión, usuario, cliente y servicio, más semana, excepciones, barberos y citas
+        with self.assertNumQueries(8):
+            dias = self.mes(self.primero)
+
+        domingo = next(d for d in dias.values() if d['dia'] == 'domingo')
+        self.assertEqual(domingo['libres'], 0)
+        self.assertTrue(domingo['cerrado'])
+        self.assertEqual(dias[segundo.isoformat()]['libres'], 0)
+        libres_primero = 0 if self.primero.weekday() == 6 else 4
+        self.assertEqual(dias[self.primero.isoformat()]['libres'], libres_primero)
+        tercero = (self.primero + timedelta(days=2))
+        self.assertEqual(dias[tercero.isoformat()]['libres'], 0 if tercero.weekday() == 6 else 8)
+
+    def test_mes_pasado_y_fuera_de_plazo(self):
+        hoy = date.today()
+        with self.assertNumQueries(4):
+            dias = self.mes(date(hoy.year - 1, hoy.month, 1))
+        self.assertFalse(any(d['reservable'] or d['libres'] for d in dias.values()))
+
+        lejano = hoy + timedelta(days=400)
+        dias = self.mes(date(lejano.year, lejano.month, 1))
+        self.assertFalse(any(d['reservable'] for d in dias.values()))
+
+        url = reverse('disponibilidad_mes', args=[self.servicio.id, hoy.year, 13])
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_reserva_por_fecha(self):
+        fecha = self.primero if self.primero.weekday() != 6 else self.primero + timedelta(days=1)
+
+        respuesta = self.client.get(reverse('horarios_fecha', args=[self.servicio.id, fecha]))
+        self.assertEqual(respuesta.context['franjas'][0], '08:00 - 09:00')
+        self.assertContains(respuesta, reverse('resumen_cita_fecha', args=[self.servicio.id, fecha]))
+
+        self.client.post(reverse('confirmar_cita'), {
+            'servicio_id': self.servicio.id,
+            'fecha': fecha.isoformat(),
+            'dia': 'otro',
+            'hora_inicio': '08:00',
+            'hora_fin': '09:00',
+        })
+        cita = Cita.objects.get(cliente=self.cliente)
+        self.assertEqual((cita.fecha, cita.dia), (fecha, DIAS_ORDEN[fecha.weekday()]))
+
+        self.assertEqual(self.client.get(f'/cliente/servicios/{self.servicio.id}/fecha/2025-02-30/').status_code, 404)
+        lejana = date.today() + timedelta(days=400)
+        self.assertRedirects(
+            self.client.get(reverse('horarios_fecha', args=[self.servicio.id, lejana])),
+            reverse('detalle_servicio', args=[self.servicio.id]),
+        )
+
+
+# ============================================================
+# 11. VARIOS BARBEROS
+# ============================================================
+
+class CapacidadBarberosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            user=User.objects.create_user(username='barberia'), nombre_negocio='Barbería', direccion='Calle 1', telefono='1'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.clientes = [
+            Cliente.objects.create(user=User.objects.create_user(username=f'cliente{i}'), telefono='1') for i in range(4)
+        ]
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=cls.empresa, dia=dia,
+                hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+                hora_inicio_t=time(14, 0), hora_fin_t=time(18, 0),
+            )
+        cls.fecha = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def reservar(self, i, inicio, fin):
+        with self.captureOnCommitCallbacks(execute=True):
+            return reservar_cita(self.clientes[i], self.empresa, self.servicio, 'lunes', self.fecha, inicio, fin)
+
+    def libres(self):
+        self.client.force_login(self.clientes[0].user)
+        url = reverse('horarios_fecha', args=[self.servicio.id, self.fecha])
+        return self.client.get(url).context['franjas']
+
+    @staticmethod
+    def a_mano(rangos, duracion, sillas, citas, paso=None, desde=None):
+        ocupacion = [
+            [(a_minutos(ini), a_minutos(fin)) for barbero_id, ini, fin in citas if not sillas or barbero_id in (silla, None)]
+            for silla in sillas or [None]
+        ]
+        return [
+            (t, t + duracion)
+            for inicio, fin in rangos
+            for t in range(inicio, fin - duracion + 1, paso or duracion)
+            if (desde is None or t > desde)
+            and any(all(t + duracion <= a or b <= t for a, b in ocupados) for ocupados in ocupacion)
+        ]
+
+    def test_capacidad_igual_a_la_fuerza_bruta(self):
+        rangos = [(480, 720), (840, 1080)]
+        citas = [
+            (1, time(8, 0), time(9, 0)), (2, time(8, 30), time(9, 30)), (3, time(8, 0), time(8, 45)),
+            (1, time(10, 0), time(11, 0)), (None, time(15, 0), time(15, 30)), (9, time(16, 0), time(18, 0)),
+            (2, time(10, 30), time(12, 0)), (3, time(9, 0), time(10, 15)),
+        ]
+        for sillas in ([], [1], [1, 2], [1, 2, 3], [3, 9]):
+            # La misma ocupación sirve para varias búsquedas
+            ocupacion = ocupacion_por_silla(sillas, citas)
+            for duracion in (15, 30, 45, 60, 90):
+                for paso in (5, 15, duracion):
+                    self.assertEqual(
+                        franjas_con_capacidad(rangos, duracion, ocupacion, paso=paso),
+                        self.a_mano(rangos, duracion, sillas, citas, paso),
+                        (sillas, duracion, paso),
+                    )
+
+    def test_capacidad_con_varios_lotes_de_citas(self):
+        # Más citas que el primer lote: se leen por partes hasta llenar el día
+        rnd = random.Random(3)
+        rangos = [(480, 720), (840, 1080)]
+        for cantidad in (100, 300, 1000):
+            for sillas in ([], [1, 2, 3]):
+                citas = []
+                for _ in range(cantidad):
+                    inicio = rnd.randrange(480, 1080)
+                    barbero_id = None if rnd.random() < 0.05 else rnd.choice(sillas or [None])
+                    citas.append((barbero_id, a_hora(inicio), a_hora(inicio + rnd.randrange(5, 40))))
+                for duracion, desde in ((5, None), (30, 600)):
+                    self.assertEqual(
+                        franjas_con_capacidad(rangos, duracion, ocupacion_por_silla(sillas, citas), desde=desde),
+                        self.a_mano(rangos, duracion, sillas, citas, desde=desde),
+                        (cantidad, sillas, duracion),
+                    )
+
+    def test_dos_barberos_atienden_a_la_vez(self):
+        pedro = Barbero.objects.create(empresa=self.empresa, nombre='Pedro')
+        juan = Barbero.objects.create(empresa=self.empresa, nombre='Juan')
+
+        self.assertEqual(self.reservar(0, time(9, 0), time(9, 30)).barbero, pedro)
+        self.assertIn('09:00 - 09:30', self.libres())
+        self.assertEqual(self.reservar(1, time(9, 0), time(9, 30)).barbero, juan)
+        self.assertNotIn('09:00 - 09:30', self.libres())
+        with self.assertRaises(HorarioNoDisponible):
+            self.reservar(2, time(9, 15), time(9, 45))
+
+        # Pedro libre desde las 9:30, Juan también: la franja siguiente sigue libre
+        self.assertIn('09:30 - 10:00', self.libres())
+
+        # Un tercer barbero vuelve a abrir la franja; desactivado deja de contar
+        with self.captureOnCommitCallbacks(execute=True):
+            diego = Barbero.objects.create(empresa=self.empresa, nombre='Diego')
+        self.assertIn('09:00 - 09:30', self.libres())
+        diego.activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            diego.save()
+        self.assertNotIn('09:00 - 09:30', self.libres())
+
+    def test_cita_sin_barbero_ocupa_todas_las_sillas(self):
+        Barbero.objects.create(empresa=self.empresa, nombre='Pedro')
+        Barbero.objects.create(empresa=self.empresa, nombre='Juan')
+        Cita.objects.create(
+            cliente=self.clientes[0], empresa=self.empresa, servicio=self.servicio,
+            dia='lunes', fecha=self.fecha, hora_inicio=time(9, 0), hora_fin=time(9, 30),
+        )
+        self.assertNotIn('09:00 - 09:30', self.libres())
+        with self.assertRaises(HorarioNoDisponible):
+            self.reservar(1, time(9, 0), time(9, 30))
+
+    def test_consultas_no_dependen_del_numero_de_barberos(self):
+        Barbero.objects.create(empresa=self.empresa, nombre='Pedro')
+        with CaptureQueriesContext(connection) as una_silla:
+            self.reservar(0, time(9, 0), time(9, 30))
+
+        Barbero.objects.bulk_create(Barbero(empresa=self.empresa, nombre=f'Barbero {i}') for i in range(5))
+        with self.assertNumQueries(len(una_silla)):
+            self.reservar(1, time(9, 0), time(9, 30))
+
+    def test_rejilla_mas_fina_que_la_duracion(self):
+        largo = Servicio.objects.create(empresa=self.empresa, nombre='Corte y barba', duracion=45, precio=20)
+        self.reservar(0, time(9, 0), time(9, 30))
+        self.client.force_login(self.clientes[1].user)
+        url = reverse('horarios_fecha', args=[largo.id, self.fecha])
+
+        # Sin intervalo: cada franja empieza donde acaba la anterior
+        self.assertEqual(self.client.get(url).context['franjas'][:3], ['08:00 - 08:45', '09:30 - 10:15', '10:15 - 11:00'])
+
+        self.empresa.intervalo_franjas = 15
+        self.empresa.save()
+        self.assertEqual(
+            self.client.get(url).context['franjas'][:4],
+            ['08:00 - 08:45', '08:15 - 09:00', '09:30 - 10:15', '09:45 - 10:30'],
+        )
+
+
+# ============================================================
+# 12. NOTIFICACIONES
+# ============================================================
+
+class BackendQueFalla(notificaciones.BackendBase):
+    """Falla con los destinatarios de `rechazados` (o con todos)."""
+
+    rechazados = None
+
+    def enviar(self, notificacion):
+        if self.rechazados is None or notificacion.destinatario in self.rechazados:
+            raise ConnectionError("proveedor caído")
+
+
+class NotificacionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.con_correo = Cliente.objects.create(
+            user=User.objects.create_user(username='ana', email='ana@example.com'), telefono='300'
+        )
+        cls.sin_correo = Cliente.objects.create(user=User.objects.create_user(username='luis'), telefono='301')
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(
+                empresa=cls.empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0),
+            )
+        cls.fecha = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def cita(self, cliente, hora):
+        return Cita.objects.create(
+            cliente=cliente, empresa=self.empresa, servicio=self.servicio, dia=DIAS_ORDEN[self.fecha.weekday()],
+            fecha=self.fecha, hora_inicio=time(hora, 0), hora_fin=time(hora, 30),
+        )
+
+    def test_las_vistas_encolan_en_la_transaccion(self):
+        self.client.force_login(self.con_correo.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('confirmar_cita'), {
+                'servicio_id': self.servicio.id, 'fecha': self.fecha.isoformat(),
+                'hora_inicio': '09:00', 'hora_fin': '09:30',
+            })
+        cita = Cita.objects.get()
+        aviso = Notificacion.objects.get()
+        self.assertEqual((aviso.cita, aviso.evento, aviso.canal), (cita, 'reservada', 'email'))
+        self.assertEqual((aviso.destinatario, aviso.estado), ('ana@example.com', 'pendiente'))
+        self.assertIn('09:00', aviso.mensaje)
+
+        # Franja ocupada: sin cita no hay aviso
+        self.client.force_login(self.sin_correo.user)
+        self.client.post(reverse('confirmar_cita'), {
+            'servicio_id': self.servicio.id, 'fecha': self.fecha.isoformat(),
+            'hora_inicio': '09:00', 'hora_fin': '09:30',
+        })
+        self.assertEqual(Notificacion.objects.count(), 1)
+
+        self.client.force_login(self.user_empresa)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('confirmar_cita_empresa', args=[cita.id]))
+            self.client.get(reverse('cancelar_cita_empresa', args=[cita.id]))
+        self.assertEqual(
+            list(Notificacion.objects.values_list('evento', flat=True)), ['reservada', 'confirmada', 'cancelada']
+        )
+
+    def test_cancelar_como_cliente_avisa_por_sms_sin_correo(self):
+        cita = self.cita(self.sin_correo, 10)
+        self.client.force_login(self.sin_correo.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('cancelar_cita', args=[cita.id]))
+        aviso = Notificacion.objects.get()
+        self.assertEqual((aviso.evento, aviso.canal, aviso.destinatario), ('cancelada', 'sms', '301'))
+
+    def test_worker_escribe_el_archivo(self):
+        citas = [self.cita(self.con_correo, 8), self.cita(self.sin_correo, 9), self.cita(self.con_correo, 10)]
+        notificaciones.encolar(Cita.objects.select_related('cliente__user', 'servicio', 'empresa'), 'confirmada')
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'avisos.log')
+            # close_old_connections cerraría la conexión de la transacción del test
+            with override_settings(NOTIFICACIONES_BACKEND='core.notificaciones.BackendArchivo', NOTIFICACIONES_ARCHIVO=ruta), \
+                    mock.patch('core.management.commands.procesar_notificaciones.close_old_connections'):
+                call_command('procesar_notificaciones', '--una-vez', '--hilos', '2', '--lote', '2', stdout=io.StringIO())
+            with open(ruta, encoding='utf-8') as archivo:
+                lineas = [json.loads(linea) for linea in archivo]
+
+        self.assertEqual(sorted(l['id'] for l in lineas), list(Notificacion.objects.values_list('id', flat=True)))
+        self.assertEqual({l['destinatario'] for l in lineas}, {'ana@example.com', '301'})
+        self.assertEqual(Notificacion.objects.filter(estado='enviada', fecha_envio__isnull=False).count(), len(citas))
+
+    def test_reintentos_con_espera_y_fallo_definitivo(self):
+        notificaciones.encolar(
+            Cita.objects.select_related('cliente__user', 'servicio', 'empresa').filter(
+                id__in=[self.cita(self.con_correo, 8).id, self.cita(self.sin_correo, 9).id]
+            ),
+            'confirmada',
+        )
+        backend = BackendQueFalla()
+        backend.rechazados = {'301'}
+
+        self.assertEqual(notificaciones.procesar_lote(backend, hilos=2), (1, 1))
+        fallida = Notificacion.objects.get(destinatario='301')
+        self.assertEqual((fallida.estado, fallida.intentos, fallida.ultimo_error), ('pendiente', 1, 'proveedor caído'))
+        self.assertGreater(fallida.proximo_intento, fallida.fecha_creacion)
+
+        # Antes de su próximo intento el worker no la toma
+        self.assertEqual(notificaciones.procesar_lote(backend), (0, 0))
+
+        esperas = []
+        for _ in range(notificaciones.MAX_INTENTOS - 1):
+            anterior = Notificacion.objects.get(id=fallida.id)
+            Notificacion.objects.filter(id=fallida.id).update(proximo_intento=anterior.fecha_creacion)
+            ahora = timezone.now()
+            notificaciones.procesar_lote(backend)
+            esperas.append(Notificacion.objects.get(id=fallida.id).proximo_intento - ahora)
+
+        fallida.refresh_from_db()
+        self.assertEqual((fallida.estado, fallida.intentos), ('fallida', notificaciones.MAX_INTENTOS))
+        # La espera se duplica entre reintentos
+        self.assertGreater(esperas[2], esperas[1])
+        self.assertGreater(esperas[1], esperas[0])
+        self.assertEqual(Notificacion.objects.get(destinatario='ana@example.com').estado, 'enviada')
+
+    def test_reclamo_vencido_vuelve_a_la_cola(self):
+        notificaciones.encolar(
+            Cita.objects.select_related('cliente__user', 'servicio', 'empresa').filter(id=self.cita(self.con_correo, 8).id),
+            'reservada',
+        )
+        # Un worker reclamó el lote y murió sin registrar el resultado
+        self.assertEqual(len(notificaciones.reclamar_lote(10)), 1)
+        self.assertEqual(notificaciones.reclamar_lote(10), [])
+
+        Notificacion.objects.update(proximo_intento=timezone.now() - timedelta(seconds=1))
+        with override_settings(NOTIFICACIONES_BACKEND='core.tests.BackendQueFalla'):
+            backend = notificaciones.obtener_backend()
+        self.assertEqual(notificaciones.procesar_lote(backend), (0, 1))
+        # El reclamo vencido y el fallo cuentan como dos intentos
+        self.assertEqual(Notificacion.objects.get().intentos, 2)
+
+    def test_aviso_que_tumba_al_worker_termina_fallido(self):
+        notificaciones.encolar(
+            Cita.objects.select_related('cliente__user', 'servicio', 'empresa').filter(id=self.cita(self.con_correo, 8).id),
+            'reservada',
+        )
+        # El worker muere cada vez antes de registrar el resultado
+        for intento in range(notificaciones.MAX_INTENTOS):
+            self.assertEqual(len(notificaciones.reclamar_lote(10)), 1, intento)
+            Notificacion.objects.update(proximo_intento=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(notificaciones.reclamar_lote(10), [])
+
+        aviso = Notificacion.objects.get()
+        self.assertEqual((aviso.estado, aviso.intentos), ('fallida', notificaciones.MAX_INTENTOS))
+        self.assertEqual(aviso.ultimo_error, notificaciones.ERROR_BLOQUEO)
+
+    def test_backend_debe_implementar_enviar(self):
+        with self.assertRaises(TypeError):
+            notificaciones.BackendBase()
+
+
+# ============================================================
+# 13. RECORDATORIOS
+# ============================================================
+
+class RecordatoriosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresas = [
+            Empresa.objects.create(
+                user=User.objects.create_user(username=f'barberia{i}'), nombre_negocio=f'Barbería {i}', direccion='Calle 1', telefono='1'
+            )
+            for i in range(2)
+        ]
+        cls.servicios = [
+            Servicio.objects.create(empresa=empresa, nombre='Corte', duracion=30, precio=10) for empresa in cls.empresas
+        ]
+        cls.cliente = Cliente.objects.create(
+            user=User.objects.create_user(username='ana', email='ana@example.com'), telefono='300'
+        )
+        cls.ahora = datetime.combine(date.today(), time(15, 0))
+
+    def cita(self, dias, hora, empresa=0, estado='pendiente'):
+        fecha = self.ahora.date() + timedelta(days=dias)
+        return Cita.objects.create(
+            cliente=self.cliente, empresa=self.empresas[empresa], servicio=self.servicios[empresa],
+            dia=DIAS_ORDEN[fecha.weekday()], fecha=fecha, hora_inicio=time(hora, 0), hora_fin=time(hora, 30), estado=estado,
+        )
+
+    def recordadas(self):
+        return set(Notificacion.objects.filter(evento='recordatorio').values_list('cita_id', flat=True))
+
+    def test_solo_la_ventana_de_anticipacion(self):
+        dentro = [self.cita(0, 16), self.cita(1, 9, empresa=1), self.cita(1, 15, estado='confirmada')]
+        self.cita(0, 14)                        # ya empezó
+        self.cita(1, 16)                        # fuera de las 24 horas
+        self.cita(0, 17, estado='cancelada')
+
+        self.assertEqual(recordatorios.encolar_lote(self.ahora), 3)
+        self.assertEqual(self.recordadas(), {c.id for c in dentro})
+        aviso = Notificacion.objects.filter(evento='recordatorio').first()
+        self.assertEqual((aviso.asunto, aviso.estado), ("Recordatorio de tu cita", 'pendiente'))
+        self.assertIn("te recordamos", aviso.mensaje)
+
+        # Una segunda pasada no encuentra nada
+        self.assertEqual(recordatorios.encolar_lote(self.ahora), 0)
+        self.assertEqual(recordatorios.encolar_lote(self.ahora + timedelta(hours=1)), 1)
+
+    def test_por_lotes(self):
+        for hora in (16, 17, 18):
+            self.cita(0, hora)
+        self.assertEqual(recordatorios.encolar_lote(self.ahora, tamano=2), 2)
+        self.assertEqual(recordatorios.encolar_lote(self.ahora, tamano=2), 1)
+        self.assertEqual(recordatorios.encolar_lote(self.ahora, tamano=2), 0)
+
+    def test_no_duplica_avisos(self):
+        cita = self.cita(0, 16)
+        recordatorios.encolar_lote(self.ahora)
+        # Otro programador que leyó la cita antes de que se marcara
+        Cita.objects.filter(id=cita.id).update(recordatorio_enviado=False)
+        self.assertEqual(recordatorios.encolar_lote(self.ahora), 1)
+        self.assertEqual(Notificacion.objects.filter(evento='recordatorio').count(), 1)
+
+    def test_proximo_vencimiento(self):
+        self.assertIsNone(recordatorios.proximo_vencimiento(self.ahora))
+        self.cita(3, 10)
+        self.cita(2, 11)
+        self.cita(0, 16)
+        self.assertEqual(
+            recordatorios.proximo_vencimiento(self.ahora),
+            datetime.combine(self.ahora.date() + timedelta(days=1), time(11, 0)),
+        )
+
+    def test_comando(self):
+        self.cita(0, 23)
+        salida = io.StringIO()
+        with mock.patch('core.management.commands.enviar_recordatorios.close_old_connections'), \
+                mock.patch('core.recordatorios.datetime') as reloj:
+            reloj.now.return_value = self.ahora
+            reloj.combine = datetime.combine
+            call_command('enviar_recordatorios', '--una-vez', stdout=salida)
+        self.assertIn("Total: 1 recordatorios encolados.", salida.getvalue())
+        self.assertEqual(len(self.recordadas()), 1)
+
+
+# ============================================================
+# 14. ACCIONES EN BLOQUE
+# ============================================================
+
+class AccionesEnBloqueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.otra = Empresa.objects.create(
+            user=User.objects.create_user(username='otra'), nombre_negocio='Otra', direccion='Calle 2', telefono='2'
+        )
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='ana', email='ana@example.com'), telefono='1')
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(empresa=cls.empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0))
+        cls.hoy = date.today()
+        cls.fecha = cls.hoy + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user_empresa)
+
+    def cita(self, hora, estado='pendiente', empresa=None, fecha=None):
+        fecha = fecha or self.fecha
+        empresa = empresa or self.empresa
+        return Cita.objects.create(
+            cliente=self.cliente, empresa=empresa, servicio=self.servicio, dia=DIAS_ORDEN[fecha.weekday()],
+            fecha=fecha, hora_inicio=time(hora, 0), hora_fin=time(hora, 30), estado=estado,
+        )
+
+    def accion(self, accion, citas):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('acciones_citas_empresa'), {'accion': accion, 'ids': citas})
+
+    def test_resultado_por_cita(self):
+        pendiente, confirmada, cancelada = self.cita(8), self.cita(9, 'confirmada'), self.cita(10, 'cancelada')
+        ajena = self.cita(11, empresa=self.otra)
+        ids = [pendiente.id, confirmada.id, cancelada.id, ajena.id, 9999]
+
+        respuesta = self.accion('confirmar', ids)
+        self.assertEqual(respuesta.json(), {'estado': 'confirmada', 'resultados': {
+            str(pendiente.id): estados.ACTUALIZADA,
+            str(confirmada.id): estados.SIN_CAMBIOS,
+            str(cancelada.id): estados.NO_PERMITIDA,
+            str(ajena.id): estados.NO_ENCONTRADA,
+            '9999': estados.NO_ENCONTRADA,
+        }})
+
+        respuesta = self.accion('cancelar', ids)
+        self.assertEqual(
+            [respuesta.json()['resultados'][str(i)] for i in ids],
+            [estados.ACTUALIZADA, estados.ACTUALIZADA, estados.SIN_CAMBIOS, estados.NO_ENCONTRADA, estados.NO_ENCONTRADA],
+        )
+        self.assertEqual(set(Cita.objects.filter(empresa=self.empresa).values_list('estado', flat=True)), {'cancelada'})
+        self.assertEqual(Cita.objects.get(id=ajena.id).estado, 'pendiente')
+        self.assertEqual(
+            list(Notificacion.objects.values_list('cita_id', 'evento')),
+            [(pendiente.id, 'confirmada'), (pendiente.id, 'cancelada'), (confirmada.id, 'cancelada')],
+        )
+
+    def test_consultas_no_dependen_del_numero_de_citas(self):
+        pocas = [self.cita(8).id, self.cita(9).id]
+        self.accion('confirmar', [9999])
+        with CaptureQueriesContext(connection) as consultas:
+            self.accion('confirmar', pocas)
+        muchas = [self.cita(h, fecha=self.fecha + timedelta(days=d)).id for h in range(8, 12) for d in range(2, 7)]
+        with self.assertNumQueries(len(consultas)):
+            self.accion('confirmar', muchas)
+        self.assertEqual(Cita.objects.filter(estado='confirmada').count(), len(pocas) + len(muchas))
+
+    def test_invalida_franjas_y_contadores(self):
+        citas = [self.cita(9, fecha=self.hoy).id, self.cita(9).id, self.cita(10, 'confirmada').id]
+        self.assertEqual(contadores.citas_del_dia(self.empresa.id, self.fecha), 2)
+        self.assertEqual(contadores.proximas_citas(self.cliente.id, self.hoy), 3)
+
+        url = reverse('horarios_fecha', args=[self.servicio.id, self.fecha])
+        self.client.force_login(self.cliente.user)
+        self.assertNotIn('09:00 - 09:30', self.client.get(url).context['franjas'])
+
+        self.client.force_login(self.user_empresa)
+        self.accion('cancelar', citas[1:])
+        self.assertEqual(contadores.citas_del_dia(self.empresa.id, self.fecha), 0)
+        self.assertEqual(contadores.proximas_citas(self.cliente.id, self.hoy), 1)
+
+        self.client.force_login(self.cliente.user)
+        franjas = self.client.get(url).context['franjas']
+        self.assertIn('09:00 - 09:30', franjas)
+        self.assertIn('10:00 - 10:30', franjas)
+
+    def test_peticiones_no_validas(self):
+        url = reverse('acciones_citas_empresa')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url, {'accion': 'borrar', 'ids': [1]}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'accion': 'confirmar', 'ids': ['x']}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'accion': 'confirmar'}).status_code, 400)
+
+
+# ============================================================
+# 15. VENCIMIENTO Y ARCHIVO DE CITAS
+# ============================================================
+
+class MantenimientoCitasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresas = [
+            Empresa.objects.create(
+                user=User.objects.create_user(username=f'barberia{i}'), nombre_negocio=f'Barbería {i}', direccion='Calle 1', telefono='1'
+            )
+            for i in range(2)
+        ]
+        cls.servicios = [
+            Servicio.objects.create(empresa=empresa, nombre='Corte', duracion=30, precio=10) for empresa in cls.empresas
+        ]
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='ana'), telefono='1')
+        cls.hoy = date.today()
+
+    def setUp(self):
+        cache.clear()
+
+    def cita(self, dias, hora, estado='pendiente', empresa=0):
+        fecha = self.hoy + timedelta(days=dias)
+        return Cita.objects.create(
+            cliente=self.cliente, empresa=self.empresas[empresa], servicio=self.servicios[empresa],
+            dia=DIAS_ORDEN[fecha.weekday()], fecha=fecha, hora_inicio=time(hora, 0), hora_fin=time(hora, 30), estado=estado,
+        )
+
+    def test_vence_solo_pendientes_pasadas(self):
+        vencen = [self.cita(-3, 9), self.cita(-1, 9, empresa=1), self.cita(0, 9)]
+        quedan = [self.cita(0, 10), self.cita(1, 9), self.cita(-1, 10, 'confirmada'), self.cita(-1, 11, 'cancelada')]
+        self.assertEqual(contadores.citas_del_dia(self.empresas[0].id, self.hoy), 2)
+
+        ahora = datetime.combine(self.hoy, time(9, 30))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mantenimiento.vencer_citas(ahora, lote=2), 3)
+
+        self.assertEqual(
+            set(Cita.objects.filter(estado='vencida').values_list('id', flat=True)), {c.id for c in vencen}
+        )
+        self.assertEqual(
+            [Cita.objects.get(id=c.id).estado for c in quedan], ['pendiente', 'pendiente', 'confirmada', 'cancelada']
+        )
+        self.assertEqual(contadores.citas_del_dia(self.empresas[0].id, self.hoy), 1)
+        self.assertEqual(mantenimiento.vencer_citas(ahora), 0)
+
+    def test_cita_confirmada_durante_el_lote_no_se_descuenta(self):
+        vence, confirmada = self.cita(-1, 9), self.cita(-1, 10)
+        update = QuerySet.update
+
+        def confirmar_antes(queryset, **campos):
+            # Otra transacción confirma una de las citas ya leídas
+            if campos == {'estado': 'vencida'}:
+                update(Cita.objects.filter(id=confirmada.id), estado='confirmada')
+            return update(queryset, **campos)
+
+        with (
+            mock.patch.object(QuerySet, 'update', confirmar_antes),
+            mock.patch.object(contadores, 'registrar_cambio_cita') as registrar,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            self.assertEqual(mantenimiento.vencer_citas(datetime.combine(self.hoy, time(12, 0))), 1)
+
+        registrar.assert_called_once_with((self.empresas[0].id, self.cliente.id, vence.fecha), None, self.hoy)
+        self.assertEqual(Cita.objects.get(id=confirmada.id).estado, 'confirmada')
+
+    def test_archiva_por_lotes_lo_anterior_al_horizonte(self):
+        antiguas = [self.cita(-40 - i, 9, 'confirmada', empresa=i % 2) for i in range(5)]
+        recientes = [self.cita(-29, 9, 'confirmada'), self.cita(0, 9), self.cita(3, 9)]
+        notificaciones.encolar(
+            Cita.objects.select_related('cliente__user', 'servicio', 'empresa').filter(id=antiguas[0].id), 'confirmada'
+        )
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(mantenimiento.archivar_citas(30, lote=2), 5)
+        # Sin consultas por cita: lectura, copia, avisos y borrado por lote
+        self.assertLess(len(consultas), 30)
+
+        self.assertEqual(set(Cita.objects.values_list('id', flat=True)), {c.id for c in recientes})
+        archivadas = CitaArchivada.objects.order_by('id_original')
+        self.assertEqual([a.id_original for a in archivadas], sorted(c.id for c in antiguas))
+        primera = archivadas.get(id_original=antiguas[0].id)
+        self.assertEqual(
+            (primera.empresa, primera.fecha, primera.hora_inicio, primera.estado),
+            (self.empresas[0], antiguas[0].fecha, time(9, 0), 'confirmada'),
+        )
+        self.assertIsNone(Notificacion.objects.get().cita_id)
+        self.assertEqual(mantenimiento.archivar_citas(30), 0)
+
+    def test_comando(self):
+        self.cita(-1, 9)
+        self.cita(-400, 9, 'confirmada')
+        salida = io.StringIO()
+        call_command('mantener_citas', stdout=salida)
+        self.assertIn("1 citas vencidas.", salida.getvalue())
+        self.assertIn("1 citas archivadas.", salida.getvalue())
+        self.assertEqual(list(Cita.objects.values_list('estado', flat=True)), ['vencida'])
+
+        with self.assertRaises(CommandError):
+            call_command('mantener_citas', '--dias', '0', stdout=salida)
+
+
+# ============================================================
+# 16. REPORTES
+# ============================================================
+
+class ReportesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.corte = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.barba = Servicio.objects.create(empresa=cls.empresa, nombre='Barba', duracion=15, precio=6)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='ana'), telefono='1')
+        # Lunes a viernes de 8 a 12: 240 minutos por día
+        for dia in DIAS_ORDEN[:5]:
+            Disponibilidad.objects.create(empresa=cls.empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0))
+
+        hoy = date.today()
+        cls.lunes = hoy - timedelta(days=hoy.weekday() + 14)
+        citas = [
+            # (días desde el lunes, servicio, hora, estado)
+            (0, cls.corte, 8, 'confirmada'), (0, cls.corte, 9, 'confirmada'), (0, cls.barba, 10, 'cancelada'),
+            (1, cls.barba, 8, 'confirmada'), (1, cls.corte, 9, 'vencida'),
+            (7, cls.corte, 8, 'cancelada'), (7, cls.corte, 9, 'cancelada'), (8, cls.barba, 9, 'confirmada'),
+        ]
+        for dias, servicio, hora, estado in citas:
+            fecha = cls.lunes + timedelta(days=dias)
+            Cita.objects.create(
+                cliente=cls.cliente, empresa=cls.empresa, servicio=servicio, dia=DIAS_ORDEN[fecha.weekday()],
+                fecha=fecha, hora_inicio=time(hora, 0), hora_fin=time(hora, servicio.duracion), estado=estado,
+            )
+        cls.desde, cls.hasta = cls.lunes, cls.lunes + timedelta(days=13)
+
+    def setUp(self):
+        self.empresa.refresh_from_db()
+
+    def resultado(self):
+        return reportes.reporte(self.empresa, self.desde, self.hasta, 'semana')
+
+    def test_metricas(self):
+        servicios = reportes.ingresos_por_servicio(self.empresa, self.desde, self.hasta)
+        self.assertEqual(
+            [(s['nombre'], s['citas'], s['ingresos']) for s in servicios], [('Corte', 2, 20), ('Barba', 2, 12)]
+        )
+
+        semanas = reportes.cancelaciones(self.empresa, self.desde, self.hasta, 'semana')
+        self.assertEqual(
+            [(f['periodo'], f['total'], f['canceladas']) for f in semanas],
+            [(self.lunes, 5, 1), (self.lunes + timedelta(days=7), 3, 2)],
+        )
+        self.assertAlmostEqual(semanas[1]['tasa'], 2 / 3)
+        dias = reportes.cancelaciones(self.empresa, self.desde, self.hasta)
+        self.assertEqual([f['periodo'] for f in dias], [self.lunes + timedelta(days=d) for d in (0, 1, 7, 8)])
+
+        ocupacion = reportes.ocupacion(self.empresa, self.desde, self.hasta)
+        # 10 días hábiles de 240 minutos; reservados: 30+30+15+30 y 15
+        self.assertEqual((ocupacion['minutos_disponibles'], ocupacion['minutos_reservados']), (2400, 120))
+        Barbero.objects.bulk_create([Barbero(empresa=self.empresa, nombre='Pedro'), Barbero(empresa=self.empresa, nombre='Juan')])
+        self.assertEqual(reportes.ocupacion(self.empresa, self.desde, self.hasta)['minutos_disponibles'], 4800)
+
+        # El reporte completo coincide con los reportes por separado
+        completo = self.resultado()
+        self.assertEqual(completo['servicios'], servicios)
+        self.assertEqual(completo['cancelaciones'], semanas)
+        self.assertEqual(completo['ocupacion']['minutos_reservados'], 120)
+
+    def test_agrega_en_la_base(self):
+        with CaptureQueriesContext(connection) as pocas:
+            self.resultado()
+        Cita.objects.bulk_create(
+            Cita(cliente=self.cliente, empresa=self.empresa, servicio=self.corte, dia='lunes', fecha=self.lunes,
+                 hora_inicio=time(11, 0), hora_fin=time(11, 30), estado='confirmada')
+            for _ in range(50)
+        )
+        with self.assertNumQueries(len(pocas)):
+            self.resultado()
+
+    def test_resumen_diario(self):
+        esperado = self.resultado()
+        self.assertEqual(reportes.materializar_pendientes(self.empresa, hasta=self.lunes + timedelta(days=6)), 7)
+        self.assertEqual(self.empresa.resumen_hasta, self.lunes + timedelta(days=6))
+        self.assertEqual(ResumenDiario.objects.filter(empresa=self.empresa).count(), 4)
+        # Primera semana del resumen y segunda de las citas
+        self.assertEqual(self.resultado(), esperado)
+
+        # Desde el resumen los cambios posteriores no se ven hasta rehacerlo
+        Cita.objects.filter(fecha=self.lunes, estado='cancelada').update(estado='confirmada')
+        self.assertEqual(self.resultado(), esperado)
+        reportes.materializar_pendientes(self.empresa, hasta=self.hasta)
+        self.assertEqual(self.resultado()['servicios'][1]['ingresos'], 18)
+
+    def test_incluye_citas_archivadas(self):
+        esperado = self.resultado()
+        mantenimiento.archivar_citas(1, hoy=self.lunes + timedelta(days=8))
+        self.assertEqual(Cita.objects.count(), 3)
+        self.assertEqual(self.resultado(), esperado)
+        reportes.materializar_pendientes(self.empresa, hasta=self.hasta)
+        self.assertEqual(self.resultado(), esperado)
+
+    def test_vista(self):
+        self.client.force_login(self.user_empresa)
+        respuesta = self.client.get(reverse('reportes_empresa'), {
+            'desde': self.desde.isoformat(), 'hasta': self.hasta.isoformat(), 'periodo': 'semana',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['cancelaciones'], self.resultado()['cancelaciones'])
+        self.assertContains(respuesta, 'Corte')
+
+        respuesta = self.client.get(reverse('reportes_empresa'), {'desde': self.hasta.isoformat(), 'hasta': self.desde.isoformat()})
+        self.assertEqual(respuesta.context['hasta'], date.today())
+
+
+
+# ============================================================
+# 17. CONEXIÓN A LA BASE
+# ============================================================
+
+@skipUnless(connection.vendor == 'sqlite', "PRAGMA de SQLite")
+class ConexionBaseTests(TransactionTestCase):
+
+    def test_pragmas_en_cada_conexion(self):
+        connection.close()
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            # 1 = NORMAL
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 20000)
+
+    def test_carga_reservas(self):
+        salida = io.StringIO()
+        call_command('carga_reservas', hilos=4, reservas=40, empresas=2, barberos=1, dias=1, stdout=salida)
+
+        self.assertIn('journal_mode: wal', salida.getvalue())
+        reservadas, ocupadas, errores = map(int, re.search(
+            r'(\d+) reservadas .*?(\d+) ocupadas, (\d+) errores', salida.getvalue()).groups())
+        self.assertEqual(reservadas + ocupadas, 40)
+        self.assertEqual(errores, 0)
+        # Los datos de prueba no quedan en la base
+        self.assertFalse(Empresa.objects.exists())
+        self.assertFalse(Cita.objects.exists())
+
+        with self.assertRaises(CommandError):
+            call_command('carga_reservas', hilos=0)
+
+
+# ============================================================
+# 18. VISTAS ASYNC
+# ============================================================
+
+class VistasAsyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(empresa=cls.empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0))
+        cls.user_cliente = User.objects.create_user(username='cliente')
+        cls.cliente = Cliente.objects.create(user=cls.user_cliente, telefono='1')
+        cls.fecha = date.today() + timedelta(days=1)
+        Cita.objects.create(
+            cliente=cls.cliente, empresa=cls.empresa, servicio=cls.servicio, dia=DIAS_ORDEN[cls.fecha.weekday()],
+            fecha=cls.fecha, hora_inicio=time(8, 0), hora_fin=time(8, 30),
+        )
+
+    def setUp(self):
+        cache.clear()
+        invalidar_empresas()
+
+    def test_vistas_async(self):
+        for vista in (views.dashboard_cliente, views.dashboard_empresa, views.detalle_servicio,
+                      views.horarios_servicio, views.horarios_fecha, views.mis_citas):
+            self.assertTrue(iscoroutinefunction(vista), vista)
+
+    async def test_peticiones_concurrentes(self):
+        await self.async_client.aforce_login(self.user_cliente)
+        urls = [
+            reverse('dashboard_cliente'),
+            reverse('detalle_servicio', args=[self.servicio.id]),
+            reverse('horarios_fecha', args=[self.servicio.id, self.fecha]),
+            reverse('mis_citas'),
+        ] * 3
+        respuestas = await asyncio.gather(*(self.async_client.get(url) for url in urls))
+
+        # Con peticiones simultáneas response.context mezcla las plantillas
+        # de todas, así que se revisa el HTML
+        self.assertEqual([r.status_code for r in respuestas], [200] * len(urls))
+        self.assertContains(respuestas[0], 'Barbería')
+        self.assertContains(respuestas[2], '08:30 - 09:00')
+        self.assertNotContains(respuestas[2], '08:00 - 08:30')
+        self.assertContains(respuestas[3], '08:00 a 08:30')
+
+    async def test_perfiles(self):
+        await self.async_client.aforce_login(self.user_empresa)
+        respuesta = await self.async_client.get(reverse('dashboard_empresa'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['citas_hoy'], 0)
+        self.assertContains(respuesta, 'Bienvenido, Barbería')
+
+        # Una empresa no entra a las vistas de cliente y se cierra su sesión
+        respuesta = await self.async_client.get(reverse('mis_citas'))
+        self.assertRedirects(respuesta, reverse('login_cliente'), fetch_redirect_response=False)
+        respuesta = await self.async_client.get(reverse('dashboard_empresa'))
+        self.assertEqual(respuesta.status_code, 302)
+
+    async def test_acierto_no_carga_el_calendario(self):
+        cargas = []
+
+        async def cargar_calendario():
+            cargas.append(self.fecha)
+            return await acargar_calendario(self.empresa.id, self.fecha, self.fecha)
+
+        franjas = await cache_franjas.aobtener_franjas(self.servicio, self.fecha, cargar_calendario)
+        self.assertTrue(franjas)
+        self.assertEqual(await cache_franjas.aobtener_franjas(self.servicio, self.fecha, cargar_calendario), franjas)
+        self.assertEqual(cargas, [self.fecha])
+
+
+# ============================================================
+# 19. FRANJAS EN VIVO (SERVER-SENT EVENTS)
+# ============================================================
+
+class FranjasEnVivoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        for dia in DIAS_ORDEN:
+            Disponibilidad.objects.create(empresa=cls.empresa, dia=dia, hora_inicio_m=time(8, 0), hora_fin_m=time(9, 30))
+        cls.user_cliente = User.objects.create_user(username='cliente')
+        cls.cliente = Cliente.objects.create(user=cls.user_cliente, telefono='1')
+        cls.fecha = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+        invalidar_empresas()
+
+    def crear_cita(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Cita.objects.create(
+                cliente=self.cliente, empresa=self.empresa, servicio=self.servicio, dia=DIAS_ORDEN[self.fecha.weekday()],
+                fecha=self.fecha, hora_inicio=time(8, 0), hora_fin=time(8, 30),
+            )
+
+    def cancelar(self, cita):
+        with self.captureOnCommitCallbacks(execute=True):
+            estados.cambiar_estado(self.empresa.id, [cita.id], 'cancelar')
+
+    def test_bus_local(self):
+        bus = eventos.BusLocal()
+
+        async def escuchar():
+            async with bus.suscribir('canal') as suscripcion:
+                self.assertEqual(bus.suscriptores('canal'), 1)
+                hilo = threading.Thread(target=bus.publicar, args=('canal', 'hola'))
+                hilo.start()
+                _, evento = await asyncio.wait_for(suscripcion.siguiente(), 5)
+                hilo.join()
+                # Una cola llena descarta sin bloquear al que publica
+                for _ in range(eventos.MAX_PENDIENTES + 10):
+                    suscripcion._poner('otro')
+                return evento
+
+        self.assertEqual(asyncio.run(escuchar()), 'hola')
+        self.assertEqual(bus.suscriptores('canal'), 0)
+        bus.publicar('canal', 'sin nadie')
+
+    def test_cambios_de_citas_publican(self):
+        canal = eventos.canal_franjas(self.empresa.id, self.fecha)
+        with mock.patch.object(eventos.obtener_bus(), 'publicar') as publicar:
+            cita = self.crear_cita()
+            publicar.assert_any_call(canal, 'franjas')
+
+            # Cancelar desde el panel (UPDATE sin señales) también avisa
+            publicar.reset_mock()
+            self.cancelar(cita)
+            publicar.assert_any_call(canal, 'franjas')
+
+            # Sin commit no hay aviso
+            publicar.reset_mock()
+            with self.captureOnCommitCallbacks(execute=False):
+                cita.delete()
+            publicar.assert_not_called()
+
+    async def test_flujo_de_eventos(self):
+        await self.async_client.aforce_login(self.user_cliente)
+        url = reverse('horarios_eventos', args=[self.servicio.id, self.fecha])
+
+        with mock.patch('core.views.DURACION_EVENTOS', 5):
+            respuesta = await self.async_client.get(url)
+            self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+            flujo = aiter(respuesta.streaming_content)
+
+            async def siguiente():
+                return (await asyncio.wait_for(anext(flujo), 5)).decode()
+
+            primero = await siguiente()
+            self.assertIn('event: franjas', primero)
+            self.assertIn('"08:00 - 08:30"', primero)
+            self.assertEqual(eventos.obtener_bus().suscriptores(eventos.canal_franjas(self.empresa.id, self.fecha)), 1)
+
+            cita = await sync_to_async(self.crear_cita)()
+            self.assertEqual(await siguiente(), 'event: ocupada\ndata: {"franja": "08:00 - 08:30"}\n\n')
+
+            await sync_to_async(self.cancelar)(cita)
+            self.assertEqual(await siguiente(), 'event: liberada\ndata: {"franja": "08:00 - 08:30"}\n\n')
+            await flujo.aclose()
+
+    def test_fecha_no_reservable(self):
+        self.client.force_login(self.user_cliente)
+        url = reverse('horarios_eventos', args=[self.servicio.id, date.today() - timedelta(days=1)])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+# ============================================================
+# 20. TABLERO DE CITAS EN VIVO
+# ============================================================
+
+class TableroEnVivoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_empresa = User.objects.create_user(username='barberia')
+        cls.empresa = Empresa.objects.create(user=cls.user_empresa, nombre_negocio='Barbería', direccion='Calle 1', telefono='1')
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+        cls.fecha = date.today() + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+        invalidar_empresas()
+        # Bus propio por prueba: el historial no pasa de una a otra
+        self.bus = eventos.BusLocal()
+        parche = mock.patch.object(eventos, '_bus', self.bus)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def crear_cita(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Cita.objects.create(
+                cliente=self.cliente, empresa=self.empresa, servicio=self.servicio, dia=DIAS_ORDEN[self.fecha.weekday()],
+                fecha=self.fecha, hora_inicio=time(10, 0), hora_fin=time(10, 30),
+            )
+
+    def confirmar(self, cita):
+        with self.captureOnCommitCallbacks(execute=True):
+            estados.cambiar_estado(self.empresa.id, [cita.id], 'confirmar')
+
+    def recibir(self, canal, desde, cantidad):
+        async def escuchar():
+            async with self.bus.suscribir(canal, desde=desde) as suscripcion:
+                return [await asyncio.wait_for(suscripcion.siguiente(), 5) for _ in range(cantidad)]
+        return asyncio.run(escuchar())
+
+    def test_retoma_desde_el_ultimo_id(self):
+        ids = [self.bus.publicar('canal', n) for n in range(3)]
+        self.assertEqual(self.recibir('canal', ids[0], 2), [(ids[1], 1), (ids[2], 2)])
+
+        # Id de otro proceso o ya fuera del historial: se pide recargar
+        self.assertEqual(self.recibir('canal', 'otro-1', 1), [(None, eventos.REINICIAR)])
+        with mock.patch.object(eventos, 'HISTORIAL', 2):
+            self.bus.publicar('canal', 3)
+            self.assertEqual(self.recibir('canal', ids[0], 1), [(None, eventos.REINICIAR)])
+
+    def test_maximo_de_suscripciones(self):
+        async def dos_conexiones():
+            async with self.bus.suscribir('canal', maximo=1):
+                with self.assertRaises(eventos.DemasiadasSuscripciones):
+                    async with self.bus.suscribir('canal', maximo=1):
+                        pass
+        asyncio.run(dos_conexiones())
+        self.assertEqual(self.bus.suscriptores('canal'), 0)
+
+        self.client.force_login(self.user_empresa)
+        with mock.patch('core.views.MAX_CONEXIONES_EMPRESA', 0):
+            self.assertEqual(self.client.get(reverse('eventos_citas_empresa')).status_code, 429)
+
+    def test_eventos_de_citas(self):
+        canal = eventos.canal_citas(self.empresa.id)
+        with mock.patch.object(self.bus, 'publicar', wraps=self.bus.publicar) as publicar:
+            cita = self.crear_cita()
+            self.confirmar(cita)
+            cita = Cita.objects.get(pk=cita.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.estado = 'cancelada'
+                cita.save()
+                # Guardar sin cambiar de estado no publica
+                cita.save()
+
+        recibidos = [llamada.args[1] for llamada in publicar.call_args_list if llamada.args[0] == canal]
+        self.assertEqual([(e['tipo'], e['anterior']) for e in recibidos],
+                         [('nueva', None), ('confirmada', 'pendiente'), ('cancelada', 'confirmada')])
+        self.assertEqual(recibidos[0]['cliente'], 'cliente')
+        self.assertEqual(recibidos[0]['servicio'], 'Corte')
+        self.assertEqual(recibidos[0]['hora_inicio'], '10:00')
+
+    async def test_flujo_y_reconexion(self):
+        await self.async_client.aforce_login(self.user_empresa)
+        url = reverse('eventos_citas_empresa')
+
+        with mock.patch('core.views.DURACION_EVENTOS', 5):
+            respuesta = await self.async_client.get(url)
+            self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+            flujo = aiter(respuesta.streaming_content)
+
+            async def siguiente(flujo):
+                return (await asyncio.wait_for(anext(flujo), 5)).decode()
+
+            self.assertTrue((await siguiente(flujo)).startswith('retry:'))
+            cita = await sync_to_async(self.crear_cita)()
+            nueva = await siguiente(flujo)
+            self.assertIn('event: nueva', nueva)
+            ultimo_id = re.match(r'id: (\S+)', nueva).group(1)
+            await flujo.aclose()
+
+            # Se confirma mientras el panel está desconectado
+            await sync_to_async(self.confirmar)(cita)
+
+            respuesta = await self.async_client.get(url, headers={'Last-Event-ID': ultimo_id})
+            flujo = aiter(respuesta.streaming_content)
+            await siguiente(flujo)
+            self.assertIn('event: confirmada', await siguiente(flujo))
+            await flujo.aclose()
+
+            respuesta = await self.async_client.get(url, headers={'Last-Event-ID': 'de-otro-proceso'})
+            flujo = aiter(respuesta.streaming_content)
+            await siguiente(flujo)
+            self.assertEqual(await siguiente(flujo), 'event: reiniciar\ndata: {}\n\n')
+            await flujo.aclose()
+
+    def test_solo_empresas(self):
+        self.client.force_login(self.cliente.user)
+        self.assertRedirects(self.client.get(reverse('eventos_citas_empresa')), reverse('login_empresa'), fetch_redirect_response=False)
+
+
+# ============================================================
+# 21. FRAGMENTOS PRE-RENDERIZADOS
+# ============================================================
+
+class FragmentosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            user=User.objects.create_user(username='barberia'), nombre_negocio='Barbería', direccion='Calle 1', telefono='1'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.lunes = Disponibilidad.objects.create(empresa=cls.empresa, dia='lunes', hora_inicio_m=time(8, 0), hora_fin_m=time(12, 0))
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+
+    def setUp(self):
+        cache.clear()
+        invalidar_empresas()
+        self.client.force_login(self.cliente.user)
+
+    def consultas_a(self, url, tabla):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        return respuesta, [c['sql'] for c in consultas.captured_queries if f'FROM "{tabla}"' in c['sql']]
+
+    def test_catalogo(self):
+        url = reverse('dashboard_cliente')
+        respuesta, consultas = self.consultas_a(url, 'core_servicio')
+        self.assertContains(respuesta, 'Corte')
+        self.assertTrue(consultas)
+
+        # En un acierto no se consultan los servicios
+        respuesta, consultas = self.consultas_a(url, 'core_servicio')
+        self.assertContains(respuesta, 'Corte')
+        self.assertFalse(consultas)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Servicio.objects.create(empresa=self.empresa, nombre='Barba', duracion=15, precio=5)
+        respuesta = self.client.get(url)
+        self.assertContains(respuesta, 'Barba')
+        self.assertEqual(respuesta.context['servicios_activos'], 2)
+
+    def test_semana(self):
+        url = reverse('detalle_servicio', args=[self.servicio.id])
+        respuesta, consultas = self.consultas_a(url, 'core_disponibilidad')
+        self.assertContains(respuesta, reverse('horarios_servicio', args=[self.servicio.id, 'lunes']))
+        self.assertTrue(consultas)
+        self.assertFalse(self.consultas_a(url, 'core_disponibilidad')[1])
+
+        # Sin confirmar la transacción la versión no cambia
+        self.lunes.activo = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.lunes.save()
+        self.assertContains(self.client.get(url), 'Lunes')
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(url), 'No hay horarios disponibles')
+
+    def test_horarios_cargan_el_calendario_una_vez(self):
+        lunes = date.today() + timedelta(days=7 - date.today().weekday())
+        url = reverse('horarios_fecha', args=[self.servicio.id, lunes])
+        for _ in range(2):
+            respuesta, consultas = self.consultas_a(url, 'core_disponibilidad')
+            self.assertContains(respuesta, '08:00 - 08:30')
+            self.assertEqual(len(consultas), 1)
+
+    def versiones(self):
+        return [async_to_sync(fragmentos._aversion)(fragmento, self.empresa.id) for fragmento in fragmentos.PLANTILLAS]
+
+    def test_guardar_empresa_rehace_los_fragmentos(self):
+        antes = self.versiones()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empresa.save()
+        self.assertTrue(all(a != d for a, d in zip(antes, self.versiones())))
+
+    def test_loader_en_cache(self):
+        self.assertIsInstance(engines['django'].engine.template_loaders[0], cached.Loader)
+
+
+# ============================================================
+# 22. CACHÉ DE FRANJAS
+# ============================================================
+
+class CacheFranjasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            user=User.objects.create_user(username='barberia'), nombre_negocio='Barbería', direccion='Calle 1', telefono='1'
+        )
+        cls.servicio = Servicio.objects.create(empresa=cls.empresa, nombre='Corte', duracion=30, precio=10)
+        cls.cliente = Cliente.objects.create(user=User.objects.create_user(username='cliente'), telefono='1')
+        cls.fecha = date.today() + timedelta(days=1)
+        cls.dia = DIAS_ORDEN[cls.fecha.weekday()]
+        cls.disponibilidad = Disponibilidad.objects.create(
+            empresa=cls.empresa, dia=cls.dia, hora_inicio_m=time(8, 0), hora_fin_m=time(10, 0)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def libres(self, servicio=None, cargar=None, clave=None):
+        cargar = cargar or partial(acargar_calendario, self.empresa.id, self.fecha, self.fecha)
+        franjas = async_to_sync(cache_franjas.aobtener_franjas)(servicio or self.servicio, self.fecha, cargar, clave=clave)
+        return [inicio for inicio, _ in franjas]
+
+    def clave(self, servicio):
+        return async_to_sync(cache_franjas.aclave_franjas)(servicio, self.fecha)
+
+    def assertInvalida(self, cambio, servicio=None):
+        """La versión solo cambia al confirmar la transacción de `cambio`."""
+        servicio = servicio or self.servicio
+        self.libres(servicio)
+        antes = self.clave(servicio)
+        with self.captureOnCommitCallbacks() as callbacks:
+            resultado = cambio()
+        self.assertEqual(self.clave(servicio), antes)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.clave(servicio), antes)
+        return resultado
+
+    def crear_cita(self, barbero=None):
+        return Cita.objects.create(
+            cliente=self.cliente, empresa=self.empresa, servicio=self.servicio, barbero=barbero, dia=self.dia,
+            fecha=self.fecha, hora_inicio=time(8, 0), hora_fin=time(8, 30),
+        )
+
+    def test_cita(self):
+        cita = self.assertInvalida(self.crear_cita)
+        self.assertEqual(self.libres(), [510, 540, 570])
+        self.assertInvalida(cita.delete)
+        self.assertEqual(self.libres(), [480, 510, 540, 570])
+
+    def test_disponibilidad(self):
+        self.disponibilidad.hora_fin_m = time(9, 0)
+        self.assertInvalida(self.disponibilidad.save)
+        self.assertEqual(self.libres(), [480, 510])
+        self.assertInvalida(self.disponibilidad.delete)
+        self.assertEqual(self.libres(), [])
+
+    def test_excepcion(self):
+        excepcion = self.assertInvalida(lambda: ExcepcionDisponibilidad.objects.create(
+            empresa=self.empresa, tipo='cierre', fecha_inicio=self.fecha, fecha_fin=self.fecha,
+        ))
+        self.assertEqual(self.libres(), [])
+        self.assertInvalida(excepcion.delete)
+        self.assertEqual(self.libres(), [480, 510, 540, 570])
+
+    def test_barbero(self):
+        pedro = Barbero.objects.create(empresa=self.empresa, nombre='Pedro')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_cita(pedro)
+        self.assertNotIn(480, self.libres())
+        juan = self.assertInvalida(lambda: Barbero.objects.create(empresa=self.empresa, nombre='Juan'))
+        self.assertIn(480, self.libres())
+        self.assertInvalida(juan.delete)
+        self.assertNotIn(480, self.libres())
+
+    def test_servicio(self):
+        servicio = Servicio.objects.create(empresa=self.empresa, nombre='Corte y barba', duracion=30, precio=20)
+        servicio.duracion = 60
+        self.assertInvalida(servicio.save, servicio)
+        self.assertEqual(self.libres(servicio), [480, 540])
+
+        copia = Servicio(id=servicio.id, empresa=self.empresa, duracion=60)
+        self.assertInvalida(servicio.delete, copia)
+
+    def test_lectura_que_cruza_un_commit(self):
+        # La clave se toma antes de cargar los datos; la reserva confirma en
+        # medio y lo leído queda bajo la versión ya superada
+        clave = self.clave(self.servicio)
+        calendario = cargar_calendario(self.empresa.id, self.fecha, self.fecha)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_cita()
+
+        async def cargado():
+            return calendario
+
+        self.libres(cargar=cargado, clave=clave)
+        self.assertNotIn(480, self.libres())
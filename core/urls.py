@@ -1,5 +1,7 @@
-from django.urls import path
-from . import views
+from django.urls import path, register_converter
+from . import converters, views
+
+register_converter(converters.FechaConverter, 'fecha')
 
 urlpatterns = [
 
@@ -17,8 +19,13 @@ urlpatterns = [
     path('cliente/perfil/', views.perfil_cliente, name='perfil_cliente'),
     path('cliente/configuracion/', views.editar_cliente, name='editar_cliente'),
     path('cliente/servicios/<int:id>/', views.detalle_servicio, name='detalle_servicio'),
+    path('cliente/servicios/<int:id>/disponibilidad/semana/', views.disponibilidad_semana, name='disponibilidad_semana'),
+    path('cliente/servicios/<int:id>/disponibilidad/mes/<int:anio>/<int:mes>/', views.disponibilidad_mes, name='disponibilidad_mes'),
     path('cliente/servicios/<int:id>/disponibilidad/<str:dia>/', views.horarios_servicio, name='horarios_servicio'),
     path('cliente/servicios/<int:id>/resumen/<str:dia>/', views.resumen_cita, name='resumen_cita'),
+    path('cliente/servicios/<int:id>/fecha/<fecha:fecha>/', views.horarios_fecha, name='horarios_fecha'),
+    path('cliente/servicios/<int:id>/fecha/<fecha:fecha>/eventos/', views.horarios_eventos, name='horarios_eventos'),
+    path('cliente/servicios/<int:id>/fecha/<fecha:fecha>/resumen/', views.resumen_cita_fecha, name='resumen_cita_fecha'),
     path('cliente/citas/confirmar/', views.confirmar_cita, name='confirmar_cita'),
     path('cliente/mis-citas/', views.mis_citas, name='mis_citas'),
     path('cliente/mis-citas/<int:id>/cancelar/', views.cancelar_cita, name='cancelar_cita'),
@@ -35,14 +42,26 @@ urlpatterns = [
 
     # --- Clientes (panel empresa) ---
     path('empresa/clientes/', views.listar_clientes, name='listar_clientes'),
+    path('empresa/clientes/buscar/', views.buscar_clientes, name='buscar_clientes'),
     path('empresa/clientes/<int:id>/editar/', views.editar_cliente_admin, name='editar_cliente_admin'),
     path('empresa/clientes/<int:id>/eliminar/', views.eliminar_cliente_admin, name='eliminar_cliente_admin'),
 
     # --- Disponibilidad ---
     path('empresa/disponibilidad/', views.configurar_disponibilidad, name='configurar_disponibilidad'),
+    path('empresa/disponibilidad/excepciones/nueva/', views.crear_excepcion, name='crear_excepcion'),
+    path('empresa/disponibilidad/excepciones/<int:id>/eliminar/', views.eliminar_excepcion, name='eliminar_excepcion'),
+
+    # --- Barberos ---
+    path('empresa/barberos/', views.listar_barberos, name='listar_barberos'),
+    path('empresa/barberos/<int:id>/estado/', views.cambiar_estado_barbero, name='cambiar_estado_barbero'),
+
+    # --- Reportes ---
+    path('empresa/reportes/', views.reportes_empresa, name='reportes_empresa'),
 
     # --- Citas (panel empresa) ---
     path('empresa/citas/', views.listar_citas_empresa, name='listar_citas'),
+    path('empresa/citas/acciones/', views.acciones_citas_empresa, name='acciones_citas_empresa'),
+    path('empresa/citas/eventos/', views.eventos_citas_empresa, name='eventos_citas_empresa'),
     path('empresa/citas/<int:id>/confirmar/', views.confirmar_cita_empresa, name='confirmar_cita_empresa'),
     path('empresa/citas/<int:id>/cancelar/', views.cancelar_cita_empresa, name='cancelar_cita_empresa'),
 
@@ -1,13 +1,32 @@
+from calendar import monthrange
 from datetime import datetime, timedelta, time, date
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout
+from asgiref.sync import iscoroutinefunction
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_time
+from django.utils.http import urlencode
+from django.db import transaction
+from django.contrib.auth import authenticate, login, logout, alogout
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+import asyncio
+from functools import partial
+import json
 import re
 
-from .forms import RegistroClienteForm, EmpresaForm, ServicioForm, EditarClienteForm
-from .models import Cliente, Empresa, Servicio, Disponibilidad, Cita
+from . import contadores, eventos, fragmentos
+from .forms import RegistroClienteForm, EmpresaForm, ServicioForm, EditarClienteForm, ExcepcionDisponibilidadForm, BarberoForm
+from .models import Cliente, Empresa, Servicio, Barbero, Disponibilidad, ExcepcionDisponibilidad, Cita
+from .busqueda import filtro_clientes
+from .cache_franjas import aclave_franjas, aobtener_franjas, invalidar_dia
+from .calendario import acargar_calendario, franjas_del_rango
+from .estados import TRANSICIONES, cambiar_estado
+from .franjas import a_minutos, formatear_franja
+from .notificaciones import encolar
+from .paginacion import paginar_por_clave
+from .reportes import reporte
+from .reservas import HorarioNoDisponible, reservar_cita
 
 
 # ============================================================
@@ -16,35 +35,86 @@ from .models import Cliente, Empresa, Servicio, Disponibilidad, Cita
 
 DIAS_ORDEN = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
 
+# Máximo de días que puede pedir la API de disponibilidad
+MAX_DIAS_DISPONIBILIDAD = 31
+
+# Con cuántos días de anticipación se puede reservar
+MAX_DIAS_RESERVA = 90
+
+# Rango máximo de los reportes de la empresa (los años cerrados salen del resumen diario)
+MAX_DIAS_REPORTE = 366 * 5
+
+# Rango por defecto de los reportes
+DIAS_REPORTE = 30
+
+# Segundos entre latidos de un flujo de eventos (mantienen viva la conexión)
+LATIDO_EVENTOS = 20
+
+# Segundos que dura un flujo de eventos; el navegador reconecta solo
+DURACION_EVENTOS = 300
+
+# Conexiones simultáneas al tablero en vivo por empresa (y proceso)
+MAX_CONEXIONES_EMPRESA = 10
+
+# Máximo de citas por acción en bloque del panel de la empresa
+MAX_CITAS_EN_BLOQUE = 200
+
+# Campos editables de Disponibilidad desde el panel de la empresa
+CAMPOS_DISPONIBILIDAD = ['hora_inicio_m', 'hora_fin_m', 'hora_inicio_t', 'hora_fin_t', 'activo']
+
+# Tamaño de página del listado de citas de la empresa
+CITAS_POR_PAGINA = 50
+
+# Tamaño de página del directorio de clientes
+CLIENTES_POR_PAGINA = 50
+
+# Resultados del autocompletado de clientes
+MAX_RESULTADOS_BUSQUEDA = 10
+
 
 # ============================================================
 # 2. DECORADORES
 # ============================================================
 
-def empresa_required(view_func):
-    """Restringe acceso solo a usuarios que tengan perfil de empresa"""
+def _perfil_required(view_func, modelo, perfil, url_login):
+    """
+    Deja pasar solo a los usuarios con el perfil indicado ('empresa' o
+    'cliente'). Con una vista async, el usuario y su perfil se cargan con
+    el ORM async y el usuario ya resuelto queda en request.user, así la
+    vista y la plantilla leen request.user.<perfil> sin consultar.
+    """
+    if iscoroutinefunction(view_func):
+        async def wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            try:
+                setattr(user, perfil, await modelo.objects.aget(user=user))
+            except modelo.DoesNotExist:
+                messages.error(request, "No tienes permiso para acceder a esta sección.")
+                await alogout(request)
+                return redirect(url_login)
+            request.user = user
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+
     def wrapper(request, *args, **kwargs):
         try:
-            request.user.empresa
+            getattr(request.user, perfil)
             return view_func(request, *args, **kwargs)
-        except Empresa.DoesNotExist:
+        except modelo.DoesNotExist:
             messages.error(request, "No tienes permiso para acceder a esta sección.")
             logout(request)
-            return redirect('login_empresa')
+            return redirect(url_login)
     return wrapper
 
 
+def empresa_required(view_func):
+    """Restringe acceso solo a usuarios que tengan perfil de empresa"""
+    return _perfil_required(view_func, Empresa, 'empresa', 'login_empresa')
+
+
 def cliente_required(view_func):
     """Restringe acceso solo a usuarios que tengan perfil de cliente"""
-    def wrapper(request, *args, **kwargs):
-        try:
-            request.user.cliente
-            return view_func(request, *args, **kwargs)
-        except Cliente.DoesNotExist:
-            messages.error(request, "No tienes permiso para acceder a esta sección.")
-            logout(request)
-            return redirect('login_cliente')
-    return wrapper
+    return _perfil_required(view_func, Cliente, 'cliente', 'login_cliente')
 
 
 # ============================================================
@@ -75,20 +145,34 @@ def get_next_date_for_day(dia_slug):
     return hoy + timedelta(days=diff)
 
 
-def ensure_disponibilidad_inicial():
+def fecha_reservable(fecha):
+    """True si la fecha está entre hoy y el límite de reserva anticipada."""
+    hoy = date.today()
+    return hoy <= fecha <= hoy + timedelta(days=MAX_DIAS_RESERVA)
+
+
+def parse_hora(valor):
+    """Convierte 'HH:MM' en time; None si viene vacío y ValueError si no es válido."""
+    if not valor:
+        return None
+    hora = parse_time(valor)
+    if hora is None:
+        raise ValueError(valor)
+    return hora
+
+
+def ensure_disponibilidad_inicial(empresa):
     """
-    Crea las 7 filas de disponibilidad si aún no existen.
+    Devuelve las 7 filas de disponibilidad de la empresa, creando las que
+    falten en un solo INSERT.
     Por defecto activa lunes-sábado y deja domingo inactivo.
     """
-    empresa = Empresa.objects.first()
     if not empresa:
-        return
-
-    existentes = set(Disponibilidad.objects.values_list('dia', flat=True))
-    por_crear = [d for d in DIAS_ORDEN if d not in existentes]
+        return []
 
-    for d in por_crear:
-        Disponibilidad.objects.create(
+    dias = {d.dia: d for d in Disponibilidad.objects.filter(empresa=empresa)}
+    por_crear = [
+        Disponibilidad(
             empresa=empresa,
             dia=d,
             hora_inicio_m=time(8, 0),
@@ -97,6 +181,15 @@ def ensure_disponibilidad_inicial():
             hora_fin_t=time(18, 0),
             activo=(d != 'domingo')
         )
+        for d in DIAS_ORDEN if d not in dias
+    ]
+    if por_crear:
+        for d in Disponibilidad.objects.bulk_create(por_crear):
+            dias[d.dia] = d
+        # bulk_create no envía señales
+        transaction.on_commit(lambda: fragmentos.invalidar_semana(empresa.id))
+
+    return [dias[d] for d in DIAS_ORDEN]
 
 
 # ============================================================
@@ -188,57 +281,56 @@ def logout_view(request):
 # ============================================================
 # 6. DASHBOARDS
 # ============================================================
+# Las vistas de lectura más pedidas (dashboards, detalle del servicio,
+# horarios y mis citas) son async: bajo ASGI atienden muchas peticiones a
+# la vez sin ocupar un hilo cada una. Las consultas se resuelven antes de
+# render(), que no puede consultar desde el bucle de eventos.
 
 @login_required
 @cliente_required
-def dashboard_cliente(request):
+async def dashboard_cliente(request):
     """Dashboard para clientes"""
-    empresa = Empresa.objects.first()
-    servicios = Servicio.objects.filter(empresa=empresa, activo=True).order_by('nombre') if empresa else []
+    empresa = request.empresa
 
-    hoy = date.today()
-    proximas_citas = 0
+    # Catálogo pre-renderizado en caché (ver core/fragmentos.py)
+    catalogo = await fragmentos.acatalogo(empresa.id if empresa else None)
+    servicios_activos = await contadores.aservicios_activos(empresa.id) if empresa else 0
 
-    if hasattr(request.user, 'cliente'):
-        proximas_citas = Cita.objects.filter(
-            cliente=request.user.cliente,
-            fecha__gte=hoy
-        ).exclude(estado='cancelada').count()
+    hoy = date.today()
+    proximas_citas = await contadores.aproximas_citas(request.user.cliente.id, hoy)
 
     return render(request, 'dashboard_cliente.html', {
         'empresa': empresa,
-        'servicios': servicios,
+        'catalogo': catalogo,
+        'servicios_activos': servicios_activos,
         'proximas_citas': proximas_citas,
     })
 
 
 @login_required
 @empresa_required
-def dashboard_empresa(request):
+async def dashboard_empresa(request):
     """Dashboard para empresas"""
     empresa = request.user.empresa
 
-    servicios_activos = empresa.servicios.filter(activo=True).count()
-    clientes_total = Cliente.objects.count()
-
     hoy = date.today()
 
-    # Citas del día
-    citas_hoy = Cita.objects.filter(
-        empresa=empresa,
-        fecha=hoy,
-        estado__in=["pendiente", "confirmada"]
-    ).count()
+    # Contadores en caché, mantenidos por señales (ver core/contadores.py)
+    servicios_activos = await contadores.aservicios_activos(empresa.id)
+    clientes_total = await contadores.aclientes_total()
+    citas_hoy = await contadores.acitas_del_dia(empresa.id, hoy)
 
     # Próximas citas ordenadas por proximidad
-    citas_recientes = (
-        Cita.objects.filter(
+    citas_recientes = [
+        cita async for cita in Cita.objects.filter(
             empresa=empresa,
-            estado__in=["pendiente", "confirmada"],
+            estado__in=contadores.ESTADOS_VIGENTES,
             fecha__gte=hoy
         )
+        .select_related("cliente__user", "servicio")
+        .only("fecha", "hora_inicio", "estado", "cliente__user__username", "servicio__nombre")
         .order_by("fecha", "hora_inicio")[:10]
-    )
+    ]
 
     return render(request, 'dashboard_empresa.html', {
         'servicios_activos': servicios_activos,
@@ -309,47 +401,18 @@ def editar_cliente(request):
 
 @login_required
 @cliente_required
-def detalle_servicio(request, id):
+async def detalle_servicio(request, id):
     """Vista de detalle del servicio y listado de horarios posibles"""
-    empresa = Empresa.objects.first()
-    servicio = get_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
+    empresa = request.empresa
+    servicio = await aget_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
 
-    dias_disponibles = Disponibilidad.objects.filter(empresa=empresa, activo=True).order_by('id')
-    duracion = servicio.duracion
-    franjas = {}
-
-    for d in dias_disponibles:
-        # Mañana
-        if d.hora_inicio_m and d.hora_fin_m:
-            hora_actual = datetime.combine(date.today(), d.hora_inicio_m)
-            hora_fin = datetime.combine(date.today(), d.hora_fin_m)
-            franjas[d.dia + '_m'] = []
-
-            while hora_actual + timedelta(minutes=duracion) <= hora_fin:
-                fin_slot = hora_actual + timedelta(minutes=duracion)
-                franjas[d.dia + '_m'].append(
-                    f"{hora_actual.time().strftime('%H:%M')} - {fin_slot.time().strftime('%H:%M')}"
-                )
-                hora_actual = fin_slot
-
-        # Tarde
-        if d.hora_inicio_t and d.hora_fin_t:
-            hora_actual = datetime.combine(date.today(), d.hora_inicio_t)
-            hora_fin = datetime.combine(date.today(), d.hora_fin_t)
-            franjas[d.dia + '_t'] = []
-
-            while hora_actual + timedelta(minutes=duracion) <= hora_fin:
-                fin_slot = hora_actual + timedelta(minutes=duracion)
-                franjas[d.dia + '_t'].append(
-                    f"{hora_actual.time().strftime('%H:%M')} - {fin_slot.time().strftime('%H:%M')}"
-                )
-                hora_actual = fin_slot
+    # Días de atención pre-renderizados en caché (ver core/fragmentos.py)
+    semana = await fragmentos.asemana(empresa.id, servicio.id)
 
     return render(request, 'cliente/detalle_servicio.html', {
         'servicio': servicio,
         'empresa': empresa,
-        'franjas': franjas,
-        'dias_disponibles': dias_disponibles,
+        'semana': semana,
     })
 
 
@@ -357,79 +420,195 @@ def detalle_servicio(request, id):
 # 9. CLIENTE – VER HORARIOS
 # ============================================================
 
+async def _franjas_libres(servicio, empresa, fecha, cargar_calendario=None):
+    """
+    Franjas 'HH:MM - HH:MM' libres del servicio en la fecha.
+
+    El calendario solo se carga si la entrada no está en caché; quien
+    también lo necesite puede pasar su propio `cargar_calendario`.
+    """
+    # Las versiones de la caché se leen antes que los datos (ver core/cache_franjas.py)
+    clave = await aclave_franjas(servicio, fecha, empresa.intervalo_franjas)
+
+    # Semana tipo más excepciones de la fecha (cierres, horario extra, descansos)
+    cargar_calendario = cargar_calendario or partial(acargar_calendario, empresa.id, fecha, fecha)
+
+    # Minuto actual para ocultar franjas pasadas si la fecha es hoy
+    desde = a_minutos(datetime.now().time()) if fecha == date.today() else None
+    franjas = await aobtener_franjas(servicio, fecha, cargar_calendario, desde, empresa.intervalo_franjas, clave)
+    return [formatear_franja(ini, fin) for ini, fin in franjas]
+
+
+async def _horarios(request, id, fecha):
+    """Franjas libres del servicio en una fecha concreta"""
+    empresa = request.empresa
+    servicio = await aget_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
+
+    if not fecha_reservable(fecha):
+        messages.error(request, "Esa fecha no está disponible para reservar.")
+        return redirect('detalle_servicio', id=servicio.id)
+
+    # La página muestra las excepciones de la fecha: el calendario que cargue
+    # _franjas_libres en un fallo de caché se reutiliza y si no, se carga aquí
+    cargado = []
+
+    async def cargar_calendario():
+        cargado.append(await acargar_calendario(empresa.id, fecha, fecha))
+        return cargado[0]
+
+    franjas = await _franjas_libres(servicio, empresa, fecha, cargar_calendario)
+    calendario = cargado[0] if cargado else await cargar_calendario()
+
+    return render(request, 'cliente/horarios_servicio.html', {
+        'servicio': servicio,
+        'empresa': empresa,
+        'dia': DIAS_ORDEN[fecha.weekday()],
+        'fecha': fecha,
+        'excepciones': calendario.excepciones(fecha),
+        'franjas': franjas,
+    })
+
+
 @login_required
 @cliente_required
-def horarios_servicio(request, id, dia):
+async def horarios_servicio(request, id, dia):
+    """Muestra las franjas disponibles de la próxima fecha del día de la semana"""
+    return await _horarios(request, id, get_next_date_for_day(dia))
+
+
+@login_required
+@cliente_required
+async def horarios_fecha(request, id, fecha):
     """Muestra las franjas disponibles filtrando horas pasadas y solapamientos"""
-    empresa = Empresa.objects.first()
-    servicio = get_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
-    disponibilidad = Disponibilidad.objects.filter(empresa=empresa, dia=dia, activo=True).first()
+    return await _horarios(request, id, fecha)
 
-    franjas = []
-    if disponibilidad:
-        duracion = servicio.duracion
-        fecha_real = get_next_date_for_day(dia)
-        hoy = date.today()
 
-        hora_actual_sistema = datetime.now().time() if fecha_real == hoy else None
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos)}\n\n"
 
-        citas_ocupadas = Cita.objects.filter(
-            empresa=empresa,
-            fecha=fecha_real
-        ).exclude(estado='cancelada')
 
-        rangos_ocupados = [(c.hora_inicio, c.hora_fin) for c in citas_ocupadas]
+@login_required
+@cliente_required
+async def horarios_eventos(request, id, fecha):
+    """
+    Server-Sent Events de la página de horarios: primero 'franjas' con la
+    lista completa (la página se pone al día al conectar o reconectar) y
+    después 'ocupada' o 'liberada' por cada franja que cambia.
 
-        def solapada(inicio, fin):
-            for ini_occ, fin_occ in rangos_ocupados:
-                if inicio < fin_occ and fin > ini_occ:
-                    return True
-            return False
+    Cada aviso del canal de la fecha (ver core/eventos.py) vuelve a leer
+    las franjas, casi siempre de la caché, y se envía la diferencia.
+    """
+    empresa = request.empresa
+    servicio = await aget_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
+    if not fecha_reservable(fecha):
+        raise Http404
+
+    async def flujo():
+        bucle = asyncio.get_running_loop()
+        fin = bucle.time() + DURACION_EVENTOS
+        # Suscrito antes de leer: un cambio entre medias no se pierde
+        async with eventos.obtener_bus().suscribir(eventos.canal_franjas(empresa.id, fecha)) as suscripcion:
+            actuales = await _franjas_libres(servicio, empresa, fecha)
+            yield f"retry: {LATIDO_EVENTOS * 1000}\n" + _evento_sse('franjas', {'franjas': actuales})
+
+            while (restante := fin - bucle.time()) > 0:
+                try:
+                    await asyncio.wait_for(suscripcion.siguiente(), min(LATIDO_EVENTOS, restante))
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
 
-        # Mañana
-        if disponibilidad.hora_inicio_m and disponibilidad.hora_fin_m:
-            hora_actual = datetime.combine(fecha_real, disponibilidad.hora_inicio_m)
-            hora_fin = datetime.combine(fecha_real, disponibilidad.hora_fin_m)
+                nuevas = await _franjas_libres(servicio, empresa, fecha)
+                for franja in sorted(set(actuales) - set(nuevas)):
+                    yield _evento_sse('ocupada', {'franja': franja})
+                for franja in sorted(set(nuevas) - set(actuales)):
+                    yield _evento_sse('liberada', {'franja': franja})
+                actuales = nuevas
 
-            while hora_actual + timedelta(minutes=duracion) <= hora_fin:
-                fin_slot = hora_actual + timedelta(minutes=duracion)
-                inicio_t = hora_actual.time()
-                fin_t = fin_slot.time()
+    respuesta = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    # Sin buffer en nginx: cada evento sale al momento
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
 
-                if hora_actual_sistema and inicio_t <= hora_actual_sistema:
-                    hora_actual = fin_slot
-                    continue
 
-                if not solapada(inicio_t, fin_t):
-                    franjas.append(f"{inicio_t.strftime('%H:%M')} - {fin_t.strftime('%H:%M')}")
+@login_required
+@cliente_required
+def disponibilidad_semana(request, id):
+    """Franjas libres de los próximos N días en JSON (una consulta por tabla)"""
+    empresa = request.empresa
+    servicio = get_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
+
+    try:
+        num_dias = int(request.GET.get('dias', 7))
+    except ValueError:
+        num_dias = 7
+    num_dias = min(max(num_dias, 1), MAX_DIAS_DISPONIBILIDAD)
 
-                hora_actual = fin_slot
+    hoy = date.today()
+    ahora = a_minutos(datetime.now().time())
+
+    dias = [
+        {
+            'fecha': fecha.isoformat(),
+            'dia': DIAS_ORDEN[fecha.weekday()],
+            'cerrado': not jornadas,
+            'franjas': [formatear_franja(ini, fin) for ini, fin in franjas],
+        }
+        for fecha, jornadas, franjas in franjas_del_rango(
+            servicio, hoy, hoy + timedelta(days=num_dias - 1), ahora, empresa.intervalo_franjas
+        )
+    ]
 
-        # Tarde
-        if disponibilidad.hora_inicio_t and disponibilidad.hora_fin_t:
-            hora_actual = datetime.combine(fecha_real, disponibilidad.hora_inicio_t)
-            hora_fin = datetime.combine(fecha_real, disponibilidad.hora_fin_t)
+    return JsonResponse({
+        'servicio': servicio.id,
+        'duracion': servicio.duracion,
+        'dias': dias,
+    })
 
-            while hora_actual + timedelta(minutes=duracion) <= hora_fin:
-                fin_slot = hora_actual + timedelta(minutes=duracion)
-                inicio_t = hora_actual.time()
-                fin_t = fin_slot.time()
 
-                if hora_actual_sistema and inicio_t <= hora_actual_sistema:
-                    hora_actual = fin_slot
-                    continue
+@login_required
+@cliente_required
+def disponibilidad_mes(request, id, anio, mes):
+    """Franjas libres por día de un mes en JSON, para pintar el calendario"""
+    empresa = request.empresa
+    servicio = get_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
 
-                if not solapada(inicio_t, fin_t):
-                    franjas.append(f"{inicio_t.strftime('%H:%M')} - {fin_t.strftime('%H:%M')}")
+    try:
+        primero = date(anio, mes, 1)
+    except ValueError:
+        return JsonResponse({'error': 'Mes no válido.'}, status=400)
+    ultimo = date(anio, mes, monthrange(anio, mes)[1])
 
-                hora_actual = fin_slot
+    # Solo se calculan los días reservables; el resto del mes va en cero
+    hoy = date.today()
+    desde = max(primero, hoy)
+    hasta = min(ultimo, hoy + timedelta(days=MAX_DIAS_RESERVA))
+    libres = {
+        fecha: (jornadas, len(franjas))
+        for fecha, jornadas, franjas in franjas_del_rango(
+            servicio, desde, hasta, a_minutos(datetime.now().time()), empresa.intervalo_franjas
+        )
+    }
 
-    return render(request, 'cliente/horarios_servicio.html', {
-        'servicio': servicio,
-        'empresa': empresa,
-        'dia': dia,
-        'disponibilidad': disponibilidad,
-        'franjas': franjas,
+    dias = []
+    for numero in range(1, ultimo.day + 1):
+        fecha = date(anio, mes, numero)
+        jornadas, total = libres.get(fecha, ((), 0))
+        dias.append({
+            'fecha': fecha.isoformat(),
+            'dia': DIAS_ORDEN[fecha.weekday()],
+            'reservable': fecha in libres,
+            'cerrado': fecha in libres and not jornadas,
+            'libres': total,
+            'disponible': total > 0,
+        })
+
+    return JsonResponse({
+        'servicio': servicio.id,
+        'anio': anio,
+        'mes': mes,
+        'dias': dias,
     })
 
 
@@ -437,32 +616,28 @@ def horarios_servicio(request, id, dia):
 # 10. CLIENTE – RESUMEN Y CONFIRMACIÓN DE CITA
 # ============================================================
 
-@login_required
-@cliente_required
-def resumen_cita(request, id, dia):
+def _resumen(request, id, fecha):
     """Resumen de cita antes de confirmarla"""
-    empresa = Empresa.objects.first()
+    empresa = request.empresa
     servicio = get_object_or_404(Servicio, id=id, empresa=empresa, activo=True)
     cliente = request.user.cliente
 
     hora_range = request.GET.get('hora')
     if not hora_range:
         messages.error(request, "Debes seleccionar un horario válido.")
-        return redirect('horarios_servicio', id=id, dia=dia)
+        return redirect('horarios_fecha', id=id, fecha=fecha)
 
     try:
         inicio_str, fin_str = [h.strip() for h in hora_range.split('-')]
     except ValueError:
         messages.error(request, "Formato de horario no válido.")
-        return redirect('horarios_servicio', id=id, dia=dia)
-
-    fecha = get_next_date_for_day(dia)
+        return redirect('horarios_fecha', id=id, fecha=fecha)
 
     return render(request, 'cliente/resumen_cita.html', {
         'servicio': servicio,
         'empresa': empresa,
         'cliente': cliente,
-        'dia': dia,
+        'dia': DIAS_ORDEN[fecha.weekday()],
         'fecha': fecha,
         'fecha_iso': fecha.strftime("%Y-%m-%d"),
         'hora_inicio': inicio_str,
@@ -470,19 +645,32 @@ def resumen_cita(request, id, dia):
     })
 
 
+@login_required
+@cliente_required
+def resumen_cita(request, id, dia):
+    """Resumen de cita para la próxima fecha del día de la semana"""
+    return _resumen(request, id, get_next_date_for_day(dia))
+
+
+@login_required
+@cliente_required
+def resumen_cita_fecha(request, id, fecha):
+    """Resumen de cita para una fecha concreta"""
+    return _resumen(request, id, fecha)
+
+
 @login_required
 @cliente_required
 def confirmar_cita(request):
-    """Crea la cita luego de validar solapamientos"""
+    """Crea la cita de forma atómica luego de validar solapamientos"""
     if request.method != 'POST':
         return redirect('dashboard_cliente')
 
-    empresa = Empresa.objects.first()
+    empresa = request.empresa
     cliente = request.user.cliente
 
     servicio_id = request.POST.get('servicio_id')
     fecha_str = request.POST.get('fecha')
-    dia = request.POST.get('dia')
     hora_inicio_str = request.POST.get('hora_inicio')
     hora_fin_str = request.POST.get('hora_fin')
 
@@ -490,32 +678,32 @@ def confirmar_cita(request):
 
     try:
         fecha = datetime.strptime(fecha_str, "%Y-%m-%d").date()
+    except Exception:
+        messages.error(request, "Los datos de la cita no son válidos.")
+        return redirect('detalle_servicio', id=servicio.id)
+
+    try:
         hora_inicio = datetime.strptime(hora_inicio_str, "%H:%M").time()
         hora_fin = datetime.strptime(hora_fin_str, "%H:%M").time()
     except Exception:
         messages.error(request, "Los datos de la cita no son válidos.")
-        return redirect('horarios_servicio', id=servicio.id, dia=dia)
-
-    citas_existentes = Cita.objects.filter(
-        empresa=empresa,
-        fecha=fecha
-    ).exclude(estado="cancelada")
-
-    for c in citas_existentes:
-        if hora_inicio < c.hora_fin and hora_fin > c.hora_inicio:
-            messages.error(request, "Ese horario ya no está disponible.")
-            return redirect('horarios_servicio', id=servicio.id, dia=dia)
-
-    Cita.objects.create(
-        cliente=cliente,
-        empresa=empresa,
-        servicio=servicio,
-        dia=dia,
-        fecha=fecha,
-        hora_inicio=hora_inicio,
-        hora_fin=hora_fin,
-        estado='pendiente',
-    )
+        return redirect('horarios_fecha', id=servicio.id, fecha=fecha)
+
+    if not fecha_reservable(fecha):
+        messages.error(request, "Esa fecha no está disponible para reservar.")
+        return redirect('detalle_servicio', id=servicio.id)
+
+    # El día de la semana sale de la fecha, no del formulario
+    dia = DIAS_ORDEN[fecha.weekday()]
+
+    try:
+        # El aviso se guarda en la misma transacción que la cita
+        with transaction.atomic():
+            cita = reservar_cita(cliente, empresa, servicio, dia, fecha, hora_inicio, hora_fin)
+            encolar([cita], 'reservada')
+    except HorarioNoDisponible:
+        messages.error(request, "Ese horario ya no está disponible.")
+        return redirect('horarios_fecha', id=servicio.id, fecha=fecha)
 
     messages.success(request, "Tu cita ha sido agendada correctamente.")
     return redirect('dashboard_cliente')
@@ -527,15 +715,19 @@ def confirmar_cita(request):
 
 @login_required
 @cliente_required
-def mis_citas(request):
+async def mis_citas(request):
     """Listado de citas futuras del cliente"""
     cliente = request.user.cliente
     hoy = date.today()
 
-    citas = Cita.objects.filter(
-        cliente=cliente,
-        fecha__gte=hoy
-    ).exclude(estado='cancelada').order_by('fecha', 'hora_inicio')
+    citas = [
+        cita async for cita in Cita.objects.filter(
+            cliente=cliente,
+            fecha__gte=hoy
+        ).exclude(estado='cancelada').select_related('servicio', 'empresa').only(
+            'fecha', 'hora_inicio', 'hora_fin', 'estado', 'servicio__nombre', 'empresa__nombre_negocio'
+        ).order_by('fecha', 'hora_inicio')
+    ]
 
     return render(request, 'cliente/mis_citas.html', {'citas': citas})
 
@@ -545,14 +737,19 @@ def mis_citas(request):
 def cancelar_cita(request, id):
     """Cancelación de cita por parte del cliente"""
     cliente = request.user.cliente
-    cita = get_object_or_404(Cita, id=id, cliente=cliente)
+    cita = get_object_or_404(Cita.objects.select_related('cliente__user', 'servicio', 'empresa'), id=id, cliente=cliente)
 
     if cita.estado == 'confirmada':
         messages.error(request, "No puedes cancelar una cita confirmada.")
         return redirect('mis_citas')
+    if cita.estado == 'vencida':
+        messages.error(request, "No puedes cancelar una cita que ya pasó.")
+        return redirect('mis_citas')
 
-    cita.estado = 'cancelada'
-    cita.save()
+    with transaction.atomic():
+        cita.estado = 'cancelada'
+        cita.save()
+        encolar([cita], 'cancelada')
 
     messages.success(request, "La cita fue cancelada correctamente.")
     return redirect('mis_citas')
@@ -659,7 +856,11 @@ def listar_citas_empresa(request):
 
     hoy = date.today()
 
-    citas = Cita.objects.filter(empresa=empresa).order_by("fecha", "hora_inicio")
+    citas = (
+        Cita.objects.filter(empresa=empresa)
+        .select_related("cliente__user", "servicio", "barbero")
+        .only("fecha", "hora_inicio", "hora_fin", "estado", "cliente__user__username", "servicio__nombre", "barbero__nombre")
+    )
 
     if filtro_fecha == "hoy":
         citas = citas.filter(fecha=hoy)
@@ -670,20 +871,40 @@ def listar_citas_empresa(request):
     elif filtro_fecha == "mes":
         citas = citas.filter(fecha__month=hoy.month, fecha__year=hoy.year)
 
-    if filtro_estado in ["pendiente", "confirmada", "cancelada"]:
+    if filtro_estado in ["pendiente", "confirmada", "cancelada", "vencida"]:
         citas = citas.filter(estado=filtro_estado)
 
-    if filtro_cliente:
+    cliente_seleccionado = None
+    if filtro_cliente and filtro_cliente.isdigit():
         citas = citas.filter(cliente_id=filtro_cliente)
+        cliente_seleccionado = (
+            Cliente.objects.select_related("user").only("user__username").filter(id=filtro_cliente).first()
+        )
 
-    clientes = Cliente.objects.order_by("user__username")
+    # Una página por clave (fecha, hora_inicio, id) en lugar de todo el historial
+    citas, cursor_anterior, cursor_siguiente = paginar_por_clave(
+        citas,
+        ("fecha", "hora_inicio", "id"),
+        despues=request.GET.get("despues"),
+        antes=request.GET.get("antes"),
+        tamano=CITAS_POR_PAGINA,
+    )
+
+    filtros = urlencode({
+        clave: valor
+        for clave, valor in (("fecha", filtro_fecha), ("estado", filtro_estado), ("cliente", filtro_cliente))
+        if valor
+    })
 
     return render(request, "empresa/citas/listar_citas.html", {
         "citas": citas,
-        "clientes": clientes,
+        "cliente_seleccionado": cliente_seleccionado,
         "filtro_fecha": filtro_fecha,
         "filtro_estado": filtro_estado,
         "filtro_cliente": filtro_cliente,
+        "filtros": filtros,
+        "cursor_anterior": cursor_anterior,
+        "cursor_siguiente": cursor_siguiente,
     })
 
 
@@ -691,14 +912,16 @@ def listar_citas_empresa(request):
 @empresa_required
 def confirmar_cita_empresa(request, id):
     empresa = request.user.empresa
-    cita = get_object_or_404(Cita, id=id, empresa=empresa)
+    cita = get_object_or_404(Cita.objects.select_related('cliente__user', 'servicio', 'empresa'), id=id, empresa=empresa)
 
-    if cita.estado != "pendiente":
+    if cita.estado not in TRANSICIONES['confirmar'][1]:
         messages.warning(request, "Esta cita no se puede confirmar.")
         return redirect('listar_citas')
 
-    cita.estado = "confirmada"
-    cita.save()
+    with transaction.atomic():
+        cita.estado = "confirmada"
+        cita.save()
+        encolar([cita], 'confirmada')
 
     messages.success(request, "La cita ha sido confirmada.")
     return redirect('listar_citas')
@@ -708,19 +931,95 @@ def confirmar_cita_empresa(request, id):
 @empresa_required
 def cancelar_cita_empresa(request, id):
     empresa = request.user.empresa
-    cita = get_object_or_404(Cita, id=id, empresa=empresa)
+    cita = get_object_or_404(Cita.objects.select_related('cliente__user', 'servicio', 'empresa'), id=id, empresa=empresa)
 
     if cita.estado == "cancelada":
         messages.info(request, "La cita ya estaba cancelada.")
         return redirect('listar_citas')
+    if cita.estado not in TRANSICIONES['cancelar'][1]:
+        messages.warning(request, "Esta cita no se puede cancelar.")
+        return redirect('listar_citas')
 
-    cita.estado = "cancelada"
-    cita.save()
+    with transaction.atomic():
+        cita.estado = "cancelada"
+        cita.save()
+        encolar([cita], 'cancelada')
 
     messages.success(request, "La cita ha sido cancelada.")
     return redirect('listar_citas')
 
 
+@login_required
+@empresa_required
+def acciones_citas_empresa(request):
+    """Confirma o cancela varias citas a la vez y devuelve el resultado de cada una (JSON)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido.'}, status=405)
+
+    accion = request.POST.get('accion')
+    if accion not in TRANSICIONES:
+        return JsonResponse({'error': 'Acción no válida.'}, status=400)
+
+    try:
+        ids = {int(valor) for valor in request.POST.getlist('ids')}
+    except ValueError:
+        return JsonResponse({'error': 'Citas no válidas.'}, status=400)
+    if not ids or len(ids) > MAX_CITAS_EN_BLOQUE:
+        return JsonResponse({'error': f"Selecciona entre 1 y {MAX_CITAS_EN_BLOQUE} citas."}, status=400)
+
+    resultados = cambiar_estado(request.user.empresa.id, ids, accion)
+
+    return JsonResponse({
+        'estado': TRANSICIONES[accion][0],
+        'resultados': {str(id): resultado for id, resultado in resultados.items()},
+    })
+
+
+@login_required
+@empresa_required
+async def eventos_citas_empresa(request):
+    """
+    Tablero en vivo (Server-Sent Events): citas nuevas, confirmadas y
+    canceladas de la empresa con los datos que muestra el panel, sin
+    consultas por evento. Al reconectar, el navegador manda Last-Event-ID
+    y se reenvía lo perdido; si ya no está en el historial se manda
+    'reiniciar' y la página se recarga.
+
+    Cada empresa tiene como mucho MAX_CONEXIONES_EMPRESA conexiones; las
+    que sobran reciben 429.
+    """
+    canal = eventos.canal_citas(request.user.empresa.id)
+    bus = eventos.obtener_bus()
+    if bus.suscriptores(canal) >= MAX_CONEXIONES_EMPRESA:
+        return HttpResponse(status=429)
+    desde = request.headers.get('Last-Event-ID')
+
+    async def flujo():
+        bucle = asyncio.get_running_loop()
+        fin = bucle.time() + DURACION_EVENTOS
+        try:
+            async with bus.suscribir(canal, desde=desde, maximo=MAX_CONEXIONES_EMPRESA) as suscripcion:
+                yield f"retry: {LATIDO_EVENTOS * 1000}\n\n"
+                while (restante := fin - bucle.time()) > 0:
+                    try:
+                        id, evento = await asyncio.wait_for(suscripcion.siguiente(), min(LATIDO_EVENTOS, restante))
+                    except asyncio.TimeoutError:
+                        yield ": latido\n\n"
+                        continue
+                    if evento == eventos.REINICIAR:
+                        yield _evento_sse(eventos.REINICIAR, {})
+                        return
+                    yield f"id: {id}\n" + _evento_sse(evento['tipo'], evento)
+        except eventos.DemasiadasSuscripciones:
+            # Otra conexión ocupó el último lugar entre la comprobación y aquí
+            yield f"retry: {DURACION_EVENTOS * 1000}\n\n"
+
+    respuesta = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+
 # ============================================================
 # 15. EMPRESA – CLIENTES
 # ============================================================
@@ -728,8 +1027,58 @@ def cancelar_cita_empresa(request, id):
 @login_required
 @empresa_required
 def listar_clientes(request):
-    clientes = Cliente.objects.select_related('user').order_by('user__username')
-    return render(request, 'empresa/clientes/listar_clientes.html', {'clientes': clientes})
+    """Directorio de clientes paginado por nombre de usuario, con búsqueda"""
+    texto = request.GET.get('q', '').strip()
+
+    clientes = Cliente.objects.select_related('user').only(
+        'telefono', 'user__username', 'user__email', 'user__is_active'
+    )
+    if texto:
+        clientes = clientes.filter(filtro_clientes(texto))
+
+    clientes, cursor_anterior, cursor_siguiente = paginar_por_clave(
+        clientes,
+        ('user__username', 'id'),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=CLIENTES_POR_PAGINA,
+    )
+
+    return render(request, 'empresa/clientes/listar_clientes.html', {
+        'clientes': clientes,
+        'clientes_total': contadores.clientes_total(),
+        'q': texto,
+        'filtros': urlencode({'q': texto}) if texto else '',
+        'cursor_anterior': cursor_anterior,
+        'cursor_siguiente': cursor_siguiente,
+    })
+
+
+@login_required
+@empresa_required
+def buscar_clientes(request):
+    """Búsqueda de clientes por prefijo de usuario, correo o teléfono (JSON)"""
+    texto = request.GET.get('q', '').strip()
+    if not texto:
+        return JsonResponse({'resultados': []})
+
+    clientes = (
+        Cliente.objects.filter(filtro_clientes(texto))
+        .order_by('user__username')
+        .values('id', 'user__username', 'user__email', 'telefono')[:MAX_RESULTADOS_BUSQUEDA]
+    )
+
+    return JsonResponse({
+        'resultados': [
+            {
+                'id': c['id'],
+                'username': c['user__username'],
+                'email': c['user__email'],
+                'telefono': c['telefono'],
+            }
+            for c in clientes
+        ]
+    })
 
 
 @login_required
@@ -792,10 +1141,11 @@ def eliminar_cliente_admin(request, id):
 @empresa_required
 def configurar_disponibilidad(request):
     """Configuración de horarios de disponibilidad de la empresa"""
-    ensure_disponibilidad_inicial()
-    dias = Disponibilidad.objects.all().order_by('id')
+    empresa = request.user.empresa
+    dias = ensure_disponibilidad_inicial(empresa)
 
     if request.method == 'POST':
+        cambiados = []
         for d in dias:
             ini_m = request.POST.get(f'inicio_m_{d.id}')
             fin_m = request.POST.get(f'fin_m_{d.id}')
@@ -807,14 +1157,140 @@ def configurar_disponibilidad(request):
                 messages.warning(request, f"Completa los horarios para {d.get_dia_display()}.")
                 return redirect('configurar_disponibilidad')
 
-            d.hora_inicio_m = ini_m or None
-            d.hora_fin_m = fin_m or None
-            d.hora_inicio_t = ini_t or None
-            d.hora_fin_t = fin_t or None
-            d.activo = activo
-            d.save()
+            try:
+                nuevos = (parse_hora(ini_m), parse_hora(fin_m), parse_hora(ini_t), parse_hora(fin_t), activo)
+            except ValueError:
+                messages.warning(request, f"Revisa el formato de los horarios de {d.get_dia_display()}.")
+                return redirect('configurar_disponibilidad')
+
+            actuales = (d.hora_inicio_m, d.hora_fin_m, d.hora_inicio_t, d.hora_fin_t, d.activo)
+            if nuevos != actuales:
+                d.hora_inicio_m, d.hora_fin_m, d.hora_inicio_t, d.hora_fin_t, d.activo = nuevos
+                cambiados.append(d)
+
+        # Un solo UPDATE con las filas que cambiaron
+        if cambiados:
+            with transaction.atomic():
+                Disponibilidad.objects.bulk_update(cambiados, CAMPOS_DISPONIBILIDAD)
+                # bulk_update no envía señales: se invalida cada día cambiado
+                for d in cambiados:
+                    transaction.on_commit(lambda dia=d.dia: invalidar_dia(empresa.id, dia))
+                transaction.on_commit(lambda: fragmentos.invalidar_semana(empresa.id))
 
         messages.success(request, "Disponibilidad actualizada correctamente.")
         return redirect('configurar_disponibilidad')
 
-    return render(request, 'empresa/disponibilidad.html', {'dias': dias})
+    excepciones = ExcepcionDisponibilidad.objects.filter(empresa=empresa, fecha_fin__gte=date.today())
+
+    return render(request, 'empresa/disponibilidad.html', {
+        'dias': dias,
+        'excepciones': excepciones,
+        'form_excepcion': ExcepcionDisponibilidadForm(),
+    })
+
+
+@login_required
+@empresa_required
+def crear_excepcion(request):
+    """Registra un cierre, horario extra o descanso en un rango de fechas"""
+    if request.method != 'POST':
+        return redirect('configurar_disponibilidad')
+
+    form = ExcepcionDisponibilidadForm(request.POST)
+    if form.is_valid():
+        excepcion = form.save(commit=False)
+        excepcion.empresa = request.user.empresa
+        excepcion.save()
+        messages.success(request, "Excepción registrada correctamente.")
+    else:
+        for errores in form.errors.values():
+            for error in errores:
+                messages.warning(request, error)
+
+    return redirect('configurar_disponibilidad')
+
+
+@login_required
+@empresa_required
+def eliminar_excepcion(request, id):
+    """Elimina una excepción de disponibilidad"""
+    excepcion = get_object_or_404(ExcepcionDisponibilidad, id=id, empresa=request.user.empresa)
+
+    if request.method == 'POST':
+        excepcion.delete()
+        messages.success(request, "Excepción eliminada.")
+
+    return redirect('configurar_disponibilidad')
+
+
+# ============================================================
+# 17. EMPRESA – BARBEROS
+# ============================================================
+
+@login_required
+@empresa_required
+def listar_barberos(request):
+    """Barberos de la empresa; cada uno atiende una cita a la vez"""
+    empresa = request.user.empresa
+
+    if request.method == 'POST':
+        form = BarberoForm(request.POST)
+        if form.is_valid():
+            barbero = form.save(commit=False)
+            barbero.empresa = empresa
+            barbero.save()
+            messages.success(request, "Barbero agregado correctamente.")
+            return redirect('listar_barberos')
+    else:
+        form = BarberoForm()
+
+    barberos = Barbero.objects.filter(empresa=empresa)
+    return render(request, 'empresa/barberos.html', {'barberos': barberos, 'form': form})
+
+
+@login_required
+@empresa_required
+def cambiar_estado_barbero(request, id):
+    """Activa o desactiva un barbero (deja de contar como silla libre)"""
+    barbero = get_object_or_404(Barbero, id=id, empresa=request.user.empresa)
+
+    if request.method == 'POST':
+        barbero.activo = not barbero.activo
+        barbero.save()
+        estado = "activado" if barbero.activo else "desactivado"
+        messages.success(request, f"Barbero {estado} correctamente.")
+
+    return redirect('listar_barberos')
+
+
+# ============================================================
+# 18. EMPRESA – REPORTES
+# ============================================================
+
+@login_required
+@empresa_required
+def reportes_empresa(request):
+    """Ingresos por servicio, ocupación y cancelaciones de un rango de fechas"""
+    empresa = request.user.empresa
+    hoy = date.today()
+
+    try:
+        desde = date.fromisoformat(request.GET.get('desde') or (hoy - timedelta(days=DIAS_REPORTE - 1)).isoformat())
+        hasta = date.fromisoformat(request.GET.get('hasta') or hoy.isoformat())
+    except ValueError:
+        messages.error(request, "Las fechas del reporte no son válidas.")
+        desde, hasta = hoy - timedelta(days=DIAS_REPORTE - 1), hoy
+
+    if desde > hasta or (hasta - desde).days >= MAX_DIAS_REPORTE:
+        messages.error(request, f"El rango del reporte debe ser de 1 a {MAX_DIAS_REPORTE} días.")
+        desde, hasta = hoy - timedelta(days=DIAS_REPORTE - 1), hoy
+
+    periodo = 'semana' if request.GET.get('periodo') == 'semana' else 'dia'
+
+    return render(request, 'empresa/reportes.html', {
+        'desde': desde,
+        'hasta': hasta,
+        'periodo': periodo,
+        **reporte(empresa, desde, hasta, periodo),
+    })
+
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.EmpresaActualMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,8 +59,16 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'core' / 'templates'],  
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Cada plantilla se compila una vez por proceso. Es lo que Django
+            # hace por defecto; se declara para no perderlo al tocar la lista.
+            # Con runserver el autoreload vacía la caché al editar una plantilla.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -75,13 +85,99 @@ WSGI_APPLICATION = 'miturno.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# Se configura por variables de entorno:
+#
+#   MITURNO_DB_ENGINE         'sqlite' (por defecto) o 'postgresql'
+#   MITURNO_DB_NAME           archivo de SQLite o nombre de la base
+#   MITURNO_DB_USER, MITURNO_DB_PASSWORD, MITURNO_DB_HOST, MITURNO_DB_PORT
+#   MITURNO_DB_CONN_MAX_AGE   segundos que se reutiliza cada conexión
+#                             (por defecto 60 en PostgreSQL, 0 en SQLite)
+#   MITURNO_DB_POOL           '1': pool de conexiones de psycopg (requiere
+#                             psycopg[pool]; sustituye a CONN_MAX_AGE)
+#   MITURNO_SQLITE_PRAGMAS    '0': desactiva WAL y synchronous=NORMAL
+#
+# PostgreSQL requiere psycopg (pip install "psycopg[binary,pool]").
+
+def _entorno(nombre, defecto=''):
+    return os.environ.get(f'MITURNO_DB_{nombre}', defecto)
+
+
+if _entorno('ENGINE', 'sqlite') == 'postgresql':
+    _pool = _entorno('POOL') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': _entorno('NAME', 'miturno'),
+            'USER': _entorno('USER'),
+            'PASSWORD': _entorno('PASSWORD'),
+            'HOST': _entorno('HOST', 'localhost'),
+            'PORT': _entorno('PORT', '5432'),
+            # Con pool la conexión vuelve al pool al terminar cada petición
+            'CONN_MAX_AGE': 0 if _pool else int(_entorno('CONN_MAX_AGE', '60')),
+            # Descarta las conexiones persistentes caídas antes de usarlas
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': True} if _pool else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': _entorno('NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(_entorno('CONN_MAX_AGE', '0')),
+            'OPTIONS': {
+                # BEGIN IMMEDIATE: la reserva de citas toma el bloqueo de escritura
+                # al abrir la transacción (ver core/reservas.py)
+                'transaction_mode': 'IMMEDIATE',
+                # busy_timeout: segundos que una escritura espera el bloqueo
+                # antes de fallar con "database is locked"
+                'timeout': 20,
+            },
+            # Base de pruebas en archivo: la memoria compartida de SQLite no
+            # respeta el timeout y las pruebas de concurrencia fallarían
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+    if os.environ.get('MITURNO_SQLITE_PRAGMAS', '1') != '0':
+        # Se aplican al abrir cada conexión. WAL: las lecturas no esperan a
+        # la escritura en curso; NORMAL: sin fsync en cada commit (con WAL
+        # sigue siendo consistente tras un corte de luz)
+        DATABASES['default']['OPTIONS']['init_command'] = (
+            'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+        )
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem por defecto; en producción se puede apuntar a Redis/Memcached
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'miturno',
     }
 }
 
+# Segundos que cada proceso recuerda la empresa resuelta por slug/host
+EMPRESA_CACHE_TTL = 60
+# Empresas que recuerda cada proceso como máximo
+EMPRESA_CACHE_MAX = 1000
+
+# Entrega de notificaciones de citas (ver core/notificaciones.py):
+# 'core.notificaciones.BackendConsola' o 'core.notificaciones.BackendArchivo'
+NOTIFICACIONES_BACKEND = 'core.notificaciones.BackendConsola'
+NOTIFICACIONES_ARCHIVO = BASE_DIR / 'notificaciones.log'
+
+# Pub/sub de los eventos en vivo (ver core/eventos.py). BusLocal solo
+# llega a las conexiones del mismo proceso: con varios workers ASGI hay
+# que usar un bus sobre un broker
+EVENTOS_BACKEND = 'core.eventos.BusLocal'
+
+# Días que una cita pasada sigue en la tabla de citas antes de archivarse
+# (ver core/mantenimiento.py)
+CITAS_DIAS_ARCHIVO = 365
+
 LOGIN_URL = '/login/cliente/'  # o /login/empresa/ según el caso
 
 